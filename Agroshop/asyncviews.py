@@ -0,0 +1,97 @@
+# Agroshop/asyncviews.py - Async versions of hot read endpoints for the ASGI deployment
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import classonlymethod
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import exceptions, permissions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from users.authentication import ClaimsJWTAuthentication
+
+
+class AsyncAPIView(View):
+    """
+    GET-only async view mirroring a DRF view (sync_view): same JWT
+    authentication, permission classes and JSON body, but the cache and ORM
+    are awaited, so under ASGI a request only occupies a thread while one of
+    its queries runs. Other methods are handed to sync_view.
+    """
+    sync_view = None
+    authentication_class = ClaimsJWTAuthentication
+    permission_classes = [permissions.AllowAny]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True  # as DRF views are; auth is by bearer token
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(self.sync_view.as_view())(request, *args, **kwargs)
+        try:
+            self.request = await self.initial(request)
+            response = await self.get(self.request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            response = self.handle_exception(exc)
+        return response
+
+    async def initial(self, request):
+        """Authenticate and check permissions; returns a DRF Request for the handler"""
+        authenticator = self.authentication_class()
+        self.authenticator = authenticator
+        result = await authenticator.aauthenticate(request)
+        drf_request = Request(request, authenticators=[authenticator])
+        drf_request.user, drf_request.auth = result if result is not None else (AnonymousUser(), None)
+        for permission in [permission_class() for permission_class in self.permission_classes]:
+            if not permission.has_permission(drf_request, self):
+                if result is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+        return drf_request
+
+    def handle_exception(self, exc):
+        # Same body as DRF's default exception handler
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = self.render(data, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = self.authenticator.authenticate_header(self.request)
+        return response
+
+    @staticmethod
+    def render(data, status=200):
+        """JSON response with the same bytes DRF's JSONRenderer produces"""
+        response = HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+        response['Vary'] = 'Accept'
+        return response
+
+    async def conditional(self, request, build, etag=None, last_modified=None):
+        """
+        What django.views.decorators.http.condition does, for validators that
+        were computed asynchronously: 304 when the client's copy is current,
+        otherwise await build() and set ETag / Last-Modified on it.
+        """
+        etag = quote_etag(etag) if etag is not None else None
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = await build()
+            if timestamp and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(timestamp)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+        return response
+
+
+def async_or_sync_view(async_view_class, **initkwargs):
+    """
+    The async view under the ASGI deployment (ASYNC_VIEWS), otherwise the
+    DRF view it mirrors, which WSGI workers run without an event loop.
+    """
+    if settings.ASYNC_VIEWS:
+        return async_view_class.as_view(**initkwargs)
+    return async_view_class.sync_view.as_view(**initkwargs)
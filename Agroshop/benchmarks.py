@@ -0,0 +1,75 @@
+# Agroshop/benchmarks.py - Timing helpers shared by the benchmark management commands
+import statistics
+import time
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, teardown_databases, setup_test_environment, teardown_test_environment,
+)
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .instrumentation import summarize
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run inside a throwaway test database (test_<NAME>), so seeding never
+    touches real data. Also allows the test client's 'testserver' host.
+    """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return {}
+    summary = summarize([sample * 1000 for sample in samples])
+    return {'runs': len(samples), **{f'{name}_ms': value for name, value in summary.items()}}
+
+
+def query_summary(counts):
+    if not counts:
+        return {}
+    return {'min': min(counts), 'mean': round(statistics.mean(counts), 1), 'max': max(counts)}
+
+
+def measure(request, runs, expect=(200,)):
+    """
+    Time request(run_index) `runs` times, counting the SQL queries each call
+    makes. request returns a test client response whose status must be in
+    expect. Returns the latency percentiles plus a 'queries' summary.
+    """
+    samples, counts = [], []
+    for index in range(runs):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request(index)
+            samples.append(time.perf_counter() - started)
+        assert response.status_code in expect, (response.status_code, getattr(response, 'data', None))
+        counts.append(len(queries))
+    result = percentiles(samples)
+    result['queries'] = query_summary(counts)
+    return result
+
+
+def bearer_client(user):
+    """API client that authenticates with a real JWT, so auth cost is part of every request"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
@@ -0,0 +1,34 @@
+# Agroshop/cache.py - Version counters behind the apps' versioned cache keys
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Current value of the version counter at key, starting it at 1"""
+    version = cache.get(key)
+    if version is None:
+        # add() so concurrent workers don't reset a counter someone else bumped
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(key):
+    """
+    Increment the version counter at key. Entries cached under the old version
+    are never read again and simply age out through TTL / LRU eviction.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key was evicted or never set
+        cache.add(key, 1, timeout=None)
+        return cache.incr(key)
+
+
+async def aget_version(key):
+    """get_version() for async views"""
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, 1, timeout=None)
+        version = await cache.aget(key, 1)
+    return version
@@ -0,0 +1,303 @@
+# Agroshop/instrumentation.py - Per-request SQL/serializer/latency metrics, Server-Timing and per-endpoint stats
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class RequestMetrics:
+    """
+    What one request spent: SQL (as a connection execute wrapper), building
+    serializer data (serializer.data, less the SQL it ran), JSON encoding of
+    DRF responses (render) and in total
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            # Parameters aren't part of sql, so a loop of lookups repeats the same text
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+def _histogram(values, buckets):
+    counts = {f'<={bound}': 0 for bound in buckets}
+    counts[f'>{buckets[-1]}'] = 0
+    for value in values:
+        for bound in buckets:
+            if value <= bound:
+                counts[f'<={bound}'] += 1
+                break
+        else:
+            counts[f'>{buckets[-1]}'] += 1
+    return counts
+
+
+def summarize(values, digits=2):
+    """Mean, p50/p95/p99 and max of values, rounded; shared with the benchmark commands"""
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], digits)
+
+    return {
+        'mean': round(sum(ordered) / len(ordered), digits),
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': round(ordered[-1], digits),
+    }
+
+
+class EndpointStats:
+    """
+    Rolling window of recent request samples per URL name, kept in process
+    memory. With several worker processes each reports its own traffic.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+
+    def record(self, endpoint, latency_ms, queries, sql_ms, serialize_ms, render_ms, size, over_budget):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+                self._totals[endpoint] = {'requests': 0, 'over_budget': 0}
+            samples.append((latency_ms, queries, sql_ms, serialize_ms, render_ms, size))
+            self._totals[endpoint]['requests'] += 1
+            self._totals[endpoint]['over_budget'] += int(over_budget)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+    def snapshot(self):
+        with self._lock:
+            samples = {endpoint: list(rows) for endpoint, rows in self._samples.items()}
+            totals = {endpoint: dict(counts) for endpoint, counts in self._totals.items()}
+
+        endpoints = {}
+        for endpoint, rows in sorted(samples.items()):
+            latency, queries, sql, serialize, render, sizes = zip(*rows)
+            sizes = [size for size in sizes if size is not None]
+            endpoints[endpoint] = {
+                **totals[endpoint],
+                'window': len(rows),
+                'latency_ms': {**summarize(latency), 'histogram': _histogram(latency, LATENCY_BUCKETS_MS)},
+                'queries': {**summarize(queries, digits=1), 'histogram': _histogram(queries, QUERY_BUCKETS)},
+                'sql_ms': summarize(sql),
+                'serialize_ms': summarize(serialize),
+                'render_ms': summarize(render),
+                'response_bytes': summarize(sizes, digits=0),
+            }
+        return endpoints
+
+
+request_stats = EndpointStats(window=getattr(settings, 'REQUEST_METRICS_WINDOW', 500))
+
+# Metrics of the request being handled. Queries are recorded by a wrapper
+# every connection gets (_record_query) rather than one installed on the
+# request thread's connection: under ASGI the ORM runs on worker threads with
+# their own connections, and sync_to_async copies this context to them.
+_active_metrics = ContextVar('request_metrics', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _active_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # First, not last: connections open mid-request, and execute_wrapper()
+    # blocks elsewhere pop the last wrapper when they exit
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+_serializer_data = BaseSerializer.data
+
+
+def _timed_serializer_data(serializer):
+    """
+    BaseSerializer.data, adding the time spent to the request's metrics.
+    Serializer and ListSerializer build their data through it; nested
+    serializers are only counted once, and queries they trigger (lazy
+    relations) stay in the SQL time.
+    """
+    metrics = _active_metrics.get()
+    if metrics is None or metrics.serializing:
+        return _serializer_data.fget(serializer)
+    metrics.serializing = True
+    started, sql_before = time.perf_counter(), metrics.sql_time
+    try:
+        return _serializer_data.fget(serializer)
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - started - (metrics.sql_time - sql_before)
+
+
+BaseSerializer.data = property(_timed_serializer_data)
+
+
+class RequestMetricsMiddleware:
+    """
+    Count and time every SQL query a request runs, time serializer.data and
+    the JSON encoding of DRF responses, and record the totals under the
+    resolved URL name. Adds a Server-Timing header and logs requests that
+    run more queries than REQUEST_QUERY_BUDGET, so N+1 regressions show up
+    in production logs. Works under WSGI and ASGI without forcing async
+    views onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REQUEST_METRICS_ENABLED:
+            return self.get_response(request)
+
+        # Connections opened before this module was imported lack the recorder
+        install_query_recorder(None, connection)
+        metrics = request._metrics = RequestMetrics()
+        token = _active_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _active_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return await self.get_response(request)
+
+        metrics = request._metrics = RequestMetrics()
+        token = _active_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _active_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        """Record the request's totals, log budget overruns and add Server-Timing"""
+        total = time.perf_counter() - metrics.started
+
+        endpoint = self.endpoint_name(request)
+        budget = settings.REQUEST_QUERY_BUDGET
+        over_budget = bool(budget) and metrics.queries > budget
+        if over_budget:
+            statement, repeats = metrics.most_repeated()
+            logger.warning(
+                f"{endpoint} ran {metrics.queries} queries (budget {budget}) for "
+                f"{request.method} {request.path}; most repeated ({repeats}x): {statement[:300]}"
+            )
+
+        size = None if response.streaming else len(response.content)
+        request_stats.record(
+            endpoint,
+            latency_ms=total * 1000,
+            queries=metrics.queries,
+            sql_ms=metrics.sql_time * 1000,
+            serialize_ms=metrics.serialize_time * 1000,
+            render_ms=metrics.render_time * 1000,
+            size=size,
+            over_budget=over_budget,
+        )
+
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            app_time = max(total - metrics.sql_time - metrics.serialize_time - metrics.render_time, 0)
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'serialize;dur={metrics.serialize_time * 1000:.1f}',
+                f'render;dur={metrics.render_time * 1000:.1f};desc="JSON encoding"',
+                f'app;dur={app_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered (serialized to JSON) after the view returns
+        metrics = getattr(request, '_metrics', None)
+        if metrics is not None:
+            render = response.render
+
+            def timed_render():
+                started = time.perf_counter()
+                try:
+                    return render()
+                finally:
+                    metrics.render_time += time.perf_counter() - started
+
+            response.render = timed_render
+        return response
+
+    @staticmethod
+    def endpoint_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unresolved>'
+        return match.view_name or match._func_path
+
+
+class RequestStatsView(APIView):
+    """Admin-only rolling per-endpoint request stats for this process; DELETE resets them"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'query_budget': settings.REQUEST_QUERY_BUDGET,
+            'window': request_stats.window,
+            'endpoints': request_stats.snapshot(),
+        })
+
+    def delete(self, request):
+        request_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+from Agroshop.benchmarks import percentiles
+from orders.benchmarks import seed_storefront
+from orders.models import Order
+
+SERVERS = ('gunicorn', 'uvicorn')
+ENDPOINTS = ('product_list', 'product_detail', 'cart', 'order_detail')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers):
+    if server == 'gunicorn':
+        # Sync workers, as deployed: one request at a time per process
+        return [
+            sys.executable, '-m', 'gunicorn', 'Agroshop.wsgi:application',
+            '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--backlog', '2048',
+            '--timeout', '120', '--log-level', 'warning',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'Agroshop.asgi:application',
+        '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port), '--backlog', '2048',
+        '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+async def fetch(port, path, token, slow_client):
+    """
+    One GET on its own connection. The request head is sent in two parts
+    slow_client seconds apart, like a client on a slow link, so the server
+    holds the connection open meanwhile. Returns the status code.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        head = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+        if token:
+            head += f'Authorization: Bearer {token}\r\n'
+        writer.write(head.encode())
+        await writer.drain()
+        if slow_client:
+            await asyncio.sleep(slow_client)
+        writer.write(b'\r\n')
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def run_load(port, requests, concurrency, slow_client, timeout):
+    """Send requests (endpoint, path, token) from `concurrency` clients at once"""
+    pending = iter(requests)
+    samples = {endpoint: [] for endpoint in ENDPOINTS}
+    statuses = Counter()
+
+    async def client():
+        for endpoint, path, token in pending:
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(port, path, token, slow_client), timeout)
+            except (OSError, IndexError, ValueError, asyncio.TimeoutError) as exc:
+                statuses[type(exc).__name__] += 1
+                continue
+            statuses[status] += 1
+            if status == 200:
+                samples[endpoint].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, statuses, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare gunicorn sync workers with the ASGI deployment (uvicorn, async read "
+        "views) on the catalog, cart and order detail endpoints at high client "
+        "concurrency, and report throughput and latency percentiles as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database-url',
+                            help='Empty database to seed (default: a temporary SQLite file)')
+        parser.add_argument('--server', action='append', choices=SERVERS,
+                            help='Only run these servers (repeatable; default: both)')
+        parser.add_argument('--workers', type=int, default=2, help='Server processes')
+        parser.add_argument('--concurrency', type=int, default=500, help='Clients connected at once')
+        parser.add_argument('--requests', type=int, default=5000, help='Timed requests per server')
+        parser.add_argument('--warmup', type=int, default=200, help='Untimed requests per server')
+        parser.add_argument('--slow-client-ms', type=int, default=0,
+                            help='Delay between the request head and its final line, per request '
+                                 '(time spent queued for a busy server overlaps it)')
+        parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--orders-per-customer', type=int, default=10)
+        parser.add_argument('--output', help='Also write the JSON results to this file')
+        # Internal: seed the configured database and print tokens and ids
+        parser.add_argument('--prepare', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['prepare']:
+            return self.prepare(options)
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+        servers = options['server'] or SERVERS
+
+        with tempfile.TemporaryDirectory() as workdir:
+            environment = dict(os.environ)
+            environment['DATABASE_URL'] = options['database_url'] or f'sqlite:///{workdir}/bench.sqlite3'
+            fixture = self.seed(environment, options)
+            results = {}
+            for server in servers:
+                self.stderr.write(f"Running {server} with {options['workers']} workers...")
+                results[server] = self.bench_server(server, environment, fixture, options)
+
+        report = {
+            'config': {key: options[key] for key in (
+                'workers', 'concurrency', 'requests', 'warmup', 'slow_client_ms', 'products', 'customers',
+                'orders_per_customer',
+            )},
+            'environment': {
+                'database': 'sqlite' if not options['database_url'] else options['database_url'].split(':', 1)[0],
+                'cache': settings.CACHES['default']['BACKEND'],
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        self.stdout.write(output)
+
+    def seed(self, environment, options):
+        """Migrate and seed in a child process pointed at the benchmark database"""
+        manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+        self.stderr.write('Migrating the benchmark database...')
+        subprocess.run(manage + ['migrate', '--noinput', '-v', '0'], env=environment, check=True)
+        self.stderr.write(f"Seeding {options['products']} products and {options['customers']} customers...")
+        prepared = subprocess.run(manage + [
+            'benchmark_servers', '--prepare', '--products', str(options['products']),
+            '--customers', str(options['customers']), '--orders-per-customer', str(options['orders_per_customer']),
+        ], env=environment, check=True, capture_output=True, text=True)
+        return json.loads(prepared.stdout)
+
+    def prepare(self, options):
+        if get_user_model().objects.exists():
+            raise CommandError('benchmark_servers seeds its own data and needs an empty database')
+        data = seed_storefront(
+            products=options['products'], customers=options['customers'],
+            orders_per_customer=options['orders_per_customer'],
+        )
+        customers = []
+        for customer in data['customers']:
+            customers.append({
+                'token': str(RefreshToken.for_user(customer).access_token),
+                'orders': [str(uuid) for uuid in Order.objects.filter(customer=customer).values_list('uuid', flat=True)],
+            })
+        self.stdout.write(json.dumps({
+            'products': [product.pk for product in data['products']],
+            'customers': customers,
+        }))
+
+    def requests(self, fixture, count):
+        """The four endpoints in turn, over different products and customers"""
+        products = itertools.cycle(fixture['products'])
+        customers = itertools.cycle(fixture['customers'])
+        for index in range(count):
+            endpoint = ENDPOINTS[index % len(ENDPOINTS)]
+            if endpoint == 'product_list':
+                yield endpoint, '/products/public/?page_size=20', None
+            elif endpoint == 'product_detail':
+                yield endpoint, f'/products/public/{next(products)}/', None
+            else:
+                customer = next(customers)
+                if endpoint == 'cart':
+                    yield endpoint, '/cart/', customer['token']
+                else:
+                    yield endpoint, f"/orders/{customer['orders'][index % len(customer['orders'])]}/", customer['token']
+
+    def bench_server(self, server, environment, fixture, options):
+        port = free_port()
+        # The ASGI deployment serves the hot reads with the async views
+        environment = dict(environment, ASYNC_VIEWS='true' if server == 'uvicorn' else 'false')
+        process = subprocess.Popen(
+            server_command(server, port, options['workers']), cwd=settings.BASE_DIR, env=environment,
+        )
+        try:
+            self.wait_until_ready(process, port)
+            slow_client = options['slow_client_ms'] / 1000
+            asyncio.run(run_load(
+                port, self.requests(fixture, options['warmup']), options['concurrency'], slow_client, options['timeout'],
+            ))
+            samples, statuses, elapsed = asyncio.run(run_load(
+                port, self.requests(fixture, options['requests']), options['concurrency'], slow_client,
+                options['timeout'],
+            ))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+        completed = sum(len(endpoint_samples) for endpoint_samples in samples.values())
+        return {
+            'requests_per_sec': round(completed / elapsed, 1),
+            'errors': options['requests'] - completed,
+            'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            'all': percentiles([sample for endpoint_samples in samples.values() for sample in endpoint_samples]),
+            'endpoints': {endpoint: percentiles(endpoint_samples) for endpoint, endpoint_samples in samples.items()},
+        }
+
+    def wait_until_ready(self, process, port, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with status {process.returncode}')
+            try:
+                if asyncio.run(fetch(port, '/products/public/', None, 0)) == 200:
+                    return
+            except (OSError, IndexError):
+                pass
+            time.sleep(0.25)
+        raise CommandError(f'Server did not answer on port {port} within {timeout}s')
@@ -39,11 +39,13 @@ INSTALLED_APPS = [
     'cart',
     'checkout',
     'orders',
+    'Agroshop',  # project-wide management commands
 ]
 
 # Middleware
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Move this to the very top
+    'Agroshop.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,6 +56,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Serve the hot read endpoints with async views; only for the ASGI deployment
+# (e.g. ASYNC_VIEWS=true uvicorn Agroshop.asgi:application).
+# When it's on, static files go through the ASGI static handler instead of
+# WhiteNoise's middleware, which is sync-only and would push every ASGI
+# request onto a thread.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+if ASYNC_VIEWS:
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 # URL configuration
 ROOT_URLCONF = 'Agroshop.urls'
 
@@ -94,6 +105,49 @@ else:
         }
     }
 
+# SQLite (local runs): tests use a file rather than the shared in-memory
+# database, and transactions take the write lock up front, so the threaded
+# concurrency tests wait for locks instead of failing with "table is locked"
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', str(BASE_DIR / 'test_db.sqlite3'))
+    DATABASES['default'].setdefault('OPTIONS', {}).update({'timeout': 30, 'transaction_mode': 'IMMEDIATE'})
+
+# Cache - Redis in production (REDIS_URL), local memory otherwise.
+# Entries expire after TIMEOUT; when full, the least recently used are culled.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'agroshop',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000,
+            },
+        }
+    }
+
+# Public catalog cache TTL (seconds). Writes invalidate it through signals.
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=300)
+
+# Vendor analytics cache TTL (seconds). New order items invalidate it per vendor.
+VENDOR_ANALYTICS_CACHE_TIMEOUT = env.int('VENDOR_ANALYTICS_CACHE_TIMEOUT', default=600)
+
+# Per-request SQL, serializer and latency metrics (Agroshop.instrumentation). Requests running
+# more than REQUEST_QUERY_BUDGET queries are logged (0 disables the check); stats for
+# the last REQUEST_METRICS_WINDOW requests per endpoint are served at /api/stats/requests/.
+REQUEST_METRICS_ENABLED = env.bool('REQUEST_METRICS_ENABLED', default=True)
+REQUEST_METRICS_SERVER_TIMING = env.bool('REQUEST_METRICS_SERVER_TIMING', default=True)
+REQUEST_QUERY_BUDGET = env.int('REQUEST_QUERY_BUDGET', default=30)
+REQUEST_METRICS_WINDOW = env.int('REQUEST_METRICS_WINDOW', default=500)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -110,6 +164,43 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing profile for new hashes: 'scrypt' (memory-hard, parameters
+# below), 'pbkdf2' (Django's default) or 'argon2' (needs argon2-cffi
+# installed). Hashes from the other hashers still verify and are rehashed
+# with the profile's hasher on the next login.
+PASSWORD_HASH_PROFILE = env('PASSWORD_HASH_PROFILE', default='scrypt')
+PASSWORD_HASHER_PROFILES = {
+    'scrypt': 'users.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASH_PROFILE]] + [
+    hasher for profile, hasher in PASSWORD_HASHER_PROFILES.items() if profile != PASSWORD_HASH_PROFILE
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+# scrypt cost: N (work factor), r (block size), p (parallelism). The default
+# N=2**14, r=8, p=1 (16 MiB per hash) measured ~65 ms per hash against
+# ~286 ms for Django's p=5, so a core serves ~15 logins/s instead of ~3.5;
+# compare options with `manage.py benchmark_password_hashing`.
+PASSWORD_SCRYPT_WORK_FACTOR = env.int('PASSWORD_SCRYPT_WORK_FACTOR', default=2 ** 14)
+PASSWORD_SCRYPT_BLOCK_SIZE = env.int('PASSWORD_SCRYPT_BLOCK_SIZE', default=8)
+PASSWORD_SCRYPT_PARALLELISM = env.int('PASSWORD_SCRYPT_PARALLELISM', default=1)
+
+AUTHENTICATION_BACKENDS = ['users.backends.BoundedHashModelBackend']
+# Threads per process that run login password hashes (0 = hash on the request
+# thread), how many more logins may queue for them, and how long (seconds) a
+# login waits for a place before getting 503
+LOGIN_HASH_WORKERS = env.int('LOGIN_HASH_WORKERS', default=0)
+LOGIN_HASH_QUEUE = env.int('LOGIN_HASH_QUEUE', default=16)
+LOGIN_HASH_WAIT = env.float('LOGIN_HASH_WAIT', default=5)
+# Logins in flight at once per client IP / per email (0 = unlimited); the
+# counters expire after LOGIN_INFLIGHT_TIMEOUT seconds. The per-IP limit is
+# off by default: the client IP is read like DRF's throttles, so behind a
+# proxy it needs REST_FRAMEWORK['NUM_PROXIES'] set (otherwise X-Forwarded-For
+# is trusted as sent), and it would throttle users sharing a NAT address.
+LOGIN_MAX_CONCURRENT_PER_IP = env.int('LOGIN_MAX_CONCURRENT_PER_IP', default=0)
+LOGIN_MAX_CONCURRENT_PER_EMAIL = env.int('LOGIN_MAX_CONCURRENT_PER_EMAIL', default=2)
+LOGIN_INFLIGHT_TIMEOUT = env.int('LOGIN_INFLIGHT_TIMEOUT', default=30)
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -186,7 +277,7 @@ CORS_ALLOW_METHODS = [
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ],
 }
 
@@ -198,6 +289,15 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+# Seconds a user's role/active flags are cached for JWT authentication.
+# Saving the user invalidates it; this bounds QuerySet.update() changes.
+# Invalidation and access-token revocation (logout) only reach every worker
+# through a shared cache (REDIS_URL). With the per-process local-memory cache
+# other workers see status changes once this expires, hence the short default,
+# and keep accepting a revoked access token until it expires.
+AUTH_USER_STATUS_CACHE_TIMEOUT = env.int(
+    'AUTH_USER_STATUS_CACHE_TIMEOUT', default=60 if os.environ.get('REDIS_URL') else 5
+)
 
 # M-Pesa settings
 MPESA_CONSUMER_KEY = env('MPESA_CONSUMER_KEY', default='')
@@ -207,3 +307,15 @@ MPESA_PASSKEY = env('MPESA_PASSKEY', default='')
 MPESA_CALLBACK_URL = env('MPESA_CALLBACK_URL', default='https://yourdomain.com/mpesa/callback/')
 MPESA_ACCESS_TOKEN_URL = env('MPESA_ACCESS_TOKEN_URL', default='https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials')
 MPESA_STK_PUSH_URL = env('MPESA_STK_PUSH_URL', default='https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest')
+# Daraja HTTP client: timeouts in seconds, keep-alive pool size per process
+MPESA_CONNECT_TIMEOUT = env.float('MPESA_CONNECT_TIMEOUT', default=3.05)
+MPESA_READ_TIMEOUT = env.float('MPESA_READ_TIMEOUT', default=15)
+MPESA_POOL_SIZE = env.int('MPESA_POOL_SIZE', default=10)
+# Store callbacks in the inbox and let `manage.py process_mpesa_callbacks` apply them.
+# Only turn this on where that command runs as a long-lived worker process;
+# without one, queued payments never become orders.
+MPESA_CALLBACK_ASYNC = env.bool('MPESA_CALLBACK_ASYNC', default=False)
+
+# Minutes stock stays reserved for an unpaid checkout before the sweeper
+# (`manage.py release_expired_reservations`) returns it
+STOCK_RESERVATION_MINUTES = env.int('STOCK_RESERVATION_MINUTES', default=15)
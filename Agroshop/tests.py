@@ -0,0 +1,210 @@
+import time
+from decimal import Decimal
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import path
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from cart.models import Cart, CartItem
+from cart.views import AsyncCartView, CartView
+from orders.models import Order, OrderItem
+from orders.views import AsyncOrderDetailView
+from products.models import Products
+from products.views import AsyncPublicProductDetailView, AsyncPublicProductListView
+from users.models import CustomUser
+from .asyncviews import async_or_sync_view
+from .instrumentation import RequestMetrics, _active_metrics, request_stats
+
+# The async views whatever ASYNC_VIEWS is set to (AsyncViewTests' urlconf)
+urlpatterns = [
+    path('products/public/', AsyncPublicProductListView.as_view()),
+    path('products/public/<int:pk>/', AsyncPublicProductDetailView.as_view()),
+    path('cart/', AsyncCartView.as_view()),
+    path('orders/<uuid:order_uuid>/', AsyncOrderDetailView.as_view()),
+]
+
+
+def server_timing(response):
+    """Server-Timing as {metric: (duration_ms, description)}"""
+    timings = {}
+    for part in response['Server-Timing'].split(', '):
+        name, duration, *description = part.split(';')
+        timings[name] = (float(duration.split('=')[1]), description[0][6:-1] if description else None)
+    return timings
+
+
+class SlowSerializer(serializers.Serializer):
+    title = serializers.SerializerMethodField()
+
+    def get_title(self, product):
+        time.sleep(0.02)
+        # A lazy query while serializing counts as SQL, not serializer time
+        return Products.objects.get(pk=product.pk).title
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        request_stats.reset()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'pass-12345')
+        for i in range(3):
+            Products.objects.create(title=f'Product {i}', description='Seeded', price=5, stock=10, vendor=self.vendor)
+        self.client = APIClient()
+
+    def bearer_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_server_timing_header(self):
+        timings = server_timing(self.client.get('/products/public/'))
+        self.assertEqual(set(timings), {'db', 'serialize', 'render', 'app', 'total'})
+        self.assertEqual(timings['db'][1], '1 queries')
+        parts = sum(timings[name][0] for name in ('db', 'serialize', 'render', 'app'))
+        self.assertAlmostEqual(parts, timings['total'][0], delta=0.5)
+        # Served from the catalog cache
+        self.assertEqual(server_timing(self.client.get('/products/public/'))['db'][1], '0 queries')
+
+    def test_serializer_time_excludes_its_queries(self):
+        metrics = RequestMetrics()
+        token = _active_metrics.set(metrics)
+        try:
+            # The list, a lookup per item, the single product and its lookup
+            with self.assertNumQueries(5):
+                SlowSerializer(Products.objects.all()[:2], many=True).data
+                SlowSerializer(Products.objects.first()).data
+        finally:
+            _active_metrics.reset(token)
+        self.assertEqual(metrics.queries, 5)
+        self.assertGreaterEqual(metrics.serialize_time, 0.06)
+        self.assertLess(metrics.serialize_time, 0.06 + 0.05)
+        self.assertGreater(metrics.sql_time, 0)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertFalse(self.client.get('/products/public/').has_header('Server-Timing'))
+
+    @override_settings(REQUEST_QUERY_BUDGET=1)
+    def test_over_budget_is_logged_and_counted(self):
+        client = self.bearer_client(self.vendor)
+        with self.assertLogs('Agroshop.instrumentation', 'WARNING') as logs:
+            client.get('/products/view/')
+        self.assertIn('products-List ran 2 queries (budget 1)', logs.output[0])
+        self.assertIn('most repeated (1x)', logs.output[0])
+        stats = request_stats.snapshot()['products-List']
+        self.assertEqual((stats['requests'], stats['over_budget']), (1, 1))
+
+    def test_stats_view(self):
+        for _ in range(3):
+            cache.clear()
+            self.client.get('/products/public/')
+        client = self.bearer_client(self.admin)
+        data = client.get('/api/stats/requests/').json()
+        stats = data['endpoints']['public-products-list']
+        self.assertEqual((stats['requests'], stats['over_budget'], stats['window']), (3, 0, 3))
+        self.assertEqual((stats['queries']['p50'], stats['queries']['max']), (1, 1))
+        self.assertEqual(sum(stats['queries']['histogram'].values()), 3)
+        self.assertEqual(
+            set(stats), {'requests', 'over_budget', 'window', 'latency_ms', 'queries', 'sql_ms', 'serialize_ms',
+                         'render_ms', 'response_bytes'}
+        )
+
+        self.assertEqual(client.delete('/api/stats/requests/').status_code, 204)
+        self.assertNotIn('public-products-list', client.get('/api/stats/requests/').json()['endpoints'])
+
+    def test_stats_view_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/stats/requests/').status_code, 401)
+        self.assertEqual(self.bearer_client(self.vendor).get('/api/stats/requests/').status_code, 403)
+        self.assertEqual(self.bearer_client(self.vendor).delete('/api/stats/requests/').status_code, 403)
+
+
+@override_settings(ROOT_URLCONF='Agroshop.tests')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.customer = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.stranger = CustomUser.objects.create_user('stranger@example.com', 'pass-12345', 'Sam', 'Stranger')
+        self.product = Products.objects.create(title='Maize', description='Seeded', price=5, stock=10, vendor=self.vendor)
+        self.cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.order = Order.objects.create(customer=self.customer, total_price=Decimal('10'), status='PAID')
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2, unit_price=5, subtotal=10, vendor=self.vendor,
+        )
+        # Minted here: issuing a token writes to the database, which async tests can't do directly
+        self.tokens = {
+            user.pk: {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+            for user in (self.vendor, self.customer, self.stranger)
+        }
+
+    def auth(self, user):
+        return self.tokens[user.pk]
+
+    async def test_product_list_and_detail(self):
+        response = await self.async_client.get('/products/public/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['title'] for row in response.json()], ['Maize'])
+        # A second request is served from the cache without a thread
+        self.assertEqual((await self.async_client.get('/products/public/')).json(), response.json())
+
+        response = await self.async_client.get(f'/products/public/{self.product.pk}/')
+        self.assertEqual(response.json()['title'], 'Maize')
+        revalidated = await self.async_client.get(
+            f'/products/public/{self.product.pk}/', headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual((await self.async_client.get('/products/public/999999/')).status_code, 404)
+
+    async def test_cart_requires_a_customer(self):
+        response = await self.async_client.get('/cart/')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.has_header('WWW-Authenticate'))
+        response = await self.async_client.get('/cart/', headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual((await self.async_client.get('/cart/', headers=self.auth(self.vendor))).status_code, 403)
+
+    async def test_cart_revalidation(self):
+        headers = self.auth(self.customer)
+        response = await self.async_client.get('/cart/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_items'], 2)
+        for validator in ({'If-None-Match': response['ETag']}, {'If-Modified-Since': response['Last-Modified']}):
+            revalidated = await self.async_client.get('/cart/', headers={**headers, **validator})
+            self.assertEqual(revalidated.status_code, 304)
+
+        item = await CartItem.objects.aget(cart=self.cart)
+        item.quantity = 3
+        await item.asave()
+        response = await self.async_client.get('/cart/', headers={**headers, 'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_items'], 3)
+
+    async def test_order_detail(self):
+        url = f'/orders/{self.order.uuid}/'
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, headers=self.auth(self.stranger))).status_code, 404)
+        self.assertEqual((await self.async_client.get(url, headers=self.auth(self.vendor))).status_code, 200)
+
+        headers = self.auth(self.customer)
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.json()['uuid'], str(self.order.uuid))
+        revalidated = await self.async_client.get(url, headers={**headers, 'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    async def test_other_methods_go_to_the_sync_view(self):
+        response = await self.async_client.post('/cart/', headers=self.auth(self.customer))
+        self.assertEqual(response.status_code, 405)
+
+    def test_sync_fallback(self):
+        with override_settings(ASYNC_VIEWS=False):
+            view = async_or_sync_view(AsyncCartView)
+            self.assertIs(view.view_class, CartView)
+            self.assertFalse(iscoroutinefunction(view))
+        with override_settings(ASYNC_VIEWS=True):
+            view = async_or_sync_view(AsyncCartView)
+            self.assertIs(view.view_class, AsyncCartView)
+            self.assertTrue(iscoroutinefunction(view))
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenRefreshView
+from users.tokens import CachedTokenRefreshView
 from users.views import CustomTokenObtainPairView
+from .instrumentation import RequestStatsView
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic.base import RedirectView
@@ -9,7 +10,8 @@ from django.views.generic.base import RedirectView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', CachedTokenRefreshView.as_view(), name='token_refresh'),
+    path('api/stats/requests/', RequestStatsView.as_view(), name='request-stats'),
     path('users/', include('users.urls')),
     path('products/', include('products.urls')),
     path('', include('cart.urls')),
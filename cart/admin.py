@@ -14,6 +14,9 @@ class CartAdmin(admin.ModelAdmin):
     inlines = [CartItemInline]
     list_per_page = 20
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').with_totals()
+
     def user_email(self, obj):
         return obj.user.email
     user_email.short_description = 'User Email'
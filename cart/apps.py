@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        # Register cart timestamp signals
+        from . import signals  # noqa: F401
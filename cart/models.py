@@ -1,10 +1,56 @@
 # cart/models.py - UPDATED VERSION
-from django.db import models
+from decimal import Decimal
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Sum, Value, Prefetch
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from products.models import Products
 
 User = get_user_model()
 
+AMOUNT_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+
+class CartQuerySet(models.QuerySet):
+    def active(self):
+        """Carts still being filled: the rows covered by one_active_cart_per_user"""
+        return self.filter(is_ordered=False, is_paid=False)
+
+    def get_or_create_active(self, user):
+        """
+        The user's active cart as (cart, created). The lookup is served by the
+        partial unique index; if a concurrent request creates the cart between
+        our lookup and insert, the constraint rejects ours and we return theirs
+        instead of failing.
+        """
+        try:
+            return self.active().get(user=user), False
+        except self.model.DoesNotExist:
+            pass
+        try:
+            # Savepoint so the failed insert doesn't break an outer transaction
+            with transaction.atomic():
+                return self.create(user=user), True
+        except IntegrityError:
+            return self.active().get(user=user), False
+
+    def with_totals(self):
+        """Annotate cart amount and item count, computed by the database in one query"""
+        return self.annotate(
+            items_total_amount=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price'), output_field=AMOUNT_FIELD),
+                Value(Decimal('0.00')),
+                output_field=AMOUNT_FIELD
+            ),
+            items_total_quantity=Coalesce(Sum('items__quantity'), 0),
+        )
+
+    def with_items(self):
+        """Prefetch items together with their products in a single query"""
+        return self.prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('product'))
+        )
+
 class Cart(models.Model):
     # MAJOR CHANGE: OneToOneField to ForeignKey to allow multiple carts per user
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts')
@@ -14,6 +60,8 @@ class Cart(models.Model):
     # NEW FIELDS - These are what you're adding
     is_ordered = models.BooleanField(default=False)
     is_paid = models.BooleanField(default=False)
+
+    objects = CartQuerySet.as_manager()
     
     class Meta:
         # Add constraint to ensure only one active cart per user
@@ -34,24 +82,114 @@ class Cart(models.Model):
         
         return f"Cart for {self.user.email} - {status}"
 
+    def _prefetched_items(self):
+        return getattr(self, '_prefetched_objects_cache', {}).get('items')
+
     @property
     def total_amount(self):
         """Calculate total cart amount"""
-        total = sum(item.total_price for item in self.items.all())
-        return total or 0.00
+        # Prefer the with_totals() annotation, then prefetched items, then one aggregate query
+        if hasattr(self, 'items_total_amount'):
+            return self.items_total_amount
+        items = self._prefetched_items()
+        if items is not None:
+            return sum((item.total_price for item in items), Decimal('0.00'))
+        total = self.items.aggregate(
+            total=Sum(F('quantity') * F('product__price'), output_field=AMOUNT_FIELD)
+        )['total']
+        return total or Decimal('0.00')
+
+    @property
+    def total_items(self):
+        """Total quantity of products in the cart"""
+        if hasattr(self, 'items_total_quantity'):
+            return self.items_total_quantity
+        items = self._prefetched_items()
+        if items is not None:
+            return sum(item.quantity for item in items)
+        return self.items.aggregate(total=Sum('quantity'))['total'] or 0
 
     @property
     def total_price(self):
         """Alias for total_amount to match your checkout code"""
         return self.total_amount
 
-# CartItem remains the same
+def touch_cart(cart_id):
+    """
+    Bump Cart.updated_at, which backs the cart ETag. The CartItem signals do
+    this for save()/delete(); writes that bypass them call it directly.
+    """
+    Cart.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+
+class CartItemQuerySet(models.QuerySet):
+    def _column(self, name):
+        return connection.ops.quote_name(self.model._meta.get_field(name).column)
+
+    def _update_returning(self, assignment, conditions, params):
+        """
+        Run a single UPDATE ... RETURNING on cart items and return the updated
+        item, or None if no row matched. Plain .update() can't hand back the
+        new values, and reading them afterwards would race with other writers.
+        """
+        meta = self.model._meta
+        columns = ', '.join(self._column(field.name) for field in meta.concrete_fields)
+        sql = (
+            f"UPDATE {connection.ops.quote_name(meta.db_table)} SET {assignment} "
+            f"WHERE {conditions} RETURNING {columns}"
+        )
+        rows = list(self.raw(sql, params))
+        return rows[0] if rows else None
+
+    def increment(self, cart_id, product_id, amount, ceiling):
+        """
+        Add amount to the item's quantity in place, unless that would take it
+        past ceiling (the product's stock). Returns the updated item, or None
+        when there is no such item or the ceiling would be exceeded.
+        """
+        quantity = self._column('quantity')
+        return self._update_returning(
+            f"{quantity} = {quantity} + %s",
+            f"{self._column('cart')} = %s AND {self._column('product')} = %s AND {quantity} + %s <= %s",
+            [amount, cart_id, product_id, amount, ceiling],
+        )
+
+    def decrement(self, item_id, amount=1):
+        """
+        Take amount off the item's quantity in place, leaving at least one.
+        Returns the updated item, or None when it doesn't hold more than amount.
+        """
+        quantity = self._column('quantity')
+        return self._update_returning(
+            f"{quantity} = {quantity} - %s",
+            f"{self._column('id')} = %s AND {quantity} > %s",
+            [amount, item_id, amount],
+        )
+
+    def delete_ids(self, item_ids):
+        """
+        Delete the given items with one DELETE. QuerySet.delete() loads the
+        rows to send post_delete, and the signal then bumps the cart once per
+        item; callers bump it once with touch_cart() instead.
+        """
+        if not item_ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(item_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(self.model._meta.db_table)} "
+                f"WHERE {self._column('id')} IN ({placeholders})",
+                list(item_ids),
+            )
+            return cursor.rowcount
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Products, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ['cart', 'product']
 
@@ -71,4 +71,4 @@ class CartSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
 
     def get_total_items(self, obj):
-        return sum(item.quantity for item in obj.items.all())
\ No newline at end of file
+        return obj.total_items
\ No newline at end of file
@@ -0,0 +1,11 @@
+# cart/signals.py - Keep Cart.updated_at in step with its items
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CartItem, touch_cart
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart_on_item_change(sender, instance, **kwargs):
+    # Cart.updated_at backs the cart ETag, so any item change must bump it
+    touch_cart(instance.cart_id)
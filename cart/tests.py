@@ -1,3 +1,205 @@
-from django.test import TestCase
+import threading
+from collections import Counter
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from products.models import Products
+from users.authentication import get_user_status
+from users.models import CustomUser
+from .models import Cart, CartItem
 
-# Create your tests here.
+
+def bearer_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+def run_in_threads(target, count):
+    """Start count threads running target() at the same moment; each closes its own connection"""
+    barrier = threading.Barrier(count)
+
+    def run():
+        barrier.wait()
+        try:
+            target()
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class CartTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.customer = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.products = [
+            Products.objects.create(title=f'Product {i}', description='Seeded', price=5, stock=100, vendor=self.vendor)
+            for i in range(6)
+        ]
+        # Cache the customer's auth status, so counts cover the view's own queries
+        get_user_status(self.customer.pk)
+        self.client = bearer_client(self.customer)
+
+
+class CartQueryCountTests(CartTestCase):
+    def test_cart_read(self):
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        # Validators (which also give the cart id), cart with totals, items
+        with self.assertNumQueries(3):
+            self.client.get('/cart/')
+        for product in self.products[1:]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        with self.assertNumQueries(3):
+            response = self.client.get('/cart/')
+        self.assertEqual(response.json()['total_items'], 6)
+
+    def test_cart_not_modified(self):
+        Cart.objects.create(user=self.customer)
+        etag = self.client.get('/cart/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/cart/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class CartBatchTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+
+    def batch(self, *operations):
+        return self.client.post('/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity'))
+
+    def test_applies_operations_in_order(self):
+        p0, p1, p2 = (product.pk for product in self.products[:3])
+        CartItem.objects.create(cart=self.cart, product=self.products[2], quantity=1)
+        response = self.batch(
+            {'product_id': p0, 'quantity': 3},
+            {'product_id': p1, 'quantity': 4, 'op': 'set'},
+            {'product_id': p1},
+            {'product_id': p2, 'op': 'remove'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.json()[key] for key in ('created', 'updated', 'removed')},
+            {'created': 1, 'updated': 1, 'removed': 1},
+        )
+        self.assertEqual(self.quantities(), {p0: 5, p1: 5})
+        self.assertEqual(response.json()['cart']['total_items'], 10)
+
+    def test_set_to_zero_removes(self):
+        self.assertEqual(self.batch({'product_id': self.products[0].pk, 'quantity': 0, 'op': 'set'}).status_code, 200)
+        self.assertEqual(self.quantities(), {})
+
+    def test_invalid_operation_applies_nothing(self):
+        p0, p1 = self.products[0].pk, self.products[1].pk
+        for operation in (
+            {'product_id': 999999, 'quantity': 1},
+            {'product_id': p1, 'quantity': 0},
+            {'product_id': p1, 'op': 'replace'},
+            {'product_id': 'seeds'},
+        ):
+            response = self.batch({'product_id': p0, 'op': 'remove'}, {'product_id': p1, 'quantity': 2}, operation)
+            self.assertEqual(response.status_code, 400, operation)
+            self.assertEqual(response.json()['operations'][0]['index'], 2)
+            self.assertEqual(self.quantities(), {p0: 2})
+
+    def test_stock_ceiling(self):
+        p0 = self.products[0].pk
+        # 2 in the cart + 99 is over the 100 in stock, however it's split up
+        for operations in (
+            [{'product_id': p0, 'quantity': 99}],
+            [{'product_id': p0, 'quantity': 50}, {'product_id': p0, 'quantity': 49}],
+            [{'product_id': p0, 'quantity': 101, 'op': 'set'}],
+        ):
+            response = self.batch(*operations)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['operations'], [{'product_id': p0, 'error': 'Only 100 items available in stock'}])
+            self.assertEqual(self.quantities(), {p0: 2})
+        self.assertEqual(self.batch({'product_id': p0, 'quantity': 100, 'op': 'set'}).status_code, 200)
+
+    def test_operation_limit(self):
+        p1 = self.products[1].pk
+        self.assertEqual(self.batch(*[{'product_id': p1}] * 101).status_code, 400)
+        self.assertEqual(self.batch(*[{'product_id': p1}] * 100).status_code, 200)
+        self.assertEqual(self.quantities()[p1], 100)
+        self.assertEqual(self.batch().status_code, 400)
+
+
+class CartBatchQueryCountTests(CartTestCase):
+    def measure_batch(self, updated, removed, created):
+        """Run a batch that updates, removes and creates the given numbers of items"""
+        cart = Cart.objects.create(user=self.customer)
+        existing, new = self.products[:updated + removed], self.products[updated + removed:][:created]
+        for product in existing:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        operations = (
+            [{'product_id': product.pk, 'quantity': 1} for product in existing[:updated]]
+            + [{'product_id': product.pk, 'op': 'remove'} for product in existing[updated:]]
+            + [{'product_id': product.pk, 'quantity': 2} for product in new]
+        )
+        # Cart, products and items, then one INSERT, UPDATE and DELETE for
+        # all the items, the ETag touch, and the cart with totals and items
+        # (plus the savepoint around the writes)
+        with self.assertNumQueries(11):
+            response = self.client.post('/cart/batch/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        cart.delete()
+        return response.json()
+
+    def test_batch(self):
+        small = self.measure_batch(updated=1, removed=1, created=1)
+        large = self.measure_batch(updated=2, removed=2, created=2)
+        self.assertEqual((small['updated'], small['removed'], small['created']), (1, 1, 1))
+        self.assertEqual((large['updated'], large['removed'], large['created']), (2, 2, 2))
+
+
+class ConcurrentCartTests(TransactionTestCase):
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.customer = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.token = str(RefreshToken.for_user(self.customer).access_token)
+
+    def test_first_requests_share_one_cart(self):
+        carts, errors = [], []
+
+        def acquire():
+            try:
+                carts.append(Cart.objects.get_or_create_active(self.customer)[0].pk)
+            except Exception as e:
+                errors.append(e)
+
+        run_in_threads(acquire, 8)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(carts)), 1)
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 1)
+
+    def test_parallel_adds_keep_every_unit_within_stock(self):
+        product = Products.objects.create(title='Seeds', description='Seeded', price=5, stock=30, vendor=self.vendor)
+        statuses = []
+
+        def add():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+            for _ in range(4):
+                statuses.append(client.post('/cart/add/', {'product_id': product.pk, 'quantity': 1}, format='json').status_code)
+
+        run_in_threads(add, 12)
+        counts = Counter(statuses)
+        self.assertEqual(set(counts), {201, 400})
+        # Every accepted add is counted once, and none past the stock
+        self.assertEqual(CartItem.objects.get().quantity, counts[201])
+        self.assertEqual(counts[201], 30)
+        self.assertEqual(Cart.objects.count(), 1)
@@ -10,18 +10,21 @@
 
 # urls.py - Cart URLs
 from django.urls import path
+from Agroshop.asyncviews import async_or_sync_view
 from .views import (
-    CartView,
+    AsyncCartView,
     AddToCartView,
     CartItemDetailView,
+    CartBatchView,
     ClearCartView,
     OrderHistoryView,
 )
 
 urlpatterns = [
     # Cart endpoints
-    path('cart/', CartView.as_view(), name='cart-detail'),                    # GET /cart/
+    path('cart/', async_or_sync_view(AsyncCartView), name='cart-detail'),                    # GET /cart/
     path('cart/add/', AddToCartView.as_view(), name='add-to-cart'),          # POST /cart/add/
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),                 # POST /cart/batch/
     path('item/<int:item_id>/', CartItemDetailView.as_view(), name='cart-item-detail'),  # PUT, DELETE /cart/item/5/
     path('clear/', ClearCartView.as_view(), name='clear-cart'),         # DELETE /cart/clear/
     path('orders/history/', OrderHistoryView.as_view(), name='order-history'),
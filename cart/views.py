@@ -2,10 +2,17 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.authentication import ClaimsJWTAuthentication
+from Agroshop.asyncviews import AsyncAPIView
+from asgiref.sync import sync_to_async
 from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Cart, CartItem
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import hashlib
+from .models import Cart, CartItem, touch_cart
 from .serializer import CartSerializer, CartItemSerializer
 from products.models import Products
 
@@ -15,20 +22,82 @@ class IsCustomer(permissions.BasePermission):
             return False
         return hasattr(request.user, 'role') and request.user.role == 'customer'
 
+CART_VALIDATORS = {
+    'cart_id': Max('id'),
+    'cart_updated': Max('updated_at'),
+    'products_updated': Max('items__product__updated_at'),
+}
+
+def active_cart_validators(request):
+    """
+    Fetch what the cart response depends on (cart, item and product timestamps)
+    in one aggregate query, memoized on the request for the ETag and
+    Last-Modified callbacks.
+    """
+    # On the HttpRequest, where active_cart_id() looks for the cart id
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, '_cart_validators'):
+        http_request._cart_validators = Cart.objects.active().filter(user=request.user).aggregate(**CART_VALIDATORS)
+    return http_request._cart_validators
+
+async def aactive_cart_validators(request):
+    """active_cart_validators() for async views"""
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, '_cart_validators'):
+        http_request._cart_validators = await (
+            Cart.objects.active().filter(user=request.user).aaggregate(**CART_VALIDATORS)
+        )
+    return http_request._cart_validators
+
+def active_cart_id(request, create=True):
+    """
+    Id of the user's active cart, resolved once per request and shared with
+    the ETag validators (which already looked it up). Creates the cart when
+    the user has none, unless create=False, in which case None is returned.
+    """
+    # Stored on the HttpRequest so the DRF Request and the condition() callbacks see the same value
+    http_request = getattr(request, '_request', request)
+    cart_id = getattr(http_request, '_active_cart_id', None)
+    if cart_id is None:
+        validators = getattr(http_request, '_cart_validators', None)
+        if validators is not None:
+            cart_id = validators['cart_id']
+        else:
+            cart_id = Cart.objects.active().filter(user=request.user).values_list('id', flat=True).first()
+        if cart_id is None and create:
+            cart, created = Cart.objects.get_or_create_active(request.user)
+            cart_id = cart.pk
+        http_request._active_cart_id = cart_id
+    return cart_id
+
+def cart_etag(validators):
+    if validators['cart_id'] is None:
+        return None
+    raw = f"{validators['cart_id']}:{validators['cart_updated']}:{validators['products_updated']}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+def cart_last_modified(validators):
+    timestamps = [t for t in (validators['cart_updated'], validators['products_updated']) if t]
+    return max(timestamps) if timestamps else None
+
+def active_cart_etag(request, *args, **kwargs):
+    return cart_etag(active_cart_validators(request))
+
+def active_cart_last_modified(request, *args, **kwargs):
+    return cart_last_modified(active_cart_validators(request))
+
 class CartView(APIView):
     """View user's ACTIVE cart"""
     permission_classes = [IsCustomer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
+    @method_decorator(condition(etag_func=active_cart_etag, last_modified_func=active_cart_last_modified))
     def get(self, request):
         """Get user's active cart with all items"""
         try:
             # MAJOR CHANGE: Get only active cart (not ordered/paid)
-            cart, created = Cart.objects.get_or_create(
-                user=request.user,
-                is_ordered=False,
-                is_paid=False
-            )
+            # Totals are annotated and items+products prefetched: two queries in all
+            cart = Cart.objects.with_totals().with_items().get(pk=active_cart_id(request))
             serializer = CartSerializer(cart)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -37,10 +106,33 @@ class CartView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class AsyncCartView(AsyncAPIView):
+    """CartView for the ASGI deployment"""
+    sync_view = CartView
+    permission_classes = [IsCustomer]
+
+    async def get(self, request):
+        validators = await aactive_cart_validators(request)
+
+        async def build():
+            try:
+                cart_id = validators['cart_id']
+                if cart_id is None:
+                    cart, created = await sync_to_async(Cart.objects.get_or_create_active)(request.user)
+                    cart_id = cart.pk
+                cart = await Cart.objects.with_totals().with_items().aget(pk=cart_id)
+                return self.render(CartSerializer(cart).data)
+            except Exception:
+                return self.render({"error": "Failed to fetch cart"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return await self.conditional(
+            request, build, etag=cart_etag(validators), last_modified=cart_last_modified(validators)
+        )
+
 class AddToCartView(APIView):
     """Add item to ACTIVE cart only"""
     permission_classes = [IsCustomer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def post(self, request):
         try:
@@ -54,11 +146,7 @@ class AddToCartView(APIView):
                 )
 
             # MAJOR CHANGE: Get or create ACTIVE cart only
-            cart, created = Cart.objects.get_or_create(
-                user=request.user,
-                is_ordered=False,
-                is_paid=False
-            )
+            cart_id = active_cart_id(request)
             
             try:
                 product = Products.objects.get(id=product_id)
@@ -74,16 +162,41 @@ class AddToCartView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
+            if quantity <= 0:
+                return Response(
+                    {'error': 'Quantity must be greater than 0'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if quantity > product.stock:
+                return Response(
+                    {'error': f'Only {product.stock} items available in stock'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            with transaction.atomic():
+                # One conditional UPDATE so concurrent adds can't lose each other
+                # or push the item past the stock
+                cart_item = CartItem.objects.increment(cart_id, product.pk, quantity, ceiling=product.stock)
+                if cart_item is None:
+                    # No such item yet, or adding would exceed the stock
+                    try:
+                        with transaction.atomic():
+                            cart_item = CartItem.objects.create(cart_id=cart_id, product=product, quantity=quantity)
+                    except IntegrityError:
+                        # The item exists; retry in case it was created concurrently
+                        cart_item = CartItem.objects.increment(cart_id, product.pk, quantity, ceiling=product.stock)
+                        if cart_item is None:
+                            return Response(
+                                {'error': f'Only {product.stock} items available in stock'}, 
+                                status=status.HTTP_400_BAD_REQUEST
+                            )
+                        touch_cart(cart_id)
+                else:
+                    touch_cart(cart_id)
 
+            # Reuse the product we already loaded instead of fetching it again
+            cart_item.product = product
             serializer = CartItemSerializer(cart_item)
             
             return Response({
@@ -105,16 +218,15 @@ class AddToCartView(APIView):
 class CartItemDetailView(APIView):
     """Update or remove specific cart item from ACTIVE cart only"""
     permission_classes = [IsCustomer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def get_object(self, request, item_id):
         """Get cart item from ACTIVE cart only"""
         try:
-            return CartItem.objects.get(
-                id=item_id, 
-                cart__user=request.user,
-                cart__is_ordered=False,  # NEW: Only from active carts
-                cart__is_paid=False      # NEW: Only from active carts
+            # NEW: Only from the active cart
+            return CartItem.objects.select_related('product').get(
+                id=item_id,
+                cart_id=active_cart_id(request, create=False)
             )
         except CartItem.DoesNotExist:
             raise Http404("Cart item not found in active cart")
@@ -130,9 +242,15 @@ class CartItemDetailView(APIView):
                     {'error': 'Quantity must be greater than 0. Use DELETE to remove item.'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+
+            if quantity > cart_item.product.stock:
+                return Response(
+                    {'error': f'Only {cart_item.product.stock} items available in stock'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             cart_item.quantity = quantity
-            cart_item.save()
+            cart_item.save(update_fields=['quantity'])
             
             serializer = CartItemSerializer(cart_item)
             
@@ -160,19 +278,27 @@ class CartItemDetailView(APIView):
             
             action = request.data.get('action', 'remove_all')
             
-            if action == 'remove_all' or cart_item.quantity == 1:
-                cart_item.delete()
+            # Decrement in place; it only fails when a single unit is left
+            updated = None
+            with transaction.atomic():
+                if action != 'remove_all':
+                    updated = CartItem.objects.decrement(cart_item.pk)
+                if updated is None:
+                    cart_item.delete()
+                else:
+                    touch_cart(cart_item.cart_id)
+
+            if updated is None:
                 return Response(
                     {'message': f'Item "{product_title}" removed from cart completely'}, 
                     status=status.HTTP_200_OK
                 )
             else:
-                cart_item.quantity -= 1
-                cart_item.save()
+                updated.product = cart_item.product
                 
-                serializer = CartItemSerializer(cart_item)
+                serializer = CartItemSerializer(updated)
                 return Response({
-                    'message': f'Removed 1 quantity of "{product_title}". {cart_item.quantity} remaining.',
+                    'message': f'Removed 1 quantity of "{product_title}". {updated.quantity} remaining.',
                     'cart_item': serializer.data
                 }, status=status.HTTP_200_OK)
                 
@@ -182,28 +308,149 @@ class CartItemDetailView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+class CartBatchView(APIView):
+    """
+    Apply a list of {product_id, quantity, op} operations to the ACTIVE cart in
+    one request, e.g. when the app syncs a cart built offline. op is 'add'
+    (increase by quantity, the default), 'set' (to quantity, 0 removes) or
+    'remove'. Operations run in order and either all apply or none do.
+    """
+    permission_classes = [IsCustomer]
+    authentication_classes = [ClaimsJWTAuthentication]
+    max_operations = 100
+    ops = ('add', 'set', 'remove')
+
+    def parse_operations(self, raw):
+        """Normalize the payload into (op, product_id, quantity) tuples plus per-operation errors"""
+        operations, errors = [], []
+        for index, entry in enumerate(raw):
+            if not isinstance(entry, dict):
+                errors.append({'index': index, 'error': 'Operation must be an object'})
+                continue
+            op = entry.get('op', 'add')
+            try:
+                product_id = int(entry.get('product_id'))
+                quantity = int(entry.get('quantity', 1 if op == 'add' else 0))
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'error': 'product_id and quantity must be integers'})
+                continue
+            if op not in self.ops:
+                errors.append({'index': index, 'error': f'Invalid op. Must be one of: {list(self.ops)}'})
+            elif op == 'add' and quantity <= 0:
+                errors.append({'index': index, 'error': 'Quantity must be greater than 0'})
+            elif op == 'set' and quantity < 0:
+                errors.append({'index': index, 'error': 'Quantity must not be negative'})
+            else:
+                operations.append((index, op, product_id, quantity))
+        return operations, errors
+
+    def post(self, request):
+        raw = request.data.get('operations')
+        if not isinstance(raw, list) or not raw:
+            return Response(
+                {'error': 'operations must be a non-empty list'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(raw) > self.max_operations:
+            return Response(
+                {'error': f'At most {self.max_operations} operations per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        operations, errors = self.parse_operations(raw)
+        if errors:
+            return Response(
+                {'error': 'Invalid cart operations', 'operations': errors}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            with transaction.atomic():
+                # Lock the cart so concurrent batches for it apply one after another
+                cart, created = Cart.objects.select_for_update().get_or_create_active(request.user)
+                product_ids = {product_id for _, _, product_id, _ in operations}
+                products = Products.objects.in_bulk(product_ids)
+                items = {
+                    item.product_id: item
+                    for item in CartItem.objects.filter(cart=cart, product_id__in=product_ids)
+                }
+
+                # Play the operations against in-memory quantities
+                quantities = {product_id: item.quantity for product_id, item in items.items()}
+                for index, op, product_id, quantity in operations:
+                    product = products.get(product_id)
+                    if product is None:
+                        errors.append({'index': index, 'error': 'Product not found'})
+                    elif not product.price or product.price <= 0:
+                        errors.append({'index': index, 'error': 'Product must have a valid price'})
+                    elif op == 'add':
+                        quantities[product_id] = quantities.get(product_id, 0) + quantity
+                    elif op == 'set':
+                        quantities[product_id] = quantity
+                    else:
+                        quantities[product_id] = 0
+                for product_id, quantity in quantities.items():
+                    if quantity > products[product_id].stock:
+                        errors.append({
+                            'product_id': product_id,
+                            'error': f'Only {products[product_id].stock} items available in stock'
+                        })
+                if errors:
+                    return Response(
+                        {'error': 'Invalid cart operations', 'operations': errors}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                to_create, to_update, to_delete = [], [], []
+                for product_id, quantity in quantities.items():
+                    item = items.get(product_id)
+                    if item is None:
+                        if quantity:
+                            to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+                    elif not quantity:
+                        to_delete.append(item.pk)
+                    elif quantity != item.quantity:
+                        item.quantity = quantity
+                        to_update.append(item)
+
+                CartItem.objects.bulk_create(to_create)
+                CartItem.objects.bulk_update(to_update, ['quantity'])
+                CartItem.objects.delete_ids(to_delete)
+                # Bulk writes skip the signal that keeps the cart ETag fresh
+                touch_cart(cart.pk)
+
+            cart = Cart.objects.with_totals().with_items().get(pk=cart.pk)
+            return Response({
+                'message': 'Cart updated successfully',
+                'created': len(to_create),
+                'updated': len(to_update),
+                'removed': len(to_delete),
+                'cart': CartSerializer(cart).data
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response(
+                {'error': 'An unexpected error occurred while updating cart'}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class ClearCartView(APIView):
     """Clear all items from user's ACTIVE cart"""
     permission_classes = [IsCustomer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def delete(self, request):
         try:
             # MAJOR CHANGE: Only clear active cart
-            cart = Cart.objects.filter(
-                user=request.user,
-                is_ordered=False,
-                is_paid=False
-            ).first()
+            cart_id = active_cart_id(request, create=False)
             
-            if not cart:
+            if not cart_id:
                 return Response(
                     {'message': 'No active cart found to clear'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            items_count = cart.items.count()
-            cart.items.all().delete()
+            items_count, _ = CartItem.objects.filter(cart_id=cart_id).delete()
             
             return Response(
                 {'message': f'Cart cleared successfully. Removed {items_count} items.'}, 
@@ -219,7 +466,7 @@ class ClearCartView(APIView):
 class OrderHistoryView(APIView):
     """View completed orders (carts that are ordered and paid)"""
     permission_classes = [IsCustomer]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def get(self, request):
         try:
@@ -227,13 +474,13 @@ class OrderHistoryView(APIView):
                 user=request.user,
                 is_ordered=True,
                 is_paid=True
-            ).order_by('-updated_at')
+            ).order_by('-updated_at').with_totals().with_items()
             
             serializer = CartSerializer(completed_carts, many=True)
             
             return Response({
                 'orders': serializer.data,
-                'total_orders': completed_carts.count()
+                'total_orders': len(serializer.data)
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
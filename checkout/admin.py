@@ -1,8 +1,10 @@
 from django.contrib import admin
-from checkout.models import Checkout , MpesaBody 
+from checkout.models import Checkout , MpesaBody, MpesaCallbackInbox, StockReservation
 
 
 admin.site.register(Checkout)
 admin . site.register(MpesaBody)
+admin.site.register(MpesaCallbackInbox)
+admin.site.register(StockReservation)
 
 # Register your models here.
@@ -0,0 +1,151 @@
+# checkout/daraja.py - HTTP client for Safaricom's Daraja API
+import threading
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class DarajaClient:
+    """
+    Daraja client that reuses pooled keep-alive connections and caches the
+    OAuth token until shortly before it expires.
+
+    The token lives both in-process and in Django's shared cache. A refresh
+    takes a thread lock plus a cache lock, so concurrent workers wait for
+    one fetch from the token endpoint instead of all fetching at once.
+    """
+    TOKEN_CACHE_KEY = 'mpesa:access_token'
+    TOKEN_LOCK_KEY = 'mpesa:access_token:lock'
+    # Refresh this many seconds before Daraja's expires_in runs out
+    EXPIRY_MARGIN = 60
+    # How long a waiting worker polls the shared cache for another worker's refresh
+    LOCK_WAIT = 5
+
+    def __init__(self, consumer_key, consumer_secret, token_url, stk_push_url,
+                 timeout=(3.05, 15), pool_size=10, retries=2):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.token_url = token_url
+        self.stk_push_url = stk_push_url
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # Only the idempotent token GET is retried; an STK push POST is never replayed
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET'])
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._token = None
+        self._token_expires_at = 0
+        self._lock = threading.Lock()
+
+    def _token_is_fresh(self):
+        return self._token is not None and time.time() < self._token_expires_at
+
+    def _use_cached_token(self):
+        cached = cache.get(self.TOKEN_CACHE_KEY)
+        if cached and time.time() < cached[1]:
+            self._token, self._token_expires_at = cached
+            return True
+        return False
+
+    def _fetch_token(self):
+        response = self.session.get(
+            self.token_url,
+            auth=(self.consumer_key, self.consumer_secret),
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        expires_in = int(data.get('expires_in', 3599))
+        lifetime = max(expires_in - self.EXPIRY_MARGIN, 1)
+        self._token = data['access_token']
+        self._token_expires_at = time.time() + lifetime
+        cache.set(self.TOKEN_CACHE_KEY, (self._token, self._token_expires_at), timeout=lifetime)
+
+    def get_access_token(self):
+        """Return a valid OAuth token, hitting the token endpoint only when needed."""
+        if self._token_is_fresh():
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._token_is_fresh() or self._use_cached_token():
+                return self._token
+
+            if cache.add(self.TOKEN_LOCK_KEY, 1, timeout=self.LOCK_WAIT * 2):
+                try:
+                    self._fetch_token()
+                finally:
+                    cache.delete(self.TOKEN_LOCK_KEY)
+                return self._token
+
+            # Another process is refreshing - wait for its token to land
+            deadline = time.time() + self.LOCK_WAIT
+            while time.time() < deadline:
+                time.sleep(0.05)
+                if self._use_cached_token():
+                    return self._token
+
+            logger.warning("Timed out waiting for Daraja token refresh, fetching directly")
+            self._fetch_token()
+            return self._token
+
+    def invalidate_token(self):
+        with self._lock:
+            self._token = None
+            self._token_expires_at = 0
+            cache.delete(self.TOKEN_CACHE_KEY)
+
+    def stk_push(self, payload):
+        """Send an STK push request and return Daraja's JSON response."""
+        response = self._post_stk_push(payload)
+        if response.status_code == 401:
+            # Token revoked or expired early - refresh once and resend
+            self.invalidate_token()
+            response = self._post_stk_push(payload)
+        return response.json()
+
+    def _post_stk_push(self, payload):
+        headers = {'Authorization': f'Bearer {self.get_access_token()}', 'Content-Type': 'application/json'}
+        return self.session.post(self.stk_push_url, json=payload, headers=headers, timeout=self.timeout)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_daraja_client():
+    """Process-wide DarajaClient built from settings, so connections and tokens are shared."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DarajaClient(
+                    consumer_key=settings.MPESA_CONSUMER_KEY,
+                    consumer_secret=settings.MPESA_CONSUMER_SECRET,
+                    token_url=settings.MPESA_ACCESS_TOKEN_URL,
+                    stk_push_url=settings.MPESA_STK_PUSH_URL,
+                    timeout=(settings.MPESA_CONNECT_TIMEOUT, settings.MPESA_READ_TIMEOUT),
+                    pool_size=settings.MPESA_POOL_SIZE,
+                )
+    return _client
+
+
+def reset_daraja_client():
+    """Drop the shared client so the next call rebuilds it from current settings (e.g. to point at a stub)."""
+    global _client
+    with _client_lock:
+        _client = None
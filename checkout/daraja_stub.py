@@ -0,0 +1,124 @@
+# checkout/daraja_stub.py - Local stand-in for Daraja's OAuth and STK push endpoints
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .utils import build_stk_callback
+
+
+class DarajaStubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between calls
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.path.startswith('/oauth/v1/generate'):
+            return self._send_json({'errorMessage': 'Not found'}, status=404)
+        self.server.record('token_requests')
+        self._send_json({'access_token': self.server.issue_token(), 'expires_in': str(self.server.token_ttl)})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.startswith('/mpesa/stkpush/v1/processrequest'):
+            return self._send_json({'errorMessage': 'Not found'}, status=404)
+        scheme, _, token = self.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not self.server.token_is_valid(token):
+            self.server.record('unauthorized')
+            return self._send_json({'errorMessage': 'Invalid Access Token'}, status=401)
+
+        self.server.record('stk_requests')
+        checkout_request_id = f'ws_CO_{uuid.uuid4().hex[:20]}'
+        self._send_json({
+            'MerchantRequestID': uuid.uuid4().hex[:12],
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        })
+
+        callback_url = self.server.callback_url or payload.get('CallBackURL')
+        if self.server.send_callbacks and callback_url:
+            # Fire the payment result the way Safaricom does: later, from elsewhere
+            timer = threading.Timer(
+                self.server.callback_delay,
+                self.server.send_callback,
+                args=(callback_url, checkout_request_id, payload)
+            )
+            timer.daemon = True
+            timer.start()
+
+    def setup(self):
+        super().setup()
+        self.server.record('connections')
+
+
+class DarajaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, token_ttl=3599, send_callbacks=False, callback_url=None,
+                 callback_delay=1.0, result_code=0, verbose=False):
+        super().__init__(address, DarajaStubHandler)
+        self.token_ttl = token_ttl
+        self.send_callbacks = send_callbacks
+        self.callback_url = callback_url
+        self.callback_delay = callback_delay
+        self.result_code = result_code
+        self.verbose = verbose
+        self.stats = {'connections': 0, 'token_requests': 0, 'stk_requests': 0, 'unauthorized': 0, 'callbacks_sent': 0}
+        self._stats_lock = threading.Lock()
+        self._tokens = set()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self._stats_lock:
+            self._tokens.add(token)
+        return token
+
+    def token_is_valid(self, token):
+        with self._stats_lock:
+            return token in self._tokens
+
+    def revoke_tokens(self):
+        """Reject every token issued so far, as Daraja does when one is revoked early"""
+        with self._stats_lock:
+            self._tokens.clear()
+
+    def send_callback(self, callback_url, checkout_request_id, stk_payload):
+        import requests
+        body = build_stk_callback(
+            checkout_request_id,
+            result_code=self.result_code,
+            amount=stk_payload.get('Amount', 1),
+            phone=stk_payload.get('PhoneNumber', '254700000000')
+        )
+        try:
+            requests.post(callback_url, json=body, timeout=10)
+            self.record('callbacks_sent')
+        except requests.RequestException:
+            pass
+
+    def start_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
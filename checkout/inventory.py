@@ -0,0 +1,158 @@
+# checkout/inventory.py - Contention-safe stock reservation
+#
+# Every stock change is a single conditional UPDATE
+# (`UPDATE ... SET stock = stock - n WHERE id = ? AND stock >= n`), so the
+# database arbitrates between concurrent buyers and Python never does a
+# read-modify-write on Products.stock.
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from products.models import Products
+from products.cache import bump_catalog_version
+from .models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested, available, title=''):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        self.title = title
+        super().__init__(f'Only {available} of "{title or product_id}" left in stock')
+
+
+def _merge_quantities(lines):
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    # Sorted so concurrent reservations lock rows in the same order (no deadlocks)
+    return sorted(quantities.items())
+
+
+def take_stock(product_id, quantity):
+    """Atomically remove quantity from a product's stock. Returns False if there isn't enough."""
+    return Products.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity,
+        updated_at=timezone.now()
+    ) == 1
+
+
+def return_stock(lines):
+    """Put (product_id, quantity) pairs back on the shelf"""
+    if not lines:
+        return
+    now = timezone.now()
+    for product_id, quantity in _merge_quantities(lines):
+        Products.objects.filter(pk=product_id).update(stock=F('stock') + quantity, updated_at=now)
+    transaction.on_commit(bump_catalog_version)
+
+
+def reserve_stock(checkout, lines):
+    """
+    Reserve (product_id, quantity) pairs for a checkout. All or nothing:
+    raises InsufficientStock and rolls back if any product runs short.
+    """
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    merged = _merge_quantities(lines)
+    with transaction.atomic():
+        for product_id, quantity in merged:
+            if not take_stock(product_id, quantity):
+                product = Products.objects.filter(pk=product_id).values('stock', 'title').first() or {}
+                raise InsufficientStock(product_id, quantity, product.get('stock', 0), product.get('title', ''))
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(checkout=checkout, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in merged
+        ])
+        transaction.on_commit(bump_catalog_version)
+    return reservations
+
+
+def release_reservations(reservations):
+    """
+    Return stock for ACTIVE reservations. Each reservation is flipped with a
+    conditional UPDATE first, so a reservation released concurrently by a
+    callback and the sweeper only gives its stock back once.
+    """
+    released = []
+    with transaction.atomic():
+        for reservation in reservations.filter(status='ACTIVE').order_by('product_id'):
+            flipped = StockReservation.objects.filter(pk=reservation.pk, status='ACTIVE').update(
+                status='RELEASED',
+                updated_at=timezone.now()
+            )
+            if flipped:
+                released.append((reservation.product_id, reservation.quantity))
+        if released:
+            return_stock(released)
+    return len(released)
+
+
+def release_checkout_reservations(checkout):
+    return release_reservations(StockReservation.objects.filter(checkout=checkout))
+
+
+def release_cart_reservations(cart):
+    """Release what earlier checkout attempts for this cart still hold"""
+    return release_reservations(StockReservation.objects.filter(checkout__cart=cart))
+
+
+def release_expired_reservations(now=None):
+    now = now or timezone.now()
+    return release_reservations(StockReservation.objects.filter(expires_at__lt=now))
+
+
+def stock_was_taken(checkout_request_id):
+    """
+    Whether the order paid through this checkout took its stock off the shelf.
+    Orders placed before stock reservations existed never decremented it.
+    """
+    return bool(checkout_request_id) and StockReservation.objects.filter(
+        checkout__checkout_request_id=checkout_request_id, status='CONSUMED'
+    ).exists()
+
+
+def consume_reservations(checkout, lines):
+    """
+    Make a paid checkout's stock removal permanent for what was paid for.
+    The checkout's ACTIVE reservations are locked and marked CONSUMED, then
+    each product is reconciled: units held beyond the paid quantity (the
+    cart was reduced while the payment was pending) go back on the shelf,
+    and missing units (the sweeper released a reservation before a late
+    callback) are taken again. Payment has been received, so a shortfall is
+    logged rather than refused.
+    """
+    with transaction.atomic():
+        # Locked, so a concurrent release either finished first (and the row
+        # isn't ACTIVE here) or waits and then finds it CONSUMED
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(checkout=checkout, status='ACTIVE')
+            .order_by('product_id')
+        )
+        held = defaultdict(int)
+        for reservation in reservations:
+            held[reservation.product_id] += reservation.quantity
+        StockReservation.objects.filter(pk__in=[reservation.pk for reservation in reservations]).update(
+            status='CONSUMED',
+            updated_at=timezone.now()
+        )
+
+        paid = dict(_merge_quantities(lines))
+        surplus = []
+        for product_id in sorted(held.keys() | paid.keys()):
+            difference = held.get(product_id, 0) - paid.get(product_id, 0)
+            if difference > 0:
+                surplus.append((product_id, difference))
+            elif difference < 0 and not take_stock(product_id, -difference):
+                logger.warning(
+                    f"Checkout {checkout.checkout_request_id} paid for {-difference} x product {product_id} "
+                    f"with no stock left to take"
+                )
+        return_stock(surplus)
+        transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from checkout.utils import drain_callback_inbox
+
+
+class Command(BaseCommand):
+    help = "Drain the M-Pesa callback inbox, turning successful payments into orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Callbacks claimed per transaction')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts before a callback is marked FAILED')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the inbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain what is pending, then exit')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                claimed = drain_callback_inbox(
+                    batch_size=options['batch_size'],
+                    max_attempts=options['max_attempts']
+                )
+                total += claimed
+                if claimed:
+                    self.stdout.write(f"Processed {claimed} callback(s)")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} callback(s) processed."))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from checkout.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Return stock held by checkouts whose reservation has expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping instead of exiting')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                released = release_expired_reservations()
+                if released or not options['loop']:
+                    self.stdout.write(f"Released {released} expired reservation(s)")
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
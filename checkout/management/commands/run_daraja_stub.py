@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from checkout.daraja_stub import DarajaStubServer
+
+
+class Command(BaseCommand):
+    help = "Run a local Daraja stub (OAuth + STK push) for development and benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--token-ttl', type=int, default=3599, help='expires_in returned with each token')
+        parser.add_argument('--send-callbacks', action='store_true',
+                            help='POST a synthetic payment result to the CallBackURL of each STK push')
+        parser.add_argument('--callback-url', help='Override the CallBackURL sent by the app')
+        parser.add_argument('--callback-delay', type=float, default=1.0)
+        parser.add_argument('--result-code', type=int, default=0)
+
+    def handle(self, *args, **options):
+        server = DarajaStubServer(
+            (options['host'], options['port']),
+            token_ttl=options['token_ttl'],
+            send_callbacks=options['send_callbacks'],
+            callback_url=options['callback_url'],
+            callback_delay=options['callback_delay'],
+            result_code=options['result_code'],
+            verbose=True,
+        )
+        self.stdout.write(
+            f"Daraja stub listening on {server.base_url}\n"
+            f"  MPESA_ACCESS_TOKEN_URL={server.base_url}/oauth/v1/generate?grant_type=client_credentials\n"
+            f"  MPESA_STK_PUSH_URL={server.base_url}/mpesa/stkpush/v1/processrequest"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stats: {server.stats}")
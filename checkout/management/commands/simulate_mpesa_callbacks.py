@@ -0,0 +1,45 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from checkout.models import Checkout
+from checkout.utils import build_stk_callback, enqueue_stk_callback
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic Daraja STK callbacks for local testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkout-request-id', action='append', default=[],
+                            help='CheckoutRequestID to answer (repeatable)')
+        parser.add_argument('--pending', action='store_true',
+                            help='Answer every PENDING checkout')
+        parser.add_argument('--result-code', type=int, default=0,
+                            help='0 for success, anything else for a failed payment')
+        parser.add_argument('--post', metavar='URL',
+                            help='POST callbacks to this callback URL instead of writing to the inbox')
+
+    def handle(self, *args, **options):
+        checkouts = Checkout.objects.none()
+        if options['pending']:
+            checkouts = Checkout.objects.filter(status='PENDING', checkout_request_id__isnull=False)
+        if options['checkout_request_id']:
+            checkouts = checkouts | Checkout.objects.filter(checkout_request_id__in=options['checkout_request_id'])
+        checkouts = list(checkouts)
+        if not checkouts:
+            raise CommandError('No matching checkouts. Use --pending or --checkout-request-id.')
+
+        session = requests.Session() if options['post'] else None
+        for checkout in checkouts:
+            payload = build_stk_callback(
+                checkout.checkout_request_id,
+                result_code=options['result_code'],
+                amount=checkout.amount,
+                phone=checkout.phone
+            )
+            if session:
+                response = session.post(options['post'], json=payload, timeout=10)
+                self.stdout.write(f"{checkout.checkout_request_id}: HTTP {response.status_code}")
+            else:
+                enqueue_stk_callback(payload)
+                self.stdout.write(f"{checkout.checkout_request_id}: queued")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated {len(checkouts)} callback(s)."))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:27
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0002_alter_checkout_options_checkout_attempt_number_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaCallbackInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('body', models.JSONField()),
+                ('checkout_request_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSED', 'Processed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='checkout_mp_status_64f4cb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0003_mpesacallbackinbox'),
+        ('products', '0007_product_search_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('CONSUMED', 'Consumed'), ('RELEASED', 'Released')], default='ACTIVE', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('checkout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='checkout.checkout')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='checkout_st_status_0ed37a_idx')],
+            },
+        ),
+    ]
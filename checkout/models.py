@@ -3,6 +3,7 @@ from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from cart.models import Cart
+from products.models import Products
 
 User = get_user_model()
 
@@ -72,3 +73,57 @@ class MpesaBody(UniversalIdModel, TimeStampedModel):
 
     def __str__(self):
         return f"MpesaBody for Checkout {self.checkout.uuid} (Code: {self.result_code})"
+
+class MpesaCallbackInbox(UniversalIdModel, TimeStampedModel):
+    """
+    Raw Daraja callbacks, stored as received and acknowledged immediately.
+    The process_mpesa_callbacks worker drains PENDING rows into orders.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSED', 'Processed'),
+        ('FAILED', 'Failed'),
+    )
+
+    body = models.JSONField()
+    checkout_request_id = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=20, default='PENDING', choices=STATUS_CHOICES)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Callback {self.checkout_request_id} ({self.status})"
+
+
+class StockReservation(TimeStampedModel):
+    """
+    Stock held for a checkout while the customer pays. The product's stock is
+    decremented when the reservation is made; releasing gives it back,
+    consuming keeps it off the shelf for good.
+    """
+    STATUS_CHOICES = (
+        ('ACTIVE', 'Active'),
+        ('CONSUMED', 'Consumed'),
+        ('RELEASED', 'Released'),
+    )
+
+    checkout = models.ForeignKey(Checkout, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, default='ACTIVE', choices=STATUS_CHOICES)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for Checkout {self.checkout_id} ({self.status})"
@@ -1,3 +1,377 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from cart.models import Cart, CartItem
+from orders.models import Order, OrderItem
+from products.models import Products
+from users.models import CustomUser
+from .daraja import DarajaClient
+from .daraja_stub import DarajaStubServer
+from .inventory import (
+    InsufficientStock, consume_reservations, release_expired_reservations, reserve_stock, take_stock,
+)
+from .models import Checkout, MpesaBody, MpesaCallbackInbox, StockReservation
+from .utils import build_stk_callback, drain_callback_inbox, process_stk_callback
 
-# Create your tests here.
+
+def run_in_threads(target, args_list):
+    """Start target(*args) for each args at the same moment; each thread closes its own connection"""
+    barrier = threading.Barrier(len(args_list))
+
+    def run(*args):
+        barrier.wait()
+        try:
+            target(*args)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Many buyers of one SKU at once: stock never goes below zero or gets lost"""
+
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.product = Products.objects.create(title='Seeds', description='Seeded', price=10, stock=10, vendor=self.vendor)
+
+    def test_reserve_stock_does_not_oversell(self):
+        checkouts = []
+        for i in range(25):
+            buyer = CustomUser.objects.create_user(f'buyer-{i}@example.com', 'pass-12345', 'Bo', 'Buyer')
+            checkouts.append(Checkout.objects.create(cart=Cart.objects.create(user=buyer), phone='254700000000', amount=10))
+        reserved, refused, errors = [], [], []
+
+        def reserve(checkout):
+            try:
+                reserve_stock(checkout, [(self.product.pk, 1)])
+                reserved.append(checkout.pk)
+            except InsufficientStock:
+                refused.append(checkout.pk)
+            except Exception as e:
+                errors.append(e)
+
+        run_in_threads(reserve, [(checkout,) for checkout in checkouts])
+        self.assertEqual(errors, [])
+        self.product.refresh_from_db()
+        self.assertEqual(len(reserved), 10)
+        self.assertEqual(len(refused), 15)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(StockReservation.objects.filter(status='ACTIVE').count(), 10)
+
+        release_expired_reservations(timezone.now() + timedelta(days=1))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    def test_take_stock_does_not_oversell(self):
+        taken = []
+        run_in_threads(lambda: taken.append(take_stock(self.product.pk, 3)), [()] * 8)
+        self.product.refresh_from_db()
+        self.assertEqual(taken.count(True), 3)
+        self.assertEqual(self.product.stock, 1)
+
+    def test_sweep_racing_a_paid_checkout_keeps_stock_exact(self):
+        for attempt in range(5):
+            buyer = CustomUser.objects.create_user(f'buyer-{attempt}@example.com', 'pass-12345', 'Bo', 'Buyer')
+            checkout = Checkout.objects.create(cart=Cart.objects.create(user=buyer), phone='254700000000', amount=30)
+            reserve_stock(checkout, [(self.product.pk, 3)])
+            checkout.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+            errors = []
+
+            def run(task):
+                try:
+                    task()
+                except Exception as e:
+                    errors.append(e)
+
+            # Whichever wins, the paid 3 units end up off the shelf exactly once
+            run_in_threads(run, [
+                (lambda: consume_reservations(checkout, [(self.product.pk, 3)]),),
+                (release_expired_reservations,),
+            ])
+            self.assertEqual(errors, [])
+            self.product.refresh_from_db()
+            self.assertEqual(self.product.stock, 7, f'attempt {attempt}')
+            self.assertFalse(checkout.reservations.filter(status='ACTIVE').exists())
+            Products.objects.filter(pk=self.product.pk).update(stock=10)
+
+
+class PaidCheckoutTests(TestCase):
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.customer = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.product = Products.objects.create(title='Seeds', description='Seeded', price=5, stock=10, vendor=self.vendor)
+
+    def checkout(self, request_id, cart=None, quantity=2):
+        if cart is None:
+            cart = Cart.objects.create(user=self.customer)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        checkout = Checkout.objects.create(
+            cart=cart, phone='254700000000', amount=Decimal('10'), checkout_request_id=request_id
+        )
+        reserve_stock(checkout, [(self.product.pk, quantity)])
+        return checkout
+
+    def test_repeat_amount_still_creates_order(self):
+        # An earlier (even cancelled) order with the same total must not swallow the payment
+        Order.objects.create(customer=self.customer, total_price=Decimal('10'), status='CANCELLED')
+        checkout = self.checkout('ws_1')
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+
+        self.assertTrue(Order.objects.filter(checkout_request_id='ws_1').exists())
+        self.assertEqual(set(checkout.reservations.values_list('status', flat=True)), {'CONSUMED'})
+        self.assertTrue(Cart.objects.get(pk=checkout.cart_id).is_ordered)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_duplicate_callback_is_ignored(self):
+        self.checkout('ws_1')
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_second_paid_checkout_of_cart_releases_its_stock(self):
+        first = self.checkout('ws_1')
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+        # A stale second attempt for the same cart is paid afterwards
+        Cart.objects.filter(pk=first.cart_id).update(is_ordered=False)
+        second = self.checkout('ws_2', cart=first.cart)
+        Cart.objects.filter(pk=first.cart_id).update(is_ordered=True)
+        process_stk_callback(build_stk_callback('ws_2', amount=10))
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(set(second.reservations.values_list('status', flat=True)), {'RELEASED'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_reduced_cart_line_returns_the_surplus(self):
+        checkout = self.checkout('ws_1', quantity=4)
+        CartItem.objects.filter(cart=checkout.cart).update(quantity=1)
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+
+        self.assertEqual(Order.objects.get().items.get().quantity, 1)
+        self.assertEqual(set(checkout.reservations.values_list('status', flat=True)), {'CONSUMED'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 9)
+
+    def test_removed_cart_line_returns_its_stock(self):
+        other = Products.objects.create(title='Hoe', description='Seeded', price=5, stock=10, vendor=self.vendor)
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        removed = CartItem.objects.create(cart=cart, product=other, quantity=3)
+        checkout = Checkout.objects.create(
+            cart=cart, phone='254700000000', amount=Decimal('10'), checkout_request_id='ws_1'
+        )
+        reserve_stock(checkout, [(self.product.pk, 2), (other.pk, 3)])
+        removed.delete()
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        self.assertEqual(other.stock, 10)
+        self.assertFalse(checkout.reservations.filter(status='ACTIVE').exists())
+
+    def test_late_callback_takes_released_stock_again(self):
+        checkout = self.checkout('ws_1')
+        release_expired_reservations(timezone.now() + timedelta(days=1))
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        self.assertTrue(Order.objects.filter(checkout_request_id='ws_1').exists())
+
+    def cancel(self, order):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.customer).access_token}')
+        response = client.post(f'/orders/{order.uuid}/cancel/', {'reason': 'Changed my mind'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.product.refresh_from_db()
+
+    def test_cancel_returns_the_paid_stock(self):
+        self.checkout('ws_1')
+        process_stk_callback(build_stk_callback('ws_1', amount=10))
+        order = Order.objects.get(checkout_request_id='ws_1')
+        self.cancel(order)
+        self.assertEqual(self.product.stock, 10)
+        self.assertEqual(set(order.items.values_list('status', flat=True)), {'CANCELLED'})
+
+    def test_cancel_keeps_stock_of_items_that_left_the_vendor(self):
+        other = Products.objects.create(title='Hoe', description='Forged', price=5, stock=10, vendor=self.vendor)
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=cart, product=other, quantity=3)
+        checkout = Checkout.objects.create(
+            cart=cart, phone='254700000000', amount=Decimal('25'), checkout_request_id='ws_1'
+        )
+        reserve_stock(checkout, [(self.product.pk, 2), (other.pk, 3)])
+        process_stk_callback(build_stk_callback('ws_1', amount=25))
+        order = Order.objects.get(checkout_request_id='ws_1')
+        order.items.filter(product=other).update(status='DELIVERED')
+
+        self.cancel(order)
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock, other.stock), (10, 7))
+
+    def test_cancel_of_an_order_from_before_reservations(self):
+        # Its stock was never taken, so there is nothing to give back
+        order = Order.objects.create(
+            customer=self.customer, total_price=Decimal('10'), status='PAID', checkout_request_id='ws_old'
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=2, unit_price=5, subtotal=10, vendor=self.vendor
+        )
+        self.cancel(order)
+        self.assertEqual(self.product.stock, 10)
+
+
+@override_settings(MPESA_CALLBACK_ASYNC=True)
+class CallbackInboxTests(TestCase):
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.product = Products.objects.create(title='Seeds', description='Seeded', price=5, stock=10, vendor=self.vendor)
+
+    def checkout(self, request_id):
+        buyer = CustomUser.objects.create_user(f'{request_id}@example.com', 'pass-12345', 'Bo', 'Buyer')
+        cart = Cart.objects.create(user=buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        checkout = Checkout.objects.create(cart=cart, phone='254700000000', amount=5, checkout_request_id=request_id)
+        reserve_stock(checkout, [(self.product.pk, 1)])
+        return checkout
+
+    def post_callback(self, body):
+        response = self.client.post('/mpesa-callback/', body, content_type='application/json')
+        self.assertEqual(response.json(), {'ResultCode': 0, 'ResultDesc': 'Accepted'})
+
+    def test_callbacks_are_queued_then_drained_in_batches(self):
+        for request_id in ('ws_1', 'ws_2', 'ws_3'):
+            self.checkout(request_id)
+            self.post_callback(build_stk_callback(request_id, amount=5))
+        self.assertEqual(MpesaCallbackInbox.objects.filter(status='PENDING').count(), 3)
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual([drain_callback_inbox(batch_size=2) for _ in range(3)], [2, 1, 0])
+        self.assertEqual(set(MpesaCallbackInbox.objects.values_list('status', flat=True)), {'PROCESSED'})
+        self.assertEqual(Order.objects.count(), 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+
+    def test_bad_callback_is_rolled_back_alone(self):
+        self.checkout('ws_good')
+        self.checkout('ws_bad')
+        bad = build_stk_callback('ws_bad', amount=5)
+        del bad['Body']['stkCallback']['CallbackMetadata']
+        self.post_callback(bad)
+        self.post_callback(build_stk_callback('ws_good', amount=5))
+
+        self.assertEqual(drain_callback_inbox(max_attempts=2), 2)
+        entry = MpesaCallbackInbox.objects.get(checkout_request_id='ws_bad')
+        self.assertEqual((entry.status, entry.attempts), ('PENDING', 1))
+        self.assertIn('CallbackMetadata', entry.last_error)
+        # Its savepoint undid the MpesaBody row; the good callback committed
+        self.assertFalse(MpesaBody.objects.filter(checkout__checkout_request_id='ws_bad').exists())
+        self.assertEqual(Checkout.objects.get(checkout_request_id='ws_bad').status, 'PENDING')
+        self.assertTrue(Order.objects.filter(checkout_request_id='ws_good').exists())
+
+        self.assertEqual(drain_callback_inbox(max_attempts=2), 1)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('FAILED', 2))
+        self.assertEqual(drain_callback_inbox(max_attempts=2), 0)
+
+    def test_redelivered_callback_orders_once(self):
+        self.checkout('ws_1')
+        body = build_stk_callback('ws_1', amount=5)
+        self.post_callback(body)
+        self.post_callback(body)
+        out = StringIO()
+        # The worker closes stale connections between batches, which would end the test's transaction
+        with mock.patch('checkout.management.commands.process_mpesa_callbacks.close_old_connections'):
+            call_command('process_mpesa_callbacks', '--once', stdout=out)
+        self.assertIn('Done. 2 callback(s) processed.', out.getvalue())
+
+        self.assertEqual(set(MpesaCallbackInbox.objects.values_list('status', flat=True)), {'PROCESSED'})
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 9)
+
+    def test_invalid_json_is_refused(self):
+        response = self.client.post('/mpesa-callback/', 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MpesaCallbackInbox.objects.exists())
+
+
+class DarajaClientTests(SimpleTestCase):
+    """DarajaClient against the local Daraja stub"""
+
+    def setUp(self):
+        cache.clear()
+        self.stub = DarajaStubServer(('127.0.0.1', 0))
+        self.stub.start_in_background()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+
+    def daraja_client(self):
+        return DarajaClient(
+            'key', 'secret',
+            f'{self.stub.base_url}/oauth/v1/generate?grant_type=client_credentials',
+            f'{self.stub.base_url}/mpesa/stkpush/v1/processrequest',
+        )
+
+    def push(self, client):
+        return client.stk_push({'Amount': 10, 'PhoneNumber': '254700000000'})
+
+    def test_pushes_share_one_connection_and_token(self):
+        client = self.daraja_client()
+        for _ in range(20):
+            self.assertEqual(self.push(client)['ResponseCode'], '0')
+        self.assertEqual(
+            {name: self.stub.stats[name] for name in ('connections', 'token_requests', 'stk_requests')},
+            {'connections': 1, 'token_requests': 1, 'stk_requests': 20},
+        )
+
+    def test_token_fetch_is_single_flight(self):
+        # Two clients stand in for two worker processes sharing the cache
+        clients = [self.daraja_client(), self.daraja_client()]
+        barrier = threading.Barrier(16)
+        tokens = []
+
+        def fetch(client):
+            barrier.wait()
+            tokens.append(client.get_access_token())
+
+        threads = [threading.Thread(target=fetch, args=(clients[i % 2],)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(tokens)), 1)
+        self.assertEqual(self.stub.stats['token_requests'], 1)
+
+    def test_rejected_token_is_refreshed_once(self):
+        client = self.daraja_client()
+        self.push(client)
+        self.stub.revoke_tokens()
+        self.assertEqual(self.push(client)['ResponseCode'], '0')
+        self.assertEqual(
+            {name: self.stub.stats[name] for name in ('token_requests', 'stk_requests', 'unauthorized')},
+            {'token_requests': 2, 'stk_requests': 2, 'unauthorized': 1},
+        )
+        # A new token that's rejected too isn't retried again
+        self.stub.revoke_tokens()
+        self.stub.issue_token = lambda: 'never-valid'
+        self.assertEqual(self.push(client)['errorMessage'], 'Invalid Access Token')
+        self.assertEqual((self.stub.stats['token_requests'], self.stub.stats['unauthorized']), (3, 3))
@@ -1,17 +1,21 @@
 import base64
+import logging
+import uuid
 from datetime import datetime
-import requests
 import json
 from django.conf import settings
-from .models import Checkout, MpesaBody
+from django.db import transaction
+from django.utils import timezone
+from cart.models import Cart
+from .models import Checkout, MpesaBody, MpesaCallbackInbox
+from .daraja import get_daraja_client
+from .inventory import consume_reservations, release_checkout_reservations
+
+logger = logging.getLogger(__name__)
 
 def get_access_token():
-    """Generate MPESA OAuth access token."""
-    consumer_key = settings.MPESA_CONSUMER_KEY
-    consumer_secret = settings.MPESA_CONSUMER_SECRET
-    api_url = settings.MPESA_ACCESS_TOKEN_URL
-    response = requests.get(api_url, auth=(consumer_key, consumer_secret))
-    return response.json()['access_token']
+    """Return a cached MPESA OAuth access token, refreshing it when it expires."""
+    return get_daraja_client().get_access_token()
 
 def generate_mpesa_password(shortcode, passkey):
     """Generate MPESA password for STK Push."""
@@ -21,7 +25,6 @@ def generate_mpesa_password(shortcode, passkey):
 
 def initiate_stk_push(phone, amount, account_reference, transaction_desc, callback_url):
     """Initiate MPESA Express (STK Push) transaction."""
-    access_token = get_access_token()
     shortcode = settings.MPESA_SHORTCODE
     passkey = settings.MPESA_PASSKEY
     password, timestamp = generate_mpesa_password(shortcode, passkey)
@@ -39,9 +42,7 @@ def initiate_stk_push(phone, amount, account_reference, transaction_desc, callba
         'AccountReference': account_reference,
         'TransactionDesc': transaction_desc
     }
-    headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
-    response = requests.post(settings.MPESA_STK_PUSH_URL, json=payload, headers=headers)
-    return response.json()
+    return get_daraja_client().stk_push(payload)
 
 def process_stk_callback(data):
     """Process MPESA Express callback and create Order on success."""
@@ -49,83 +50,166 @@ def process_stk_callback(data):
     result_code = data['Body']['stkCallback']['ResultCode']
     result_desc = data['Body']['stkCallback']['ResultDesc']
 
+    # Everything below commits or rolls back as one unit; the checkout row lock
+    # serializes duplicate callbacks for the same CheckoutRequestID
+    with transaction.atomic():
+        try:
+            checkout = Checkout.objects.select_for_update().get(checkout_request_id=checkout_request_id)
+        except Checkout.DoesNotExist:
+            # Log error if needed, but return accepted to M-Pesa
+            return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+
+        # Create MpesaBody record
+        MpesaBody.objects.create(
+            checkout=checkout,
+            body=data,
+            result_code=result_code,
+            result_desc=result_desc
+        )
+
+        if int(result_code) == 0:  # Success
+            checkout.status = 'SUCCESS'
+            metadata = data['Body']['stkCallback']['CallbackMetadata']['Item']
+            for item in metadata:
+                if item['Name'] == 'MpesaReceiptNumber':
+                    checkout.receipt = item['Value']
+                    break
+
+            create_order_from_checkout(checkout)
+
+        else:
+            checkout.status = 'FAILED'
+            checkout.error_message = result_desc
+            # Payment failed or was cancelled - put the reserved stock back
+            release_checkout_reservations(checkout)
+
+        checkout.save()
+    return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+
+def enqueue_stk_callback(data):
+    """Durably store a raw callback for the worker; cheap enough to run before acking Daraja."""
     try:
-        checkout = Checkout.objects.get(checkout_request_id=checkout_request_id)
-    except Checkout.DoesNotExist:
-        # Log error if needed, but return accepted to M-Pesa
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
-
-    # Create MpesaBody record
-    MpesaBody.objects.create(
-        checkout=checkout,
-        body=data,
-        result_code=result_code,
-        result_desc=result_desc
+        checkout_request_id = data['Body']['stkCallback']['CheckoutRequestID']
+    except (KeyError, TypeError):
+        checkout_request_id = None
+    return MpesaCallbackInbox.objects.create(body=data, checkout_request_id=checkout_request_id)
+
+def drain_callback_inbox(batch_size=100, max_attempts=5):
+    """
+    Apply one batch of PENDING callbacks. Rows are claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED so several workers can drain the inbox
+    side by side without blocking on, or double-processing, the same rows.
+    Returns the number of callbacks claimed.
+    """
+    with transaction.atomic():
+        entries = list(
+            MpesaCallbackInbox.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('created_at')[:batch_size]
+        )
+        for entry in entries:
+            entry.attempts += 1
+            try:
+                # Savepoint per callback: one bad payload doesn't undo the batch
+                with transaction.atomic():
+                    process_stk_callback(entry.body)
+                entry.status = 'PROCESSED'
+                entry.processed_at = timezone.now()
+                entry.last_error = None
+            except Exception as e:
+                logger.exception(f"Failed to process M-Pesa callback {entry.checkout_request_id}")
+                entry.last_error = str(e)
+                if entry.attempts >= max_attempts:
+                    entry.status = 'FAILED'
+            entry.save(update_fields=['status', 'attempts', 'last_error', 'processed_at', 'updated_at'])
+    return len(entries)
+
+def build_stk_callback(checkout_request_id, result_code=0, amount=1, phone='254700000000', receipt=None):
+    """Build a synthetic Daraja STK callback body, for local testing and load generation."""
+    callback = {
+        'MerchantRequestID': f'synthetic-{uuid.uuid4().hex[:12]}',
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': 'The service request is processed successfully.' if result_code == 0 else 'Request cancelled by user',
+    }
+    if result_code == 0:
+        callback['CallbackMetadata'] = {
+            'Item': [
+                {'Name': 'Amount', 'Value': float(amount)},
+                {'Name': 'MpesaReceiptNumber', 'Value': receipt or uuid.uuid4().hex[:10].upper()},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': int(phone) if str(phone).isdigit() else phone},
+            ]
+        }
+    return {'Body': {'stkCallback': callback}}
+
+def create_order_from_checkout(checkout):
+    """
+    Materialize an Order for a paid checkout: one query for the cart items
+    with their products, one bulk insert for the order items and one UPDATE
+    for the cart flags. Returns the new order, or None if this checkout or
+    another checkout of the same cart was already turned into one. Must run
+    inside the callback's transaction (the cart row is locked).
+    """
+    # Import here to avoid circular imports
+    from orders.models import Order, OrderItem
+    from orders.rollups import record_new_items
+
+    checkout_request_id = checkout.checkout_request_id
+    # Locked, so two paid checkouts of the same cart can't both order it
+    cart = Cart.objects.select_for_update().get(pk=checkout.cart_id)
+
+    # A repeated callback for this checkout. Its reservations were consumed
+    # with the order, so this releases nothing; it keeps the rule that a paid
+    # checkout never leaves reservations ACTIVE.
+    if Order.objects.filter(checkout_request_id=checkout_request_id).exists():
+        release_checkout_reservations(checkout)
+        return None
+
+    # Another checkout attempt for this cart was paid and ordered first. This
+    # payment needs refunding by hand; its stock goes back on the shelf.
+    if cart.is_ordered:
+        logger.warning(
+            f"Checkout {checkout_request_id} was paid for cart {cart.pk}, which another checkout "
+            f"already ordered; releasing its stock"
+        )
+        release_checkout_reservations(checkout)
+        return None
+
+    # Create the Order
+    order = Order.objects.create(
+        customer_id=cart.user_id,
+        total_price=checkout.amount,
+        status='PAID',
+        checkout_request_id=checkout_request_id,
+        phone_number=checkout.phone
     )
 
-    if int(result_code) == 0:  # Success
-        checkout.status = 'SUCCESS'
-        metadata = data['Body']['stkCallback']['CallbackMetadata']['Item']
-        for item in metadata:
-            if item['Name'] == 'MpesaReceiptNumber':
-                checkout.receipt = item['Value']
-                break
-
-        # Create Order from Cart on success
-        cart = checkout.cart
-        
-        # Import here to avoid circular imports
-        from orders.models import Order, OrderItem
-        
-        # Check if order already exists for this checkout to avoid duplicates
-        existing_order = Order.objects.filter(checkout_request_id=checkout_request_id).first()
-        if not existing_order:
-            # Also check if any successful order exists for this cart
-            cart_order = Order.objects.filter(
-                customer=cart.user,
-                total_price=checkout.amount
-            ).first()
-            
-            if not cart_order:
-                # Create the Order
-                order = Order.objects.create(
-                    customer=cart.user,
-                    total_price=checkout.amount,
-                    status='PAID',
-                    checkout_request_id=checkout_request_id,
-                    phone_number=checkout.phone
-                )
-                
-                # Create OrderItems from CartItems
-                for cart_item in cart.items.all():
-                    # Get vendor from product if it exists
-                    vendor = None
-                    if hasattr(cart_item.product, 'vendor'):
-                        vendor = cart_item.product.vendor
-                    elif hasattr(cart_item.product, 'user'):
-                        vendor = cart_item.product.user
-                        
-                    OrderItem.objects.create(
-                        order=order,
-                        product=cart_item.product,
-                        quantity=cart_item.quantity,
-                        unit_price=cart_item.unit_price,
-                        subtotal=cart_item.total_price,
-                        vendor=vendor,
-                        status='PAID',
-                        product_name=cart_item.product.title,
-                        product_image=cart_item.product.image.url if cart_item.product.image else None
-                    )
-                
-                # Mark Cart as completed
-                if hasattr(cart, 'is_ordered') and hasattr(cart, 'is_paid'):
-                    cart.is_ordered = True
-                    cart.is_paid = True
-                    cart.save()
-
-    else:
-        checkout.status = 'FAILED'
-        checkout.error_message = result_desc
-
-    checkout.save()
-    return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
\ No newline at end of file
+    # Create OrderItems from CartItems. bulk_create skips OrderItem.save(), so
+    # subtotal and the product snapshot are filled in here; the vendor is
+    # taken from product.vendor_id without loading the vendor row.
+    order_items = []
+    cart_items = list(cart.items.select_related('product'))
+    for cart_item in cart_items:
+        product = cart_item.product
+        order_items.append(OrderItem(
+            order=order,
+            product=product,
+            quantity=cart_item.quantity,
+            unit_price=cart_item.unit_price,
+            subtotal=cart_item.total_price,
+            vendor_id=product.vendor_id,
+            status='PAID',
+            product_name=product.title,
+            product_image=product.image.url if product.image else None,
+            created_at=order.created_at
+        ))
+    OrderItem.objects.bulk_create(order_items)
+    record_new_items(order_items, order.created_at)
+
+    # Stock reserved at checkout now leaves the shelf for good
+    consume_reservations(checkout, [(item.product_id, item.quantity) for item in cart_items])
+
+    # Mark Cart as completed
+    Cart.objects.filter(pk=cart.pk).update(is_ordered=True, is_paid=True, updated_at=timezone.now())
+    return order
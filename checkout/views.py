@@ -1,4 +1,7 @@
 import json
+import logging
+import requests
+from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.conf import settings
@@ -8,7 +11,10 @@ from rest_framework.response import Response
 from cart.models import Cart
 from .models import Checkout
 from .serializers import CheckoutSerializer
-from .utils import initiate_stk_push, process_stk_callback
+from .utils import initiate_stk_push, process_stk_callback, enqueue_stk_callback
+from .inventory import InsufficientStock, reserve_stock, release_cart_reservations, release_checkout_reservations
+
+logger = logging.getLogger(__name__)
 
 
 class InitiateCheckoutView(APIView):
@@ -25,7 +31,7 @@ class InitiateCheckoutView(APIView):
             return Response({'error': 'Phone number is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            cart = Cart.objects.get(id=cart_id, user=request.user, is_ordered=False, is_paid=False)
+            cart = Cart.objects.with_totals().get(id=cart_id, user=request.user, is_ordered=False, is_paid=False)
         except Cart.DoesNotExist:
             return Response({'error': 'Invalid or already processed cart.'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -37,24 +43,33 @@ class InitiateCheckoutView(APIView):
                 'existing_checkout': CheckoutSerializer(successful_checkout).data
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if cart.total_price <= 0:
+        amount = cart.total_price
+        if amount <= 0:
             return Response({'error': 'Cart is empty or total price is zero.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        amount = cart.total_price
         account_reference = f'Cart-{cart.id}'
         transaction_desc = 'Payment for e-commerce order'
         callback_url = settings.MPESA_CALLBACK_URL
 
-        response = initiate_stk_push(phone, amount, account_reference, transaction_desc, callback_url)
+        # SOLUTION 2: Always create a new checkout record, and hold the cart's
+        # stock for it before the customer is asked to pay
+        try:
+            with transaction.atomic():
+                release_cart_reservations(cart)
+                checkout = Checkout.objects.create(cart=cart, phone=phone, amount=amount)
+                reserve_stock(checkout, cart.items.values_list('product_id', 'quantity'))
+        except InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            response = initiate_stk_push(phone, amount, account_reference, transaction_desc, callback_url)
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"STK push failed for cart {cart.id}: {e}")
+            response = {'errorMessage': 'Payment service unavailable. Please try again.'}
 
         if 'ResponseCode' in response and response['ResponseCode'] == '0':
-            # SOLUTION 2: Always create a new checkout record
-            checkout = Checkout.objects.create(
-                cart=cart,
-                phone=phone,
-                amount=amount,
-                checkout_request_id=response['CheckoutRequestID']
-            )
+            checkout.checkout_request_id = response['CheckoutRequestID']
+            checkout.save(update_fields=['checkout_request_id', 'updated_at'])
 
             return Response({
                 'message': 'STK Push initiated successfully. Please check your phone.',
@@ -62,6 +77,10 @@ class InitiateCheckoutView(APIView):
             }, status=status.HTTP_200_OK)
         else:
             error = response.get('errorMessage', 'Failed to initiate STK Push.')
+            checkout.status = 'FAILED'
+            checkout.error_message = error
+            checkout.save(update_fields=['status', 'error_message', 'updated_at'])
+            release_checkout_reservations(checkout)
             return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -75,7 +94,11 @@ class MpesaCallbackView(APIView):
         except json.JSONDecodeError:
             return Response({'error': 'Invalid JSON data.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        process_stk_callback(data)
+        if settings.MPESA_CALLBACK_ASYNC:
+            # Persist and ack right away; process_mpesa_callbacks applies it
+            enqueue_stk_callback(data)
+        else:
+            process_stk_callback(data)
         return Response({'ResultCode': 0, 'ResultDesc': 'Accepted'}, status=status.HTTP_200_OK)
 
 
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from orders.models import Order ,OrderItem
+from orders.models import Order ,OrderItem, VendorSalesSummary
 
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(VendorSalesSummary)
 
 # Register your models here.
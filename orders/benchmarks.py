@@ -0,0 +1,120 @@
+# orders/benchmarks.py - Seed data for the benchmark management commands and tests
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from cart.models import Cart, CartItem
+from products.models import Products, Category
+from products.search import update_search_vectors
+from .models import Order, OrderItem
+from .rollups import rebuild_vendor_sales
+
+User = get_user_model()
+
+
+def seed_vendor_sales(items=100000, products=50, days=365, items_per_order=5, seed=0):
+    """
+    One vendor with `products` products and `items` order items spread over
+    the last `days` days. Returns the vendor.
+    """
+    rng = random.Random(seed)
+    vendor = User.objects.create_user('bench-vendor@example.com', 'bench-pass-123', 'Bench', 'Vendor', role='vendor')
+    customer = User.objects.create_user('bench-customer@example.com', 'bench-pass-123', 'Bench', 'Customer')
+    category = Category.objects.create(name='Bench')
+    catalog = Products.objects.bulk_create([
+        Products(
+            title=f'Bench product {i}', description='Seeded for benchmarks',
+            price=Decimal(rng.randint(50, 5000)), stock=1000, category=category, vendor=vendor
+        )
+        for i in range(products)
+    ])
+
+    now = timezone.now()
+    order_count = max(1, items // items_per_order)
+    orders = Order.objects.bulk_create([
+        Order(customer=customer, total_price=Decimal('0'), status='PAID')
+        for _ in range(order_count)
+    ], batch_size=2000)
+
+    batch = []
+    for index in range(items):
+        product = catalog[rng.randrange(len(catalog))]
+        quantity = rng.randint(1, 5)
+        batch.append(OrderItem(
+            order=orders[index % order_count],
+            product=product,
+            quantity=quantity,
+            unit_price=product.price,
+            subtotal=product.price * quantity,
+            vendor=vendor,
+            status=rng.choice(['PAID', 'PROCESSING', 'SHIPPED', 'DELIVERED', 'CANCELLED']),
+            product_name=product.title,
+            created_at=now - timedelta(seconds=rng.randint(0, days * 86400)),
+        ))
+        if len(batch) >= 5000:
+            OrderItem.objects.bulk_create(batch)
+            batch = []
+    OrderItem.objects.bulk_create(batch)
+    return vendor
+
+
+def create_bench_users(prefix, count, role):
+    """Users without a usable password; benchmarks authenticate them with JWTs"""
+    password = make_password(None)
+    return User.objects.bulk_create([
+        User(email=f'{prefix}-{i}@example.com', first_name='Bench', last_name=str(i), role=role, password=password)
+        for i in range(count)
+    ])
+
+
+def seed_storefront(vendors=5, products=2000, customers=50, orders_per_customer=10,
+                    items_per_order=3, cart_items=5, categories=10, seed=0):
+    """
+    A storefront dataset: vendors with products spread over categories, and
+    customers with order histories (plus the vendor sales rollup) and an
+    active cart each. Returns {'vendors', 'customers', 'products', 'categories'}.
+    """
+    rng = random.Random(seed)
+    vendor_users = create_bench_users('bench-vendor', vendors, 'vendor')
+    customer_users = create_bench_users('bench-customer', customers, 'customer')
+    category_rows = Category.objects.bulk_create([
+        Category(name=f'Bench category {i}', description='') for i in range(categories)
+    ])
+    catalog = Products.objects.bulk_create([
+        Products(
+            title=f'Bench product {i}', description=f'Seeded product {i} for storefront benchmarks',
+            price=Decimal(rng.randint(50, 5000)), stock=1000000, sku=f'BENCH-{i}',
+            category=category_rows[i % len(category_rows)], vendor=vendor_users[i % len(vendor_users)],
+        )
+        for i in range(products)
+    ], batch_size=2000)
+    update_search_vectors(Products.objects.all())
+
+    now = timezone.now()
+    orders = Order.objects.bulk_create([
+        Order(customer=customer, total_price=Decimal('0'), status='PAID')
+        for customer in customer_users for _ in range(orders_per_customer)
+    ], batch_size=2000)
+    items = []
+    for order in orders:
+        for product in rng.sample(catalog, min(items_per_order, len(catalog))):
+            quantity = rng.randint(1, 5)
+            items.append(OrderItem(
+                order=order, product=product, quantity=quantity, unit_price=product.price,
+                subtotal=product.price * quantity, vendor_id=product.vendor_id,
+                status=rng.choice(['PAID', 'PROCESSING', 'SHIPPED', 'DELIVERED']),
+                product_name=product.title,
+                created_at=now - timedelta(seconds=rng.randint(0, 90 * 86400)),
+            ))
+    OrderItem.objects.bulk_create(items, batch_size=5000)
+    rebuild_vendor_sales()
+
+    carts = Cart.objects.bulk_create([Cart(user=customer) for customer in customer_users])
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product=product, quantity=rng.randint(1, 3))
+        for cart in carts for product in rng.sample(catalog, min(cart_items, len(catalog)))
+    ], batch_size=5000)
+
+    return {'vendors': vendor_users, 'customers': customer_users, 'products': catalog, 'categories': category_rows}
@@ -0,0 +1,23 @@
+# orders/cache.py - Per-vendor cache versions for vendor analytics
+from Agroshop.cache import bump_version, get_version
+
+
+def _version_key(vendor_id):
+    return f'vendor-analytics:{vendor_id}:version'
+
+
+def get_vendor_analytics_version(vendor_id):
+    return get_version(_version_key(vendor_id))
+
+
+def bump_vendor_analytics_versions(vendor_ids):
+    """Invalidate cached analytics of vendors whose order items changed"""
+    for vendor_id in set(vendor_ids):
+        if vendor_id is not None:
+            bump_version(_version_key(vendor_id))
+
+
+def vendor_analytics_key(vendor_id, params):
+    """Cache key for one analytics query; params is a tuple of normalized query values"""
+    raw = ':'.join(str(part) for part in params)
+    return f'vendor-analytics:{vendor_id}:v{get_vendor_analytics_version(vendor_id)}:{raw}'
@@ -0,0 +1,217 @@
+import json
+import platform
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from cart.models import Cart, CartItem
+from checkout.daraja import reset_daraja_client
+from checkout.models import Checkout
+from checkout.daraja_stub import DarajaStubServer
+from checkout.utils import build_stk_callback, drain_callback_inbox
+from Agroshop.benchmarks import benchmark_database, bearer_client, measure, percentiles, timed
+from orders.benchmarks import create_bench_users, seed_storefront
+
+SCENARIOS = (
+    'public_product_list',
+    'public_product_list_cached',
+    'public_product_search',
+    'cart_view',
+    'add_to_cart',
+    'customer_order_list',
+    'vendor_order_items',
+    'checkout',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a storefront in a throwaway database and report latency percentiles and "
+        "query counts for the main API endpoints as JSON, for run-to-run comparison"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendors', type=int, default=5)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--orders-per-customer', type=int, default=10)
+        parser.add_argument('--cart-items', type=int, default=5)
+        parser.add_argument('--runs', type=int, default=50, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Only run these scenarios (repeatable; default: all)')
+        parser.add_argument('--callback-mode', choices=('sync', 'async'),
+                            help='How the M-Pesa callback is handled (default: MPESA_CALLBACK_ASYNC)')
+        parser.add_argument('--output', help='Also write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        scenarios = options['scenario'] or SCENARIOS
+
+        with benchmark_database():
+            self.stderr.write(
+                f"Seeding {options['vendors']} vendors, {options['products']} products and "
+                f"{options['customers']} customers..."
+            )
+            data = seed_storefront(
+                vendors=options['vendors'],
+                products=options['products'],
+                customers=options['customers'],
+                orders_per_customer=options['orders_per_customer'],
+                cart_items=options['cart_items'],
+                seed=options['seed'],
+            )
+            results = {}
+            for name in scenarios:
+                self.stderr.write(f"Running {name}...")
+                results.update(getattr(self, f'bench_{name}')(data, options))
+
+        report = {
+            'config': {key: options[key] for key in (
+                'vendors', 'products', 'customers', 'orders_per_customer', 'cart_items', 'runs', 'warmup', 'seed',
+            )},
+            'environment': {
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'python': platform.python_version(),
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        self.stdout.write(output)
+
+    def run(self, request, options, expect=(200,)):
+        """Warm up, then measure `runs` calls of request(index)"""
+        for index in range(options['warmup']):
+            request(index)
+        return measure(request, options['runs'], expect=expect)
+
+    def customer_clients(self, data):
+        return [bearer_client(customer) for customer in data['customers']]
+
+    def bench_public_product_list(self, data, options):
+        client = bearer_client(data['customers'][0])
+        categories = data['categories']
+
+        def cold(index):
+            cache.clear()
+            category = categories[index % len(categories)].pk
+            return client.get(f'/products/public/?category={category}&ordering=price&page_size=20&facets=true')
+
+        return {'public_product_list': self.run(cold, options)}
+
+    def bench_public_product_list_cached(self, data, options):
+        client = bearer_client(data['customers'][0])
+        cache.clear()
+        return {'public_product_list_cached': self.run(
+            lambda index: client.get('/products/public/?ordering=price&page_size=20'), options
+        )}
+
+    def bench_public_product_search(self, data, options):
+        client = bearer_client(data['customers'][0])
+
+        def search(index):
+            cache.clear()
+            return client.get(f'/products/public/?search=product {index % 100}&in_stock=true&page_size=20')
+
+        return {'public_product_search': self.run(search, options)}
+
+    def bench_cart_view(self, data, options):
+        clients = self.customer_clients(data)
+        return {'cart_view': self.run(lambda index: clients[index % len(clients)].get('/cart/'), options)}
+
+    def bench_add_to_cart(self, data, options):
+        clients = self.customer_clients(data)
+        products = data['products']
+
+        def add(index):
+            product = products[(index * 7) % len(products)]
+            return clients[index % len(clients)].post(
+                '/cart/add/', {'product_id': product.pk, 'quantity': 1}, format='json'
+            )
+
+        return {'add_to_cart': self.run(add, options, expect=(201,))}
+
+    def bench_customer_order_list(self, data, options):
+        clients = self.customer_clients(data)
+        return {'customer_order_list': self.run(
+            lambda index: clients[index % len(clients)].get('/orders/'), options
+        )}
+
+    def bench_vendor_order_items(self, data, options):
+        clients = [bearer_client(vendor) for vendor in data['vendors']]
+        return {'vendor_order_items': self.run(
+            lambda index: clients[index % len(clients)].get('/vendor/order-items/'), options
+        )}
+
+    def bench_checkout(self, data, options):
+        """
+        InitiateCheckoutView against a local Daraja stub (real HTTP, pooled
+        client), then the M-Pesa callback for each checkout.
+        """
+        async_callbacks = settings.MPESA_CALLBACK_ASYNC
+        if options['callback_mode']:
+            async_callbacks = options['callback_mode'] == 'async'
+
+        # Fresh customers, so every checkout has its own cart and amount
+        total = options['warmup'] + options['runs']
+        customers = create_bench_users('bench-checkout', total, 'customer')
+        products = data['products']
+        carts = Cart.objects.bulk_create([Cart(user=customer) for customer in customers])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=products[(index * 13 + offset) % len(products)], quantity=offset + 1)
+            for index, cart in enumerate(carts) for offset in range(2)
+        ])
+        clients = [bearer_client(customer) for customer in customers]
+
+        stub = DarajaStubServer(('127.0.0.1', 0))
+        stub.start_in_background()
+        try:
+            with override_settings(
+                MPESA_CONSUMER_KEY='bench',
+                MPESA_CONSUMER_SECRET='bench',
+                MPESA_PASSKEY='bench',
+                MPESA_ACCESS_TOKEN_URL=f'{stub.base_url}/oauth/v1/generate?grant_type=client_credentials',
+                MPESA_STK_PUSH_URL=f'{stub.base_url}/mpesa/stkpush/v1/processrequest',
+                MPESA_CALLBACK_ASYNC=async_callbacks,
+            ):
+                reset_daraja_client()
+
+                def initiate(index):
+                    return clients[index].post(
+                        '/initiate/', {'cart_id': carts[index].pk, 'phone': '254700000000'}, format='json'
+                    )
+
+                def callback(index):
+                    payload = build_stk_callback(checkout_ids[carts[index].pk], amount=Decimal('1'))
+                    return clients[index].post('/mpesa-callback/', payload, format='json')
+
+                # Warm-up calls use the first carts, timed calls the rest
+                warmup = options['warmup']
+                for index in range(warmup):
+                    initiate(index)
+                results = {'checkout_initiate': measure(lambda index: initiate(warmup + index), options['runs'])}
+
+                checkout_ids = dict(
+                    Checkout.objects.filter(cart__in=carts).values_list('cart_id', 'checkout_request_id')
+                )
+                for index in range(warmup):
+                    callback(index)
+                results['mpesa_callback'] = measure(lambda index: callback(warmup + index), options['runs'])
+                if async_callbacks:
+                    # The callback only queued the payment; time applying the queue
+                    results['mpesa_callback_drain'] = percentiles(timed(drain_callback_inbox, 1))
+                results['mpesa_callback']['mode'] = 'async' if async_callbacks else 'sync'
+                results['daraja_stub'] = dict(stub.stats)
+        finally:
+            stub.shutdown()
+            stub.server_close()
+            reset_daraja_client()
+        return results
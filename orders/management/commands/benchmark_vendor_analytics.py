@@ -0,0 +1,40 @@
+import json
+from datetime import timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+from Agroshop.benchmarks import benchmark_database, percentiles, timed
+from orders.benchmarks import seed_vendor_sales
+
+
+class Command(BaseCommand):
+    help = "Seed a vendor's sales in a throwaway database and time the vendor analytics endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000)
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--runs', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.stderr.write(f"Seeding {options['items']} order items...")
+            vendor = seed_vendor_sales(items=options['items'], products=options['products'])
+            client = APIClient()
+            client.force_authenticate(vendor)
+
+            # One year, every product of the vendor
+            start = timezone.localdate() - timedelta(days=364)
+            results = {'items': options['items'], 'products': options['products']}
+            for interval in ('day', 'week', 'month'):
+                url = f'/vendor/analytics/?interval={interval}&start={start.isoformat()}'
+
+                def cold():
+                    cache.clear()
+                    response = client.get(url)
+                    assert response.status_code == 200, response.content
+
+                results[f'{interval}_cold'] = percentiles(timed(cold, options['runs']))
+                results[f'{interval}_cached'] = percentiles(timed(lambda: client.get(url), options['runs']))
+
+            self.stdout.write(json.dumps(results, indent=2))
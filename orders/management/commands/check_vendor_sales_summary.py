@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.rollups import diff_vendor_sales
+
+
+class Command(BaseCommand):
+    help = "Compare the VendorSalesSummary rollup against a full recompute from OrderItems"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, help='Only check this vendor id')
+
+    def handle(self, *args, **options):
+        diff = diff_vendor_sales(options['vendor'])
+        if not diff:
+            self.stdout.write(self.style.SUCCESS("Vendor sales summary is consistent."))
+            return
+
+        for (vendor_id, status, day), (stored, expected) in sorted(diff.items(), key=lambda kv: str(kv[0])):
+            self.stdout.write(
+                f"vendor={vendor_id} status={status} day={day}: "
+                f"stored={stored} expected={expected}"
+            )
+        raise CommandError(
+            f"{len(diff)} bucket(s) differ. Run rebuild_vendor_sales_summary to repair."
+        )
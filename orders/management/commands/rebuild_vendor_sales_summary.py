@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders.rollups import rebuild_vendor_sales
+
+
+class Command(BaseCommand):
+    help = "Recompute the VendorSalesSummary rollup from OrderItems"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, help='Only rebuild this vendor id')
+
+    def handle(self, *args, **options):
+        rows = rebuild_vendor_sales(options['vendor'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt vendor sales summary: {rows} row(s)."))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_vendor_sales(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    VendorSalesSummary = apps.get_model('orders', 'VendorSalesSummary')
+    rows = (
+        OrderItem.objects.filter(vendor__isnull=False)
+        .annotate(day=TruncDate('order__created_at'))
+        .order_by()
+        .values('vendor_id', 'status', 'day')
+        .annotate(items=Count('id'), units=Sum('quantity'), revenue=Sum('subtotal'))
+    )
+    VendorSalesSummary.objects.bulk_create([
+        VendorSalesSummary(
+            vendor_id=row['vendor_id'], status=row['status'], day=row['day'],
+            item_count=row['items'], units=row['units'], revenue=row['revenue']
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_auto_20250818_0001'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorSalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PAID', 'Paid'), ('PROCESSING', 'Processing'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled'), ('REFUNDED', 'Refunded')], max_length=20)),
+                ('day', models.DateField()),
+                ('item_count', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('vendor', 'status', 'day'), name='unique_vendor_status_day')],
+            },
+        ),
+        migrations.RunPython(populate_vendor_sales, migrations.RunPython.noop),
+    ]
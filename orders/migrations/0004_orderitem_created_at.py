@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:34
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_order_created_at(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    OrderItem.objects.update(
+        created_at=Subquery(Order.objects.filter(pk=OuterRef('order_id')).values('created_at')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_vendorsalessummary'),
+        ('products', '0007_product_search_and_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_order_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['vendor', 'created_at'], name='orderitem_vendor_created_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 import uuid
 from django.db import models
+from django.db.models import OuterRef, Subquery, Sum, Prefetch
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from products.models import Products
 
@@ -21,6 +24,27 @@ class TimeStampedModel(models.Model):
     class Meta:
         abstract = True
 
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate the item quantity per order. A correlated subquery rather than
+        a join, so it stays right when the queryset is filtered on items.
+        """
+        quantities = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        return self.annotate(items_quantity=Coalesce(Subquery(quantities), 0))
+
+    def with_items(self):
+        """Load customer, items, products and vendors in a fixed number of queries"""
+        return self.select_related('customer').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product', 'vendor'))
+        )
+
 class Order(UniversalIdModel, TimeStampedModel):
     ORDER_STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -52,6 +76,8 @@ class Order(UniversalIdModel, TimeStampedModel):
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         return f"Order {self.uuid} for {self.customer.email} ({self.status})"
     
@@ -63,7 +89,13 @@ class Order(UniversalIdModel, TimeStampedModel):
     @property
     def total_items(self):
         """Total number of items in this order"""
-        return sum(item.quantity for item in self.items.all())
+        # Prefer the with_totals() annotation, then prefetched items, then one aggregate query
+        if hasattr(self, 'items_quantity'):
+            return self.items_quantity
+        items = getattr(self, '_prefetched_objects_cache', {}).get('items')
+        if items is not None:
+            return sum(item.quantity for item in items)
+        return self.items.aggregate(total=Sum('quantity'))['total'] or 0
     
     @property
     def can_be_cancelled(self):
@@ -113,6 +145,9 @@ class OrderItem(models.Model):
     product_name = models.CharField(max_length=255)
     product_image = models.URLField(blank=True, null=True)
 
+    # Copy of order.created_at so vendor analytics can range-scan items directly
+    created_at = models.DateTimeField(default=timezone.now)
+
     def __str__(self):
         return f"{self.quantity} x {self.product_name} in {self.order.order_number} ({self.status})"
     
@@ -130,4 +165,31 @@ class OrderItem(models.Model):
         super().save(*args, **kwargs)
 
     class Meta:
-        ordering = ['product_name']
\ No newline at end of file
+        ordering = ['product_name']
+        indexes = [
+            models.Index(fields=['vendor', 'created_at'], name='orderitem_vendor_created_idx'),
+        ]
+class VendorSalesSummary(models.Model):
+    """
+    Per vendor, per item status, per day rollup of OrderItems, maintained
+    incrementally by orders.rollups so the vendor dashboard doesn't rescan
+    sales history. Rebuild with `manage.py rebuild_vendor_sales_summary`.
+    """
+    vendor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='sales_summaries'
+    )
+    status = models.CharField(max_length=20, choices=OrderItem.ITEM_STATUS_CHOICES)
+    day = models.DateField()
+    item_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'status', 'day'], name='unique_vendor_status_day')
+        ]
+
+    def __str__(self):
+        return f"{self.vendor_id} {self.status} {self.day}: {self.item_count} items"
@@ -0,0 +1,186 @@
+# orders/rollups.py - Incremental maintenance of VendorSalesSummary and Order.status
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Order, OrderItem, VendorSalesSummary
+from .cache import bump_vendor_analytics_versions
+
+
+def _bucket(vendor_id, status, created_at):
+    return (vendor_id, status, timezone.localdate(created_at))
+
+
+def apply_deltas(deltas):
+    """
+    Add {(vendor_id, status, day): (items, units, revenue)} onto the rollup.
+    Counters move with F() updates, so concurrent writers never lose each
+    other's increments; a missing row is created, with a retry if another
+    writer created it first.
+    """
+    # Fixed order so concurrent writers touch rows in the same sequence
+    for (vendor_id, status, day), (items, units, revenue) in sorted(deltas.items()):
+        if vendor_id is None or not (items or units or revenue):
+            continue
+        lookup = {'vendor_id': vendor_id, 'status': status, 'day': day}
+        increments = {
+            'item_count': F('item_count') + items,
+            'units': F('units') + units,
+            'revenue': F('revenue') + revenue,
+        }
+        if VendorSalesSummary.objects.filter(**lookup).update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                VendorSalesSummary.objects.create(item_count=items, units=units, revenue=revenue, **lookup)
+        except IntegrityError:
+            VendorSalesSummary.objects.filter(**lookup).update(**increments)
+
+    # The same events change what vendor analytics report
+    vendor_ids = [vendor_id for (vendor_id, _, _) in deltas]
+    transaction.on_commit(lambda: bump_vendor_analytics_versions(vendor_ids))
+
+
+def record_new_items(order_items, created_at):
+    """Count freshly created OrderItems of an order placed at created_at"""
+    deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+    for item in order_items:
+        delta = deltas[_bucket(item.vendor_id, item.status, created_at)]
+        delta[0] += 1
+        delta[1] += item.quantity
+        delta[2] += item.subtotal
+    apply_deltas(deltas)
+
+
+def record_status_change(rows, new_status):
+    """
+    Move items between status buckets. rows are dicts with vendor_id, status
+    (the old one), quantity, subtotal and order__created_at, as returned by
+    OrderItem.objects.values(*STATUS_CHANGE_FIELDS) before the update.
+    """
+    deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+    for row in rows:
+        if row['status'] == new_status:
+            continue
+        for status, sign in ((row['status'], -1), (new_status, 1)):
+            delta = deltas[_bucket(row['vendor_id'], status, row['order__created_at'])]
+            delta[0] += sign
+            delta[1] += sign * row['quantity']
+            delta[2] += sign * row['subtotal']
+    apply_deltas(deltas)
+
+
+STATUS_CHANGE_FIELDS = ('vendor_id', 'status', 'quantity', 'subtotal', 'order__created_at')
+
+
+def derive_order_status(counts):
+    """
+    Order status implied by per-status item counts, or None to leave it as is:
+    all delivered, all cancelled, else any shipped, else any processing.
+    """
+    if counts['delivered'] == counts['total']:
+        return 'DELIVERED'
+    if counts['cancelled'] == counts['total']:
+        return 'CANCELLED'
+    if counts['shipped']:
+        return 'SHIPPED'
+    if counts['processing']:
+        return 'PROCESSING'
+    return None
+
+
+def sync_order_statuses(order_ids):
+    """
+    Re-derive Order.status from the items of the given orders with one grouped
+    aggregate and write it back with one UPDATE, which also touches updated_at
+    so order ETags change. Callers hold select_for_update locks on the orders
+    so concurrent item updates can't interleave. Returns {order_id: status}
+    for the orders whose status was derived.
+    """
+    if not order_ids:
+        return {}
+    counts = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by()
+        .values('order_id')
+        .annotate(
+            total=Count('id'),
+            delivered=Count('id', filter=Q(status='DELIVERED')),
+            cancelled=Count('id', filter=Q(status='CANCELLED')),
+            shipped=Count('id', filter=Q(status='SHIPPED')),
+            processing=Count('id', filter=Q(status='PROCESSING')),
+        )
+    )
+    statuses = {}
+    for row in counts:
+        derived = derive_order_status(row)
+        if derived:
+            statuses[row['order_id']] = derived
+
+    by_status = defaultdict(list)
+    for order_id, derived in statuses.items():
+        by_status[derived].append(order_id)
+    new_status = Case(
+        *[When(pk__in=ids, then=Value(derived)) for derived, ids in sorted(by_status.items())],
+        default=F('status'),
+        output_field=CharField(),
+    )
+    Order.objects.filter(pk__in=order_ids).update(status=new_status, updated_at=timezone.now())
+    return statuses
+
+
+def compute_vendor_sales(vendor_id=None):
+    """Full recompute from OrderItem: {(vendor_id, status, day): (items, units, revenue)}"""
+    items = OrderItem.objects.filter(vendor__isnull=False)
+    if vendor_id is not None:
+        items = items.filter(vendor_id=vendor_id)
+    rows = (
+        items.annotate(day=TruncDate('order__created_at'))
+        .order_by()
+        .values('vendor_id', 'status', 'day')
+        .annotate(items=Count('id'), units=Sum('quantity'), revenue=Sum('subtotal'))
+    )
+    return {
+        (row['vendor_id'], row['status'], row['day']): (row['items'], row['units'], row['revenue'])
+        for row in rows
+    }
+
+
+def stored_vendor_sales(vendor_id=None):
+    summaries = VendorSalesSummary.objects.all()
+    if vendor_id is not None:
+        summaries = summaries.filter(vendor_id=vendor_id)
+    return {
+        (row.vendor_id, row.status, row.day): (row.item_count, row.units, row.revenue)
+        for row in summaries
+        # Rows that netted out to zero are equivalent to no row at all
+        if row.item_count or row.units or row.revenue
+    }
+
+
+def diff_vendor_sales(vendor_id=None):
+    """Buckets where the rollup disagrees with a full recompute: {key: (stored, expected)}"""
+    expected = compute_vendor_sales(vendor_id)
+    stored = stored_vendor_sales(vendor_id)
+    return {
+        key: (stored.get(key), expected.get(key))
+        for key in set(expected) | set(stored)
+        if stored.get(key) != expected.get(key)
+    }
+
+
+def rebuild_vendor_sales(vendor_id=None):
+    """Replace the rollup with a full recompute. Returns the number of rows written."""
+    expected = compute_vendor_sales(vendor_id)
+    with transaction.atomic():
+        summaries = VendorSalesSummary.objects.all()
+        if vendor_id is not None:
+            summaries = summaries.filter(vendor_id=vendor_id)
+        summaries.delete()
+        VendorSalesSummary.objects.bulk_create([
+            VendorSalesSummary(vendor_id=vendor, status=status, day=day, item_count=items, units=units, revenue=revenue)
+            for (vendor, status, day), (items, units, revenue) in expected.items()
+        ], batch_size=1000)
+    return len(expected)
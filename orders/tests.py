@@ -1,3 +1,245 @@
-from django.test import TestCase
+import random
+from datetime import timedelta
+import threading
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from products.models import Products
+from users.authentication import get_user_status
+from users.models import CustomUser
+from Agroshop.benchmarks import measure
+from .benchmarks import seed_storefront
+from .models import Order, OrderItem, VendorSalesSummary
+from .rollups import compute_vendor_sales, diff_vendor_sales, rebuild_vendor_sales
 
-# Create your tests here.
+
+def bearer_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+class OrderTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.customer = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.products = [
+            Products.objects.create(title=f'Product {i}', description='Seeded', price=5, stock=100, vendor=self.vendor)
+            for i in range(6)
+        ]
+        # Cache the users' auth status, so counts cover the view's own queries
+        get_user_status(self.vendor.pk)
+        get_user_status(self.customer.pk)
+
+    def create_orders(self, count, items_per_order):
+        for _ in range(count):
+            order = Order.objects.create(customer=self.customer, total_price=Decimal('10'), status='PAID')
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order, product=product, quantity=2, unit_price=product.price,
+                    subtotal=product.price * 2, vendor=self.vendor, product_name=product.title,
+                )
+                for product in self.products[:items_per_order]
+            ])
+        return order
+
+
+class OrderQueryCountTests(OrderTestCase):
+    """Order reads cost the same number of queries for 1 order of 1 item or a page of 10 x 6"""
+
+    def assertQueriesConstant(self, num, client, url_for_order):
+        for count, items_per_order in ((1, 1), (9, 6)):
+            order = self.create_orders(count, items_per_order)
+            with self.assertNumQueries(num):
+                response = client.get(url_for_order(order))
+            self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_customer_order_list(self):
+        # ETag validators, page count, orders, prefetched items, summary
+        response = self.assertQueriesConstant(5, bearer_client(self.customer), lambda order: '/orders/')
+        orders = response.json()['results']['orders']
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(orders[0]['total_items'], 12)
+
+    def test_order_detail(self):
+        # Validators, order, prefetched items
+        response = self.assertQueriesConstant(
+            3, bearer_client(self.customer), lambda order: f'/orders/{order.uuid}/'
+        )
+        self.assertEqual(len(response.json()['items']), 6)
+
+    def test_vendor_order_items(self):
+        # Page count, items, status counts from the rollup
+        self.assertQueriesConstant(3, bearer_client(self.vendor), lambda order: '/vendor/order-items/')
+
+
+class ConditionalOrderReadTests(OrderTestCase):
+    """Order reads answer If-None-Match / If-Modified-Since with 304 until the order changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_orders(1, 2)
+        self.client = bearer_client(self.customer)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for validator in ({'If-None-Match': response['ETag']}, {'If-Modified-Since': response['Last-Modified']}):
+            revalidated = self.client.get(url, headers=validator)
+            self.assertEqual(revalidated.status_code, 304, validator)
+            self.assertEqual(revalidated.content, b'')
+        return response
+
+    def test_order_list(self):
+        response = self.assertRevalidates('/orders/')
+        # Each query string is its own representation
+        self.assertNotEqual(self.client.get('/orders/?page=1')['ETag'], response['ETag'])
+
+        self.create_orders(1, 1)
+        changed = self.client.get('/orders/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(changed.json()['results']['summary']['total_orders'], 2)
+
+    def test_order_detail(self):
+        url = f'/orders/{self.order.uuid}/'
+        response = self.assertRevalidates(url)
+
+        self.order.status = 'SHIPPED'
+        self.order.save()
+        changed = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['status'], 'SHIPPED')
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_order_detail_follows_its_products(self):
+        url = f'/orders/{self.order.uuid}/'
+        etag = self.client.get(url)['ETag']
+        self.products[0].title = 'Renamed'
+        self.products[0].save()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_other_customers_get_no_validator(self):
+        stranger = CustomUser.objects.create_user('stranger@example.com', 'pass-12345', 'Sam', 'Stranger')
+        response = bearer_client(stranger).get(f'/orders/{self.order.uuid}/', headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ConcurrentStatusUpdateTests(TransactionTestCase):
+    """Vendors updating item statuses side by side keep the sales rollup exact"""
+
+    def test_rollup_matches_recompute(self):
+        vendors = [
+            CustomUser.objects.create_user(f'vendor-{i}@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+            for i in range(3)
+        ]
+        customer = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        items = {vendor.pk: [] for vendor in vendors}
+        for _ in range(4):
+            # Every order has items from every vendor, so their updates contend
+            order = Order.objects.create(customer=customer, total_price=Decimal('60'), status='PAID')
+            for vendor in vendors:
+                product = Products.objects.create(title='Seeds', description='Seeded', price=5, stock=100, vendor=vendor)
+                for _ in range(2):
+                    item = OrderItem.objects.create(
+                        order=order, product=product, quantity=2, unit_price=5, subtotal=10,
+                        vendor=vendor, product_name=product.title, status='PAID',
+                    )
+                    items[vendor.pk].append(item.pk)
+        rebuild_vendor_sales()
+        tokens = {vendor.pk: str(RefreshToken.for_user(vendor).access_token) for vendor in vendors}
+        errors = []
+        barrier = threading.Barrier(len(vendors) * 2)
+
+        def update(vendor_id, seed):
+            rng = random.Random(seed)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[vendor_id]}')
+            barrier.wait()
+            try:
+                for _ in range(6):
+                    new_status = rng.choice(['PROCESSING', 'SHIPPED', 'DELIVERED', 'CANCELLED'])
+                    if rng.random() < 0.5:
+                        response = client.patch(
+                            f'/vendor/order-items/{rng.choice(items[vendor_id])}/status/',
+                            {'status': new_status}, format='json',
+                        )
+                    else:
+                        response = client.patch('/vendor/order-items/status/', {
+                            'item_ids': rng.sample(items[vendor_id], 3), 'status': new_status,
+                        }, format='json')
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=update, args=(vendor.pk, seed))
+            for seed, vendor in enumerate(vendors * 2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(diff_vendor_sales(), {})
+        self.assertEqual(sum(items for items, _, _ in compute_vendor_sales().values()), 24)
+
+
+class StorefrontBenchmarkTests(TestCase):
+    """
+    The benchmark_storefront scenarios on a small seeded storefront, checking
+    query counts against budgets rather than timing them
+    """
+    # Most queries any single request of the endpoint may run
+    budgets = {
+        '/products/public/?page_size=20&facets=true': 2,
+        '/cart/': 3,
+        '/orders/': 5,
+        '/vendor/order-items/': 3,
+        '/vendor/analytics/?interval=week': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_storefront(vendors=2, products=40, customers=4, orders_per_customer=5, cart_items=3)
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = self.data['vendors'][0]
+        self.customer = self.data['customers'][0]
+
+    def test_query_budgets(self):
+        clients = {'customer': bearer_client(self.customer), 'vendor': bearer_client(self.vendor)}
+        for url, budget in self.budgets.items():
+            client = clients['vendor' if url.startswith('/vendor/') else 'customer']
+            # The first run builds the page uncached; max covers it
+            cache.clear()
+            get_user_status(self.customer.pk)
+            get_user_status(self.vendor.pk)
+            result = measure(lambda index: client.get(url), runs=3)
+            with self.subTest(url=url):
+                self.assertLessEqual(result['queries']['max'], budget)
+                self.assertLessEqual(result['queries']['max'], settings.REQUEST_QUERY_BUDGET)
+
+    def test_analytics_totals_match_rollup(self):
+        today = timezone.localdate()
+        response = bearer_client(self.vendor).get(
+            f'/vendor/analytics/?interval=month&start={today - timedelta(days=120)}&end={today}'
+        )
+        self.assertEqual(response.status_code, 200)
+        totals = response.json()['totals']
+        self.assertGreater(totals['units'], 0)
+
+        rollup = VendorSalesSummary.objects.filter(vendor=self.vendor).exclude(status__in=['CANCELLED', 'REFUNDED'])
+        self.assertEqual(totals['units'], sum(row.units for row in rollup))
+        self.assertEqual(Decimal(totals['revenue']), sum(row.revenue for row in rollup))
+        self.assertEqual(diff_vendor_sales(self.vendor.pk), {})
@@ -1,4 +1,5 @@
 from django.urls import path
+from Agroshop.asyncviews import async_or_sync_view
 from . import views
 
 app_name = 'orders'
@@ -6,12 +7,14 @@ app_name = 'orders'
 urlpatterns = [
     # Customer order management
     path('orders/', views.CustomerOrderListView.as_view(), name='customer-order-list'),
-    path('orders/<uuid:order_uuid>/', views.OrderDetailView.as_view(), name='order-detail'),
+    path('orders/<uuid:order_uuid>/', async_or_sync_view(views.AsyncOrderDetailView), name='order-detail'),
     path('orders/<uuid:order_uuid>/cancel/', views.CancelOrderView.as_view(), name='cancel-order'),
     
     # Vendor order item management
     path('vendor/order-items/', views.VendorOrderItemsView.as_view(), name='vendor-order-items'),
+    path('vendor/order-items/status/', views.BulkUpdateOrderItemStatusView.as_view(), name='bulk-update-order-item-status'),
     path('vendor/order-items/<int:item_id>/status/', views.UpdateOrderItemStatusView.as_view(), name='update-order-item-status'),
+    path('vendor/analytics/', views.VendorAnalyticsView.as_view(), name='vendor-analytics'),
     
     # Utility endpoints
     path('status-choices/', views.OrderStatusChoicesView.as_view(), name='order-status-choices'),
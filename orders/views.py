@@ -4,9 +4,23 @@ from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum
-from .models import Order, OrderItem
+from django.db import transaction
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.db.models import DateField
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from django.db.models import Q, Sum, Max, Count
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import hashlib
+from .models import Order, OrderItem, VendorSalesSummary
+from .rollups import record_status_change, sync_order_statuses, STATUS_CHANGE_FIELDS
+from .cache import vendor_analytics_key
 from .serializers import OrderSerializer, OrderItemSerializer, OrderCreateSerializer
+from checkout.inventory import return_stock, stock_was_taken
+from Agroshop.asyncviews import AsyncAPIView
 
 class IsCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -23,27 +37,87 @@ class OrderPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 50
 
+def _hash_validators(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def customer_orders_validators(request):
+    """Count and newest timestamps of the customer's orders, in one query"""
+    if not hasattr(request, '_orders_validators'):
+        request._orders_validators = Order.objects.filter(customer=request.user).aggregate(
+            order_count=Count('id', distinct=True),
+            orders_updated=Max('updated_at'),
+            products_updated=Max('items__product__updated_at'),
+        )
+    return request._orders_validators
+
+def customer_orders_etag(request, *args, **kwargs):
+    validators = customer_orders_validators(request)
+    return _hash_validators(
+        request.user.id, request.get_full_path(), validators['order_count'],
+        validators['orders_updated'], validators['products_updated']
+    )
+
+def customer_orders_last_modified(request, *args, **kwargs):
+    return customer_orders_validators(request)['orders_updated']
+
+ORDER_VALIDATORS = {
+    'order_updated': Max('updated_at'),
+    'products_updated': Max('items__product__updated_at'),
+}
+
+def order_validator_scope(user, order_uuid):
+    """The order (as a queryset) whose timestamps validate user's order detail response"""
+    role = getattr(user, 'role', None)
+    if role == 'customer':
+        return Order.objects.filter(uuid=order_uuid, customer=user)
+    if role == 'vendor':
+        return Order.objects.filter(uuid=order_uuid, items__vendor=user)
+    return Order.objects.none()
+
+def order_detail_validators(request, order_uuid):
+    """Timestamps of a single order visible to the requesting user"""
+    if not hasattr(request, '_order_validators'):
+        request._order_validators = order_validator_scope(request.user, order_uuid).aggregate(**ORDER_VALIDATORS)
+    return request._order_validators
+
+async def aorder_detail_validators(request, order_uuid):
+    """order_detail_validators() for async views"""
+    return await order_validator_scope(request.user, order_uuid).aaggregate(**ORDER_VALIDATORS)
+
+def order_etag(order_uuid, validators):
+    if validators['order_updated'] is None:
+        return None
+    return _hash_validators(order_uuid, validators['order_updated'], validators['products_updated'])
+
+def order_detail_etag(request, order_uuid):
+    return order_etag(order_uuid, order_detail_validators(request, order_uuid))
+
+def order_detail_last_modified(request, order_uuid):
+    return order_detail_validators(request, order_uuid)['order_updated']
+
 class CustomerOrderListView(APIView):
     """Customer can view their order history"""
     permission_classes = [IsCustomer]
     pagination_class = OrderPagination
 
+    @method_decorator(condition(etag_func=customer_orders_etag, last_modified_func=customer_orders_last_modified))
     def get(self, request):
         try:
-            orders = Order.objects.filter(customer=request.user)
+            orders = Order.objects.filter(customer=request.user).with_totals().with_items()
             
             # Filter by status if provided
             status_filter = request.query_params.get('status')
             if status_filter:
                 orders = orders.filter(status=status_filter)
             
-            # Search by order number
+            # Search by order number or product name. A subquery instead of a
+            # join keeps rows unique, so no DISTINCT is needed below
             search = request.query_params.get('search')
             if search:
                 orders = orders.filter(
                     Q(uuid__icontains=search) | 
-                    Q(items__product_name__icontains=search)
-                ).distinct()
+                    Q(id__in=OrderItem.objects.filter(product_name__icontains=search).values('order_id'))
+                )
             
             # Pagination
             paginator = OrderPagination()
@@ -51,18 +125,23 @@ class CustomerOrderListView(APIView):
             
             serializer = OrderSerializer(paginated_orders, many=True)
             
-            # Summary stats
-            total_orders = orders.count()
-            total_spent = orders.aggregate(total=Sum('total_price'))['total'] or 0
+            # Summary stats: the paginator already counted the orders, the
+            # rest comes from one conditional aggregation
+            summary = orders.aggregate(
+                total_spent=Sum('total_price'),
+                pending_orders=Count('id', filter=Q(status='PENDING')),
+                shipped_orders=Count('id', filter=Q(status='SHIPPED')),
+                delivered_orders=Count('id', filter=Q(status='DELIVERED')),
+            )
             
             response_data = {
                 'orders': serializer.data,
                 'summary': {
-                    'total_orders': total_orders,
-                    'total_spent': float(total_spent),
-                    'pending_orders': orders.filter(status='PENDING').count(),
-                    'shipped_orders': orders.filter(status='SHIPPED').count(),
-                    'delivered_orders': orders.filter(status='DELIVERED').count(),
+                    'total_orders': paginator.page.paginator.count,
+                    'total_spent': float(summary['total_spent'] or 0),
+                    'pending_orders': summary['pending_orders'],
+                    'shipped_orders': summary['shipped_orders'],
+                    'delivered_orders': summary['delivered_orders'],
                 }
             }
             
@@ -78,14 +157,16 @@ class OrderDetailView(APIView):
     """View specific order details"""
     permission_classes = [permissions.IsAuthenticated]
 
+    @method_decorator(condition(etag_func=order_detail_etag, last_modified_func=order_detail_last_modified))
     def get(self, request, order_uuid):
         try:
+            orders = Order.objects.with_totals().with_items()
             if request.user.role == 'customer':
-                order = get_object_or_404(Order, uuid=order_uuid, customer=request.user)
+                order = get_object_or_404(orders, uuid=order_uuid, customer=request.user)
             elif request.user.role == 'vendor':
                 # Vendor can see orders containing their products
                 order = get_object_or_404(
-                    Order.objects.filter(items__vendor=request.user).distinct(),
+                    orders.filter(id__in=OrderItem.objects.filter(vendor=request.user).values('order_id')),
                     uuid=order_uuid
                 )
             else:
@@ -100,30 +181,82 @@ class OrderDetailView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+class AsyncOrderDetailView(AsyncAPIView):
+    """OrderDetailView for the ASGI deployment"""
+    sync_view = OrderDetailView
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, order_uuid):
+        validators = await aorder_detail_validators(request, order_uuid)
+
+        async def build():
+            orders = Order.objects.with_totals().with_items()
+            if request.user.role == 'customer':
+                orders = orders.filter(uuid=order_uuid, customer=request.user)
+            elif request.user.role == 'vendor':
+                orders = orders.filter(
+                    id__in=OrderItem.objects.filter(vendor=request.user).values('order_id'), uuid=order_uuid
+                )
+            else:
+                return self.render({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+            try:
+                order = await orders.aget()
+                return self.render(OrderSerializer(order).data)
+            except Exception:
+                return self.render({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return await self.conditional(
+            request, build, etag=order_etag(order_uuid, validators), last_modified=validators['order_updated']
+        )
+
+# Item statuses whose goods are still with the vendor
+RESTOCKABLE_ITEM_STATUSES = ('PENDING', 'PAID', 'PROCESSING')
+
 class CancelOrderView(APIView):
     """Customer can cancel their order if eligible"""
     permission_classes = [IsCustomer]
 
     def post(self, request, order_uuid):
         try:
-            order = get_object_or_404(Order, uuid=order_uuid, customer=request.user)
-            
-            if not order.can_be_cancelled:
-                return Response(
-                    {'error': f'Order cannot be cancelled. Current status: {order.status}'}, 
-                    status=status.HTTP_400_BAD_REQUEST
+            with transaction.atomic():
+                # Lock the order so a concurrent cancel can't restock twice
+                order = get_object_or_404(
+                    Order.objects.select_for_update(), uuid=order_uuid, customer=request.user
                 )
+                
+                if not order.can_be_cancelled:
+                    return Response(
+                        {'error': f'Order cannot be cancelled. Current status: {order.status}'}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                reason = request.data.get('reason', '')
+
+                # Items not already cancelled move to the CANCELLED bucket of
+                # the vendor rollup. Only those whose stock the checkout took
+                # and that haven't left the vendor go back on the shelf.
+                cancelled_items = list(
+                    order.items.exclude(status='CANCELLED').values('product_id', *STATUS_CHANGE_FIELDS)
+                )
+                restock = []
+                if stock_was_taken(order.checkout_request_id):
+                    restock = [
+                        (item['product_id'], item['quantity'])
+                        for item in cancelled_items
+                        if item['product_id'] and item['status'] in RESTOCKABLE_ITEM_STATUSES
+                    ]
+                
+                # Update order and all items
+                order.status = 'CANCELLED'
+                order.notes = f"Cancelled by customer. Reason: {reason}"
+                order.save()
+                
+                # Cancel all order items
+                order.items.update(status='CANCELLED')
+                return_stock(restock)
+                record_status_change(cancelled_items, 'CANCELLED')
             
-            reason = request.data.get('reason', '')
-            
-            # Update order and all items
-            order.status = 'CANCELLED'
-            order.notes = f"Cancelled by customer. Reason: {reason}"
-            order.save()
-            
-            # Cancel all order items
-            order.items.update(status='CANCELLED')
-            
+            order = Order.objects.with_totals().with_items().get(pk=order.pk)
             return Response({
                 'message': 'Order cancelled successfully',
                 'order': OrderSerializer(order).data
@@ -142,7 +275,7 @@ class VendorOrderItemsView(APIView):
 
     def get(self, request):
         try:
-            order_items = OrderItem.objects.filter(vendor=request.user).select_related('order', 'product')
+            order_items = OrderItem.objects.filter(vendor=request.user).select_related('order', 'product', 'vendor')
             
             # Filter by status
             status_filter = request.query_params.get('status')
@@ -155,19 +288,29 @@ class VendorOrderItemsView(APIView):
             
             serializer = OrderItemSerializer(paginated_items, many=True)
             
-            # Summary stats
-            total_items = order_items.count()
-            revenue = order_items.aggregate(total=Sum('subtotal'))['total'] or 0
+            # Summary stats come from the VendorSalesSummary rollup, not from
+            # rescanning every OrderItem the vendor ever sold
+            rollup = VendorSalesSummary.objects.filter(vendor=request.user)
+            if status_filter:
+                rollup = rollup.filter(status=status_filter)
+            summary = rollup.aggregate(
+                total_items=Sum('item_count'),
+                total_revenue=Sum('revenue'),
+                pending_items=Sum('item_count', filter=Q(status='PAID')),
+                processing_items=Sum('item_count', filter=Q(status='PROCESSING')),
+                shipped_items=Sum('item_count', filter=Q(status='SHIPPED')),
+                delivered_items=Sum('item_count', filter=Q(status='DELIVERED')),
+            )
             
             response_data = {
                 'order_items': serializer.data,
                 'summary': {
-                    'total_items': total_items,
-                    'total_revenue': float(revenue),
-                    'pending_items': order_items.filter(status='PAID').count(),
-                    'processing_items': order_items.filter(status='PROCESSING').count(),
-                    'shipped_items': order_items.filter(status='SHIPPED').count(),
-                    'delivered_items': order_items.filter(status='DELIVERED').count(),
+                    'total_items': summary['total_items'] or 0,
+                    'total_revenue': float(summary['total_revenue'] or 0),
+                    'pending_items': summary['pending_items'] or 0,
+                    'processing_items': summary['processing_items'] or 0,
+                    'shipped_items': summary['shipped_items'] or 0,
+                    'delivered_items': summary['delivered_items'] or 0,
                 }
             }
             
@@ -179,6 +322,22 @@ class VendorOrderItemsView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+VENDOR_ITEM_STATUSES = ['PROCESSING', 'SHIPPED', 'DELIVERED', 'CANCELLED']
+
+def validate_item_status(new_status):
+    """Error response for a status a vendor can't set, or None if it's fine"""
+    if not new_status:
+        return Response(
+            {'error': 'Status is required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if new_status not in VENDOR_ITEM_STATUSES:
+        return Response(
+            {'error': f'Invalid status. Must be one of: {VENDOR_ITEM_STATUSES}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return None
+
 class UpdateOrderItemStatusView(APIView):
     """Vendor updates order item status"""
     permission_classes = [IsVendor]
@@ -188,44 +347,28 @@ class UpdateOrderItemStatusView(APIView):
             order_item = get_object_or_404(OrderItem, id=item_id, vendor=request.user)
             new_status = request.data.get('status')
             
-            if not new_status:
-                return Response(
-                    {'error': 'Status is required'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
             # Validate status transition
-            valid_statuses = ['PROCESSING', 'SHIPPED', 'DELIVERED', 'CANCELLED']
-            if new_status not in valid_statuses:
-                return Response(
-                    {'error': f'Invalid status. Must be one of: {valid_statuses}'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Update item status
-            order_item.status = new_status
-            order_item.save()
-            
-            # Update order status based on all items
-            order = order_item.order
-            all_items = order.items.all()
-            
-            # Logic to update overall order status
-            if all(item.status == 'DELIVERED' for item in all_items):
-                order.status = 'DELIVERED'
-            elif all(item.status == 'CANCELLED' for item in all_items):
-                order.status = 'CANCELLED'
-            elif any(item.status == 'SHIPPED' for item in all_items):
-                order.status = 'SHIPPED'
-            elif any(item.status == 'PROCESSING' for item in all_items):
-                order.status = 'PROCESSING'
+            error = validate_item_status(new_status)
+            if error:
+                return error
             
-            order.save()
+            with transaction.atomic():
+                # Lock the parent order first so updates to sibling items,
+                # possibly by other vendors, are applied one at a time
+                order = Order.objects.select_for_update().get(pk=order_item.order_id)
+
+                previous = list(OrderItem.objects.filter(pk=order_item.pk).values(*STATUS_CHANGE_FIELDS))
+                order_item.status = new_status
+                order_item.save(update_fields=['status'])
+                record_status_change(previous, new_status)
+
+                # Overall order status from one aggregate over its items
+                order_status = sync_order_statuses([order.pk]).get(order.pk, order.status)
             
             return Response({
                 'message': f'Order item status updated to {new_status}',
                 'order_item': OrderItemSerializer(order_item).data,
-                'order_status': order.status
+                'order_status': order_status
             })
                 
         except Exception as e:
@@ -234,6 +377,187 @@ class UpdateOrderItemStatusView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BulkUpdateOrderItemStatusView(APIView):
+    """Vendor moves many of their order items to one status in a single transaction"""
+    permission_classes = [IsVendor]
+    max_items = 500
+
+    def patch(self, request):
+        item_ids = request.data.get('item_ids')
+        new_status = request.data.get('status')
+
+        if not isinstance(item_ids, list) or not item_ids:
+            return Response(
+                {'error': 'item_ids must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(item_ids) > self.max_items:
+            return Response(
+                {'error': f'At most {self.max_items} items can be updated at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            item_ids = {int(item_id) for item_id in item_ids}
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'item_ids must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        error = validate_item_status(new_status)
+        if error:
+            return error
+
+        try:
+            with transaction.atomic():
+                owned = dict(
+                    OrderItem.objects.filter(id__in=item_ids, vendor=request.user)
+                    .order_by()
+                    .values_list('id', 'order_id')
+                )
+                missing = sorted(item_ids - owned.keys())
+                if missing:
+                    return Response(
+                        {'error': 'Order items not found', 'missing': missing},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+
+                # Lock the parent orders in id order so concurrent bulk
+                # updates can't deadlock on each other
+                locked = list(
+                    Order.objects.select_for_update()
+                    .filter(pk__in=set(owned.values()))
+                    .order_by('pk')
+                    .values_list('pk', 'uuid', 'status')
+                )
+                uuids = {order_id: order_uuid for order_id, order_uuid, _ in locked}
+                orders = {order_id: order_status for order_id, _, order_status in locked}
+
+                items = OrderItem.objects.filter(id__in=item_ids).order_by()
+                previous = list(items.values(*STATUS_CHANGE_FIELDS))
+                items.update(status=new_status)
+                record_status_change(previous, new_status)
+
+                orders.update(sync_order_statuses(list(orders)))
+
+            return Response({
+                'message': f'{len(item_ids)} order items updated to {new_status}',
+                'updated': len(item_ids),
+                'orders': [
+                    {'order_uuid': uuids[order_id], 'order_status': order_status}
+                    for order_id, order_status in sorted(orders.items())
+                ],
+            })
+
+        except Exception as e:
+            return Response(
+                {'error': 'Failed to update order items'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class VendorAnalyticsView(APIView):
+    """
+    Vendor revenue and units sold per product, bucketed by day, week or month.
+    Query params: interval (day|week|month), start / end (YYYY-MM-DD,
+    inclusive, default the last 30 days) and product (id).
+    """
+    permission_classes = [IsVendor]
+    INTERVALS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+    # Cancelled or refunded sales don't count towards revenue
+    EXCLUDED_STATUSES = ['CANCELLED', 'REFUNDED']
+    MAX_RANGE_DAYS = 731
+
+    def parse_params(self, request):
+        interval = request.query_params.get('interval', 'day')
+        if interval not in self.INTERVALS:
+            raise ValueError(f'Invalid interval. Must be one of: {list(self.INTERVALS)}')
+
+        try:
+            end = request.query_params.get('end')
+            end = datetime.strptime(end, '%Y-%m-%d').date() if end else timezone.localdate()
+            start = request.query_params.get('start')
+            start = datetime.strptime(start, '%Y-%m-%d').date() if start else end - timedelta(days=29)
+        except ValueError:
+            raise ValueError('Dates must be in YYYY-MM-DD format')
+        if start > end:
+            raise ValueError('start must not be after end')
+        if (end - start).days > self.MAX_RANGE_DAYS:
+            raise ValueError(f'Date range cannot exceed {self.MAX_RANGE_DAYS} days')
+
+        product = request.query_params.get('product')
+        if product and not product.isdigit():
+            raise ValueError('product must be a product id')
+        return interval, start, end, int(product) if product else None
+
+    def build_series(self, vendor, interval, start, end, product_id):
+        # Range scan on the (vendor, created_at) index, grouped in the database
+        items = OrderItem.objects.filter(
+            vendor=vendor,
+            created_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+            created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+        ).exclude(status__in=self.EXCLUDED_STATUSES)
+        if product_id:
+            items = items.filter(product_id=product_id)
+
+        rows = (
+            items.annotate(period=self.INTERVALS[interval]('created_at', output_field=DateField()))
+            .order_by()
+            .values('product_id', 'period')
+            .annotate(
+                product_name=Max('product_name'),
+                units=Sum('quantity'),
+                revenue=Sum('subtotal'),
+                orders=Count('order_id', distinct=True),
+            )
+            .order_by('product_id', 'period')
+        )
+
+        series = {}
+        total_units = 0
+        total_revenue = 0
+        for row in rows:
+            entry = series.setdefault(row['product_id'], {
+                'product_id': row['product_id'],
+                'product_name': row['product_name'],
+                'units': 0,
+                'revenue': 0,
+                'points': [],
+            })
+            entry['units'] += row['units']
+            entry['revenue'] += row['revenue']
+            entry['points'].append({
+                'period': row['period'].isoformat(),
+                'units': row['units'],
+                'revenue': str(row['revenue']),
+                'orders': row['orders'],
+            })
+            total_units += row['units']
+            total_revenue += row['revenue']
+
+        for entry in series.values():
+            entry['revenue'] = str(entry['revenue'])
+
+        return {
+            'interval': interval,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'totals': {'units': total_units, 'revenue': str(total_revenue)},
+            'series': list(series.values()),
+        }
+
+    def get(self, request):
+        try:
+            interval, start, end, product_id = self.parse_params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Cached per vendor; new order items and status changes bump the version
+        key = vendor_analytics_key(request.user.id, (interval, start, end, product_id))
+        data = cache.get(key)
+        if data is None:
+            data = self.build_series(request.user, interval, start, end, product_id)
+            cache.set(key, data, timeout=settings.VENDOR_ANALYTICS_CACHE_TIMEOUT)
+        return Response(data)
+
 class OrderStatusChoicesView(APIView):
     """Get available order status choices"""
     permission_classes = [permissions.IsAuthenticated]
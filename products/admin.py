@@ -2,8 +2,8 @@ from django.contrib import admin
 from .models import Products, Category
 
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('title', 'description', 'price', 'stock', 'category', 'vendor')
-    search_fields = ('title', 'description', 'category__name')
+    list_display = ('title', 'sku', 'description', 'price', 'stock', 'category', 'vendor')
+    search_fields = ('title', 'sku', 'description', 'category__name')
     list_filter = ('category', 'vendor')
     list_per_page = 20
 
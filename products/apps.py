@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Register catalog cache invalidation signals
+        from . import signals  # noqa: F401
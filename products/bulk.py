@@ -0,0 +1,210 @@
+# products/bulk.py - Bulk product import/export for vendors
+import csv
+import io
+import json
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+from .models import Category, Products
+from .serializers import ProductImportSerializer
+from .cache import bump_catalog_version
+from .search import update_search_vectors
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ('id', 'sku', 'title', 'description', 'price', 'stock', 'category')
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    """The upload can't be read as the requested format"""
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, file_format):
+    """
+    Yield (row_number, dict) from a binary stream of CSV (with a header row)
+    or JSON lines, one row at a time so the upload is never held in memory.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or 'sku' not in reader.fieldnames:
+            raise ImportFormatError("CSV header must include a 'sku' column")
+        # Row numbers match the file, counting the header as line 1
+        for number, row in enumerate(reader, start=2):
+            yield number, row
+    elif file_format == 'jsonl':
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row
+    else:
+        raise ImportFormatError(f"Unknown format. Must be one of: {list(IMPORT_FORMATS)}")
+
+
+class ProductImporter:
+    """
+    Create or update a vendor's products from rows keyed by SKU. Rows are
+    validated with the serializer rules a chunk at a time, categories are
+    resolved with one lookup per chunk, and each chunk is written with a
+    single INSERT ... ON CONFLICT (vendor, sku) DO UPDATE.
+    """
+    update_fields = ['title', 'description', 'price', 'stock', 'category', 'updated_at']
+
+    def __init__(self, vendor, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.vendor = vendor
+        self.chunk_size = chunk_size
+        self.categories = {}
+        self.seen_skus = {}
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        # One instance for every row, so the fields are only built once
+        self.serializer = ProductImportSerializer()
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def run(self, rows):
+        chunk = []
+        for row_number, row in rows:
+            self.rows += 1
+            chunk.append((row_number, row))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        if self.created or self.updated:
+            # bulk_create doesn't send post_save, so invalidate the catalog here
+            transaction.on_commit(bump_catalog_version)
+        return self.report()
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.error_count,
+            'errors': self.errors,
+        }
+
+    def validate_chunk(self, chunk):
+        """Valid rows as (row_number, data); invalid ones are recorded as errors"""
+        valid = []
+        for row_number, row in chunk:
+            if not isinstance(row, dict):
+                self.add_error(row_number, {'non_field_errors': ['Row must be a JSON object']})
+                continue
+            try:
+                data = self.serializer.run_validation(row)
+            except ValidationError as exc:
+                self.add_error(row_number, as_serializer_error(exc))
+                continue
+            first_seen = self.seen_skus.setdefault(data['sku'], row_number)
+            if first_seen != row_number:
+                self.add_error(row_number, {'sku': [f"Duplicate SKU, already imported from row {first_seen}"]})
+                continue
+            valid.append((row_number, data))
+        return valid
+
+    def resolve_categories(self, names):
+        """Map category names to ids, creating missing ones, in a fixed number of queries"""
+        missing = {name for name in names if name not in self.categories}
+        if not missing:
+            return
+        self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        new = missing - self.categories.keys()
+        if new:
+            Category.objects.bulk_create(
+                [Category(name=name, description='') for name in sorted(new)],
+                ignore_conflicts=True,
+            )
+            self.categories.update(Category.objects.filter(name__in=new).values_list('name', 'id'))
+
+    def import_chunk(self, chunk):
+        valid = self.validate_chunk(chunk)
+        if not valid:
+            return
+
+        with transaction.atomic():
+            self.resolve_categories({data['category'] for _, data in valid if data.get('category')})
+            skus = [data['sku'] for _, data in valid]
+            existing = set(
+                Products.objects.filter(vendor=self.vendor, sku__in=skus).values_list('sku', flat=True)
+            )
+            now = timezone.now()
+            products = [
+                Products(
+                    vendor=self.vendor,
+                    sku=data['sku'],
+                    title=data['title'],
+                    description=data['description'],
+                    price=data['price'],
+                    stock=data['stock'],
+                    category_id=self.categories.get(data.get('category')),
+                    updated_at=now,
+                )
+                for _, data in valid
+            ]
+            Products.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['vendor', 'sku'],
+                update_fields=self.update_fields,
+            )
+            update_search_vectors(Products.objects.filter(vendor=self.vendor, sku__in=skus))
+
+        self.updated += len(existing)
+        self.created += len(products) - len(existing)
+
+
+def import_products(vendor, stream, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import a CSV / JSON lines stream for vendor and return the report"""
+    return ProductImporter(vendor, chunk_size=chunk_size).run(read_rows(stream, file_format))
+
+
+def export_rows(queryset):
+    """Product rows in EXPORT_FIELDS order, streamed from a server-side cursor"""
+    columns = [field if field != 'category' else 'category__name' for field in EXPORT_FIELDS]
+    return queryset.order_by('id').values_list(*columns).iterator(chunk_size=2000)
+
+
+class _Echo:
+    """File-like object whose write() hands back the value, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+def export_products(queryset, file_format):
+    """Yield the products as CSV or JSON lines, one row at a time"""
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in export_rows(queryset):
+            yield writer.writerow(['' if value is None else value for value in row])
+    elif file_format == 'jsonl':
+        for row in export_rows(queryset):
+            record = dict(zip(EXPORT_FIELDS, row))
+            record['price'] = str(record['price'])
+            yield json.dumps(record) + '\n'
+    else:
+        raise ImportFormatError(f"Unknown format. Must be one of: {list(IMPORT_FORMATS)}")
@@ -0,0 +1,50 @@
+# products/cache.py - Versioned read-through cache for the public catalog
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from Agroshop.cache import aget_version, bump_version, get_version
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    """Current catalog version; every cached catalog payload is keyed by it"""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog page and product at once"""
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def catalog_list_key(request):
+    """Cache key for a catalog listing page (query string and host matter)"""
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'catalog:v{get_catalog_version()}:list:{digest}'
+
+
+def catalog_detail_key(pk):
+    return f'catalog:v{get_catalog_version()}:detail:{pk}'
+
+
+def get_or_set_payload(key, builder):
+    """Return the cached payload for key, building and storing it on a miss"""
+    payload = cache.get(key)
+    if payload is None:
+        payload = builder()
+        cache.set(key, payload, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return payload
+
+
+async def aget_catalog_version():
+    """get_catalog_version() for async views"""
+    return await aget_version(CATALOG_VERSION_KEY)
+
+
+async def acatalog_list_key(request):
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'catalog:v{await aget_catalog_version()}:list:{digest}'
+
+
+async def acatalog_detail_key(pk):
+    return f'catalog:v{await aget_catalog_version()}:detail:{pk}'
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from products.bulk import IMPORT_FORMATS, export_products
+from products.models import Products
+
+
+class Command(BaseCommand):
+    help = "Write a vendor's products (or the whole catalog) as CSV or JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, help='Only export this vendor id')
+        parser.add_argument('--file-format', choices=IMPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        products = Products.objects.all()
+        if options['vendor']:
+            products = products.filter(vendor_id=options['vendor'])
+
+        rows = export_products(products, options['file_format'])
+        if not options['output']:
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            output.writelines(rows)
@@ -0,0 +1,37 @@
+import json
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.bulk import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS, ImportFormatError, guess_format, import_products
+
+
+class Command(BaseCommand):
+    help = "Create or update a vendor's products from a CSV or JSON lines file, matched on SKU"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSON lines file')
+        parser.add_argument('--vendor', type=int, required=True, help='Vendor id owning the products')
+        parser.add_argument('--file-format', choices=IMPORT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--show-errors', action='store_true', help='Print the per-row errors')
+
+    def handle(self, *args, **options):
+        try:
+            vendor = get_user_model().objects.get(pk=options['vendor'], role='vendor')
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No vendor with id {options['vendor']}")
+
+        file_format = options['file_format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = import_products(vendor, stream, file_format, chunk_size=options['chunk_size'])
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        if options['show_errors']:
+            for error in report['errors']:
+                self.stdout.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        style = self.style.SUCCESS if not report['failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"Imported {report['rows']} row(s): {report['created']} created, "
+            f"{report['updated']} updated, {report['failed']} failed."
+        ))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_alter_products_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:29
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    # tsvector/GIN only exist on PostgreSQL; other backends fall back to icontains
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "UPDATE products_products SET search_vector = "
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS products_search_vector_gin "
+        "ON products_products USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS products_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_products_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['price', 'id'], name='products_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'price'], name='products_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['stock'], name='products_stock_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_search_and_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='products',
+            constraint=models.UniqueConstraint(fields=('vendor', 'sku'), name='unique_vendor_sku'),
+        ),
+    ]
@@ -2,6 +2,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from cloudinary.models import CloudinaryField  # ADD THIS LINE
+from django.contrib.postgres.search import SearchVectorField
+from .search import search_document, uses_full_text_search
 
 User = get_user_model()
 
@@ -26,6 +28,38 @@ class Products(models.Model):
     image = CloudinaryField('image', blank=True, null=True)  # Changed from ImageField
     
     vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products', limit_choices_to={'role': 'vendor'})
+    # Vendor's own stock-keeping code; the key for bulk imports (optional for older products)
+    sku = models.CharField(max_length=64, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Full-text document for catalog search. Maintained on PostgreSQL only (see
+    # products.search); its GIN index is created by migration 0007 on PostgreSQL.
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price', 'id'], name='products_price_id_idx'),
+            models.Index(fields=['category', 'price'], name='products_category_price_idx'),
+            models.Index(fields=['stock'], name='products_stock_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'sku'], name='unique_vendor_sku'),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        refresh_search = uses_full_text_search() and (
+            update_fields is None or {'title', 'description'} & set(update_fields)
+        )
+        if refresh_search:
+            # Written by this save's own statement rather than a follow-up UPDATE
+            self.search_vector = search_document(self.title, self.description)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_vector'}
+        super().save(*args, **kwargs)
+        if refresh_search:
+            # Drop the expression; the stored vector is loaded lazily if anything reads it
+            del self.search_vector
 
     def __str__(self):
         return self.title
\ No newline at end of file
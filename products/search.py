@@ -0,0 +1,40 @@
+# products/search.py - Full-text search with a portable fallback
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import connection
+from django.db.models import Q, Value
+
+SEARCH_CONFIG = 'english'
+
+
+def uses_full_text_search():
+    return connection.vendor == 'postgresql'
+
+
+def product_search_vector():
+    """Weighted document: titles rank above descriptions"""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def search_document(title, description):
+    """product_search_vector() built from values, so a save can write it in its own INSERT/UPDATE"""
+    return (
+        SearchVector(Value(title), weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Value(description), weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """Recompute search_vector for the given products (no-op outside PostgreSQL)"""
+    if uses_full_text_search():
+        queryset.update(search_vector=product_search_vector())
+
+
+def search_products(queryset, term):
+    """Filter products by a user search term"""
+    if uses_full_text_search():
+        return queryset.filter(search_vector=SearchQuery(term, search_type='websearch', config=SEARCH_CONFIG))
+    # SQLite and other backends (e.g. tests): plain substring match
+    return queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
@@ -15,11 +15,24 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Products
-        fields = ['id', 'title', 'description', 'price', 'stock', 'category', 'image']  # Keep same fields
+        fields = ['id', 'sku', 'title', 'description', 'price', 'stock', 'category', 'image']
         extra_kwargs = {
             'image': {'required': False, 'allow_null': True}
         }
 
+    def __init__(self, *args, **kwargs):
+        # Optional projection: ProductSerializer(..., fields=['id', 'title'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        self.requested_fields = set(fields) if fields else None
+        if self.requested_fields is not None:
+            for field_name in set(self.fields) - self.requested_fields:
+                self.fields.pop(field_name)
+
+    def wants(self, field_name):
+        """Check if a field is part of the requested projection"""
+        return self.requested_fields is None or field_name in self.requested_fields
+
     def validate_price(self, value):
         if value <= 0:
             raise serializers.ValidationError("The price should be a positive number")
@@ -30,6 +43,18 @@ class ProductSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("The stock should not be negative")
         return value
 
+    def validate_sku(self, value):
+        # Blank SKUs are stored as NULL so they don't collide with each other
+        value = (value or '').strip() or None
+        request = self.context.get('request')
+        if value and request is not None:
+            duplicates = Products.objects.filter(vendor=request.user, sku=value)
+            if self.instance is not None:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                raise serializers.ValidationError("You already have a product with this SKU")
+        return value
+
     def create(self, validated_data):
         category_name = validated_data.pop('category', None)
         category = None
@@ -43,12 +68,32 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['vendor'] = instance.vendor.id if instance.vendor else None
+        if self.wants('vendor'):
+            # vendor_id is already on the row - avoid loading the vendor per product
+            representation['vendor'] = instance.vendor_id
         
         # MODIFY THIS PART - make 'image' field return the Cloudinary URL
-        if instance.image:
-            representation['image'] = instance.image.url
-        else:
-            representation['image'] = None
+        if self.wants('image'):
+            if instance.image:
+                representation['image'] = instance.image.url
+            else:
+                representation['image'] = None
         
-        return representation
\ No newline at end of file
+        return representation
+
+class ProductImportSerializer(ProductSerializer):
+    """
+    One row of a bulk import. Same rules as ProductSerializer, but the SKU is
+    required since it identifies the product to create or update; existing
+    SKUs are updated rather than rejected.
+    """
+    sku = serializers.CharField(max_length=64)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['sku', 'title', 'description', 'price', 'stock', 'category']
+
+    def validate_sku(self, value):
+        value = value.strip()
+        if not value:
+            raise serializers.ValidationError("This field may not be blank.")
+        return value
@@ -0,0 +1,15 @@
+# products/signals.py - Keep the catalog cache in sync with writes
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Products, Category
+from .cache import bump_catalog_version
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    # Bump after commit so readers can't cache pre-commit rows under the new version
+    transaction.on_commit(bump_catalog_version)
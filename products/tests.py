@@ -1,3 +1,334 @@
+import io
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from users.models import CustomUser
+from .bulk import import_products
+from .cache import get_catalog_version
+from .search import search_products, uses_full_text_search
+from .models import Category, Products
 
-# Create your tests here.
+
+class PublicCatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.category = Category.objects.create(name='Seeds')
+        self.products = [
+            Products.objects.create(
+                title=f'Product {i}', description='Seeded', price=Decimal(10 + i % 7), stock=100,
+                category=self.category, vendor=self.vendor,
+            )
+            for i in range(30)
+        ]
+        self.client = APIClient()
+
+
+class PublicProductListTests(PublicCatalogTestCase):
+    def test_plain_list_by_default(self):
+        response = self.client.get('/products/public/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual([row['id'] for row in response.json()], [product.pk for product in self.products])
+
+    def test_plain_list_honours_ordering(self):
+        response = self.client.get('/products/public/?ordering=-price')
+        prices = [Decimal(row['price']) for row in response.json()]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+    def test_cursor_pages_when_requested(self):
+        seen = []
+        url = '/products/public/?page_size=7'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 7)
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [product.pk for product in self.products])
+
+    def test_facets_false_keeps_the_plain_list(self):
+        for value in ('false', '0', 'no', ''):
+            self.assertIsInstance(self.client.get(f'/products/public/?facets={value}').json(), list, value)
+        data = self.client.get('/products/public/?facets=TRUE').json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertIn('facets', data)
+
+    def test_invalid_ordering(self):
+        self.assertEqual(self.client.get('/products/public/?ordering=title').status_code, 400)
+
+
+class CatalogFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.other = CustomUser.objects.create_user('other@example.com', 'pass-12345', 'Otto', 'Vendor', role='vendor')
+        self.seeds = Category.objects.create(name='Seeds')
+        self.tools = Category.objects.create(name='Tools')
+        rows = [
+            # title, description, price, stock, category, vendor
+            ('Maize seed', 'Hybrid', 50, 10, self.seeds, self.vendor),
+            ('Bean seed', 'Climbing beans, good with maize', 150, 0, self.seeds, self.vendor),
+            ('Hoe', 'Forged steel', 700, 5, self.tools, self.vendor),
+            ('Sprayer', 'Knapsack', 2000, 3, self.tools, self.other),
+            ('Water tank', 'Holds 1000 litres', 6000, 1, None, self.other),
+        ]
+        self.products = {
+            title: Products.objects.create(
+                title=title, description=description, price=price, stock=stock, category=category, vendor=vendor,
+            )
+            for title, description, price, stock, category, vendor in rows
+        }
+        self.client = APIClient()
+
+    def titles(self, query):
+        response = self.client.get(f'/products/public/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [row['title'] for row in (data['results'] if isinstance(data, dict) else data)]
+
+    def test_search_matches_title_and_description(self):
+        self.assertEqual(self.titles('search=maize'), ['Maize seed', 'Bean seed'])
+        self.assertEqual(self.titles('search=HOE'), ['Hoe'])
+        self.assertEqual(self.titles('search=tractor'), [])
+        self.assertEqual(len(self.titles('search=%20')), 5)
+
+    def test_search_fallback_outside_postgres(self):
+        if uses_full_text_search():
+            self.skipTest('Runs the substring fallback used on other databases')
+        found = search_products(Products.objects.order_by('id'), 'SEED')
+        self.assertEqual([product.title for product in found], ['Maize seed', 'Bean seed'])
+        self.assertIn('LIKE', str(found.query))
+
+    def test_filters(self):
+        self.assertEqual(self.titles(f'category={self.tools.pk}'), ['Hoe', 'Sprayer'])
+        self.assertEqual(self.titles('category=seeds'), ['Maize seed', 'Bean seed'])
+        self.assertEqual(self.titles('min_price=150&max_price=2000'), ['Bean seed', 'Hoe', 'Sprayer'])
+        self.assertEqual(self.titles(f'vendor={self.other.pk}'), ['Sprayer', 'Water tank'])
+        self.assertEqual(self.titles('in_stock=true&category=seeds'), ['Maize seed'])
+        self.assertEqual(self.titles(f'vendor={self.vendor.pk}&max_price=700&search=seed'), ['Maize seed', 'Bean seed'])
+
+    def test_invalid_filters(self):
+        for query in ('min_price=cheap', 'max_price=1e', 'vendor=vera'):
+            self.assertEqual(self.client.get(f'/products/public/?{query}').status_code, 400, query)
+
+    def test_facets_cover_every_match_not_just_the_page(self):
+        data = self.client.get('/products/public/?page_size=1&facets=true').json()
+        self.assertEqual(len(data['results']), 1)
+        categories = {row['name']: row['count'] for row in data['facets']['categories']}
+        self.assertEqual(categories, {'Seeds': 2, 'Tools': 2, None: 1})
+        self.assertEqual(data['facets']['categories'][-1]['id'], None)
+        self.assertEqual(data['facets']['price_ranges'], [
+            {'min': None, 'max': '100', 'count': 1},
+            {'min': '100', 'max': '500', 'count': 1},
+            {'min': '500', 'max': '1000', 'count': 1},
+            {'min': '1000', 'max': '5000', 'count': 1},
+            {'min': '5000', 'max': None, 'count': 1},
+        ])
+
+    def test_facets_follow_the_filters(self):
+        data = self.client.get(f'/products/public/?facets=true&vendor={self.vendor.pk}&min_price=100').json()
+        self.assertEqual(
+            {row['name']: row['count'] for row in data['facets']['categories']}, {'Seeds': 1, 'Tools': 1}
+        )
+        self.assertEqual([row['count'] for row in data['facets']['price_ranges']], [0, 1, 1, 0, 0])
+
+    def test_field_projection(self):
+        rows = self.client.get('/products/public/?fields=id,title').json()
+        self.assertEqual(set(rows[0]), {'id', 'title'})
+        self.assertEqual(self.client.get('/products/public/?fields=id,secret').status_code, 400)
+
+
+class CatalogQueryCountTests(PublicCatalogTestCase):
+    """Product lists issue the same number of queries however many rows they return"""
+
+    def test_public_list(self):
+        for url in ('/products/public/', '/products/public/?page_size=2', '/products/public/?page_size=30'):
+            cache.clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_public_list_with_facets(self):
+        with self.assertNumQueries(2):
+            self.client.get('/products/public/?page_size=30&facets=true')
+
+    def test_public_list_from_cache(self):
+        self.client.get('/products/public/')
+        with self.assertNumQueries(0):
+            self.client.get('/products/public/')
+
+    def test_public_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/products/public/{self.products[0].pk}/')
+        self.assertEqual(response.json()['vendor'], self.vendor.pk)
+
+    def test_vendor_product_list(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.vendor).access_token}')
+        # The vendor's status (cached afterwards) and the products
+        with self.assertNumQueries(2):
+            response = client.get('/products/view/')
+        self.assertEqual(len(response.json()), 30)
+        with self.assertNumQueries(1):
+            client.get('/products/view/')
+
+
+class CatalogCacheInvalidationTests(PublicCatalogTestCase):
+    """Writes bump the catalog version once committed, so cached pages aren't served stale"""
+
+    def setUp(self):
+        super().setUp()
+        self.vendor_client = APIClient()
+        self.vendor_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.vendor).access_token}')
+        self.detail_url = f'/products/public/{self.products[0].pk}/'
+        # Warm the cache
+        self.client.get('/products/public/')
+        self.client.get(self.detail_url)
+
+    def test_category_edit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Grains'
+            self.category.save()
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual({row['category'] for row in self.client.get('/products/public/').json()}, {'Grains'})
+        self.assertEqual(self.client.get(self.detail_url).json()['category'], 'Grains')
+
+    def test_vendor_product_edit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.vendor_client.patch(f'/products/{self.products[0].pk}/', {'price': '99.00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(self.client.get(self.detail_url).json()['price'], '99.00')
+        self.assertEqual(self.client.get('/products/public/').json()[0]['price'], '99.00')
+
+    def test_product_moved_to_another_vendor(self):
+        other = CustomUser.objects.create_user('other@example.com', 'pass-12345', 'Otto', 'Vendor', role='vendor')
+        self.client.get(f'/products/public/?vendor={other.pk}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].vendor = other
+            self.products[0].save()
+        self.assertEqual(self.client.get(self.detail_url).json()['vendor'], other.pk)
+        response = self.client.get(f'/products/public/?vendor={other.pk}')
+        self.assertEqual([row['id'] for row in response.json()], [self.products[0].pk])
+
+    def test_detail_revalidation(self):
+        response = self.client.get(self.detail_url)
+        etag = response['ETag']
+        # The validator comes from the catalog version alone
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(revalidated.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor_client.patch(f'/products/{self.products[0].pk}/', {'stock': 1})
+        response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stock'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_version_waits_for_commit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Category.objects.filter(pk=self.category.pk).get().save()
+            self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(len(callbacks), 1)
+
+
+def csv_upload(*lines, name='products.csv'):
+    content = '\n'.join(('sku,title,description,price,stock,category',) + lines) + '\n'
+    return SimpleUploadedFile(name, content.encode(), content_type='text/csv')
+
+
+class ProductBulkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user('vendor@example.com', 'pass-12345', 'Vera', 'Vendor', role='vendor')
+        self.other = CustomUser.objects.create_user('other@example.com', 'pass-12345', 'Otto', 'Vendor', role='vendor')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.vendor).access_token}')
+
+    def upload(self, upload, **data):
+        return self.client.post('/products/import/', {'file': upload, **data}, format='multipart')
+
+    def test_creates_then_updates_by_sku(self):
+        response = self.upload(csv_upload('A-1,Maize,Seed,10.00,5,Seeds', 'A-2,Beans,Seed,12.50,7,Seeds'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.json()[key] for key in ('rows', 'created', 'updated', 'failed')},
+            {'rows': 2, 'created': 2, 'updated': 0, 'failed': 0},
+        )
+        response = self.upload(csv_upload('A-2,Beans,Seed,14.00,3,Tools', 'A-3,Peas,Seed,9.00,1,'))
+        self.assertEqual((response.json()['created'], response.json()['updated']), (1, 1))
+
+        beans = Products.objects.get(vendor=self.vendor, sku='A-2')
+        self.assertEqual((beans.price, beans.stock, beans.category.name), (Decimal('14.00'), 3, 'Tools'))
+        self.assertIsNone(Products.objects.get(sku='A-3').category)
+        self.assertEqual(Products.objects.filter(vendor=self.vendor).count(), 3)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        response = self.upload(csv_upload('A-1,Maize,Seed,10.00,5,', 'A-2,Beans,Seed,-3,7,', ',Peas,Seed,9.00,1,'))
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        # File line numbers, counting the header as line 1
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+        self.assertIn('price', report['errors'][0]['errors'])
+        self.assertIn('sku', report['errors'][1]['errors'])
+        self.assertEqual(list(Products.objects.values_list('sku', flat=True)), ['A-1'])
+
+    def test_duplicate_sku_in_a_later_chunk(self):
+        rows = io.BytesIO(b'sku,title,description,price,stock,category\n'
+                          b'A-1,Maize,Seed,10,5,\nA-2,Beans,Seed,10,5,\nA-1,Again,Seed,99,9,\n')
+        report = import_products(self.vendor, rows, 'csv', chunk_size=2)
+        self.assertEqual((report['created'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'][0]['row'], 4)
+        self.assertEqual(Products.objects.get(sku='A-1').title, 'Maize')
+
+    def test_other_vendors_products_are_untouched(self):
+        theirs = Products.objects.create(title='Theirs', description='Seeded', price=5, stock=1, vendor=self.other, sku='A-1')
+        report = self.upload(csv_upload('A-1,Mine,Seed,10.00,5,')).json()
+        self.assertEqual((report['created'], report['updated']), (1, 0))
+        theirs.refresh_from_db()
+        self.assertEqual((theirs.title, theirs.price), ('Theirs', 5))
+        self.assertEqual(Products.objects.get(vendor=self.vendor).title, 'Mine')
+
+    def test_jsonl_upload(self):
+        lines = [json.dumps({'sku': 'J-1', 'title': 'Maize', 'description': 'Seed', 'price': '10', 'stock': 5}), 'not json']
+        upload = SimpleUploadedFile('products.jsonl', '\n'.join(lines).encode())
+        report = self.upload(upload).json()
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['row'], 2)
+
+    def test_unreadable_upload(self):
+        self.assertEqual(self.upload(SimpleUploadedFile('products.csv', b'title,price\nMaize,10\n')).status_code, 400)
+        self.assertEqual(self.upload(csv_upload(), file_format='xml').status_code, 400)
+
+    def test_export_streams_own_products(self):
+        category = Category.objects.create(name='Seeds')
+        Products.objects.create(title='Maize', description='Seed', price=10, stock=5, vendor=self.vendor, sku='A-1',
+                                category=category)
+        Products.objects.create(title='Beans', description='Seed', price=12, stock=7, vendor=self.vendor)
+        Products.objects.create(title='Theirs', description='Seed', price=5, stock=1, vendor=self.other, sku='B-1')
+
+        response = self.client.get('/products/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,sku,title,description,price,stock,category')
+        self.assertEqual([line.split(',')[1:3] for line in lines[1:]], [['A-1', 'Maize'], ['', 'Beans']])
+        self.assertTrue(lines[1].endswith(',Seeds'))
+
+        response = self.client.get('/products/export/?file_format=jsonl')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['title'] for record in records], ['Maize', 'Beans'])
+        self.assertEqual(records[0]['price'], '10.00')
+
+    def test_export_round_trips_through_import(self):
+        Products.objects.create(title='Maize', description='Seed', price=10, stock=5, vendor=self.vendor, sku='A-1')
+        exported = b''.join(self.client.get('/products/export/').streaming_content)
+        report = self.upload(SimpleUploadedFile('products.csv', exported)).json()
+        self.assertEqual((report['created'], report['updated'], report['failed']), (0, 1, 0))
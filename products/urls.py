@@ -1,23 +1,28 @@
 # products/urls.py - Updated with public endpoints
 from django.urls import path
+from Agroshop.asyncviews import async_or_sync_view
 from .views import (
     ProductListView,
     ProductCreateView,
     ProductDetailView,
     CategoryListCreateView,
     CategoryDetailView,
-    PublicProductListView,  # NEW
-    PublicProductDetailView,  # NEW
+    AsyncPublicProductListView,
+    AsyncPublicProductDetailView,
+    ProductImportView,
+    ProductExportView,
     )
 
 urlpatterns = [
     # Public endpoints (no authentication required)
-    path('public/', PublicProductListView.as_view(), name='public-products-list'),
-    path('public/<int:pk>/', PublicProductDetailView.as_view(), name='public-product-detail'),
+    path('public/', async_or_sync_view(AsyncPublicProductListView), name='public-products-list'),
+    path('public/<int:pk>/', async_or_sync_view(AsyncPublicProductDetailView), name='public-product-detail'),
     
     # Vendor endpoints (authentication required)
     path('view/', ProductListView.as_view(), name='products-List'),
     path('create/', ProductCreateView.as_view(), name='create_product'),
+    path('import/', ProductImportView.as_view(), name='import-products'),
+    path('export/', ProductExportView.as_view(), name='export-products'),
     path('<int:pk>/', ProductDetailView.as_view(), name='product-details'),
     path('categories/', CategoryListCreateView.as_view(), name='categories-list'),
     path('categories/<int:pk>/', CategoryDetailView.as_view(), name='Category-details'),
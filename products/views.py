@@ -2,11 +2,27 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.http import Http404
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from users.authentication import ClaimsJWTAuthentication
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
+from django.db.models import Count, Q
+from decimal import Decimal, InvalidOperation
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 import logging
 from .models import Category, Products
 from .serializers import CategorySerializer, ProductSerializer
+from .search import search_products
+from .bulk import IMPORT_FORMATS, ImportFormatError, guess_format, import_products, export_products
+from .cache import (
+    catalog_list_key, catalog_detail_key, get_or_set_payload, get_catalog_version,
+    acatalog_list_key, acatalog_detail_key, aget_catalog_version,
+)
+from Agroshop.asyncviews import AsyncAPIView
 
 logger = logging.getLogger(__name__)
 
@@ -25,46 +41,355 @@ class IsVendor(permissions.BasePermission):
             return False
         return obj.vendor == request.user
 
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the public catalog. Pages are fetched with
+    `WHERE (price, id) > cursor` style lookups instead of OFFSET, so the
+    cost of a page does not grow with the size of the catalog.
+
+    Opt-in: only requests passing ?cursor=, ?page_size= or ?facets=true get
+    the {next, previous, results} envelope; others get the plain list as before.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+    ordering_query_param = 'ordering'
+    opt_in_params = ('cursor', 'page_size')
+
+    # Only stable orderings are allowed; 'id' breaks ties on price
+    ordering_options = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        requested = request.query_params.get(self.ordering_query_param)
+        if requested is None:
+            return self.ordering
+        if requested not in self.ordering_options:
+            raise ValidationError({
+                self.ordering_query_param: f"Must be one of: {list(self.ordering_options)}"
+            })
+        return self.ordering_options[requested]
+
+    def opted_in(self, request):
+        params = request.query_params
+        return (
+            any(param in params for param in self.opt_in_params)
+            or params.get('facets', '').lower() in ('1', 'true', 'yes')
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.opted_in(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
 # NEW: Public product list view for customers
 class PublicProductListView(generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]  # Allow anyone to view products
-    queryset = Products.objects.all()
+    pagination_class = ProductCursorPagination
+    queryset = Products.objects.select_related('category')
+
+    # Model columns backing each serializer field, used for ?fields= projections
+    projection_columns = {
+        'id': ['id'],
+        'sku': ['sku'],
+        'title': ['title'],
+        'description': ['description'],
+        'price': ['price'],
+        'stock': ['stock'],
+        'category': ['category', 'category__name'],
+        'image': ['image'],
+        'vendor': ['vendor'],
+    }
+
+    # Price facet buckets as (min inclusive, max exclusive); None is unbounded
+    price_buckets = [
+        (None, Decimal('100')),
+        (Decimal('100'), Decimal('500')),
+        (Decimal('500'), Decimal('1000')),
+        (Decimal('1000'), Decimal('5000')),
+        (Decimal('5000'), None),
+    ]
+
+    def get_requested_fields(self):
+        """Parse ?fields=id,title,price into a list of serializer fields"""
+        raw = self.request.query_params.get('fields')
+        if not raw:
+            return None
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.projection_columns]
+        if unknown:
+            raise ValidationError({
+                'fields': f"Unknown fields: {unknown}. Must be any of: {list(self.projection_columns)}"
+            })
+        return fields or None
+
+    def _decimal_param(self, name):
+        value = self.request.query_params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: 'Must be a number'})
+
+    def apply_filters(self, queryset):
+        """
+        Catalog filters: ?category= (id or name), ?min_price=, ?max_price=,
+        ?vendor= (id), ?in_stock=true and ?search= (title/description)
+        """
+        params = self.request.query_params
+
+        category = params.get('category')
+        if category:
+            if category.isdigit():
+                queryset = queryset.filter(category_id=category)
+            else:
+                queryset = queryset.filter(category__name__iexact=category)
+
+        min_price = self._decimal_param('min_price')
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        max_price = self._decimal_param('max_price')
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+
+        vendor = params.get('vendor')
+        if vendor:
+            if not vendor.isdigit():
+                raise ValidationError({'vendor': 'Must be a vendor id'})
+            queryset = queryset.filter(vendor_id=vendor)
+
+        if params.get('in_stock', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(stock__gt=0)
+
+        search = params.get('search', '').strip()
+        if search:
+            queryset = search_products(queryset, search)
+
+        return queryset
+
+    def get_facets(self, queryset):
+        """
+        Product counts per category and per price bucket, from one GROUP BY
+        category query carrying a conditional count for every bucket
+        """
+        bucket_counts = {}
+        for index, (low, high) in enumerate(self.price_buckets):
+            condition = Q()
+            if low is not None:
+                condition &= Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            bucket_counts[f'bucket_{index}'] = Count('id', filter=condition)
+
+        rows = list(
+            queryset.order_by()
+            .values('category_id', 'category__name')
+            .annotate(count=Count('id'), **bucket_counts)
+        )
+
+        categories = [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+            for row in sorted(rows, key=lambda row: -row['count'])
+        ]
+        price_ranges = [
+            {
+                'min': str(low) if low is not None else None,
+                'max': str(high) if high is not None else None,
+                'count': sum(row[f'bucket_{index}'] for row in rows),
+            }
+            for index, (low, high) in enumerate(self.price_buckets)
+        ]
+        return {'categories': categories, 'price_ranges': price_ranges}
+
+    def get_queryset(self):
+        queryset = self.apply_filters(super().get_queryset())
+        fields = self.get_requested_fields()
+        if fields:
+            # Always load the pagination keys so cursors can be built
+            columns = {'id', 'price'}
+            for name in fields:
+                columns.update(self.projection_columns[name])
+            if 'category' not in fields:
+                # A deferred FK can't be traversed by select_related
+                queryset = queryset.select_related(None)
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        # Plain lists honour ?ordering= too; the paginator re-applies it for pages
+        return queryset.order_by(*self.paginator.get_ordering(self.request, queryset, self))
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def build_page(self, request, *args, **kwargs):
+        data = super().list(request, *args, **kwargs).data
+        if request.query_params.get('facets', '').lower() in ('1', 'true', 'yes'):
+            data['facets'] = self.get_facets(self.apply_filters(Products.objects.all()))
+        return data
+
+    def list(self, request, *args, **kwargs):
+        """Serve catalog pages from the versioned cache"""
+        data = get_or_set_payload(
+            catalog_list_key(request),
+            lambda: self.build_page(request, *args, **kwargs)
+        )
+        return Response(data)
 
 class ProductCreateView(generics.CreateAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsVendor]
     parser_classes = [MultiPartParser, FormParser]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def perform_create(self, serializer):
         logger.info(f"Creating product for user: {self.request.user}")
         serializer.save(vendor=self.request.user)
 
+class ProductImportView(generics.GenericAPIView):
+    """
+    Create or update many of the vendor's products from one CSV or JSON lines
+    upload, matched on SKU. Chunks are committed as they go, so rows before a
+    failure stay imported; invalid rows are skipped and reported.
+    """
+    permission_classes = [IsVendor]
+    parser_classes = [MultiPartParser]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {"error": "Upload a CSV or JSON lines file as 'file'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {"error": f"Unknown file_format. Must be one of: {list(IMPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        logger.info(f"Importing products from {upload.name} for user: {request.user}")
+        try:
+            report = import_products(request.user, upload.file, file_format)
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Product import failed for user {request.user}: {str(e)}")
+            return Response(
+                {"error": "Failed to import products"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        logger.info(
+            f"Imported products for user {request.user}: "
+            f"{report['created']} created, {report['updated']} updated, {report['failed']} failed"
+        )
+        return Response(report)
+
+class ProductExportView(generics.GenericAPIView):
+    """Stream the vendor's products as CSV (default) or JSON lines (?file_format=jsonl)"""
+    permission_classes = [IsVendor]
+    authentication_classes = [ClaimsJWTAuthentication]
+    content_types = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in self.content_types:
+            return Response(
+                {"error": f"Unknown file_format. Must be one of: {list(self.content_types)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        response = StreamingHttpResponse(
+            export_products(Products.objects.filter(vendor=request.user), file_format),
+            content_type=self.content_types[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
 class ProductListView(generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     
     def get_queryset(self):
         # Return only products belonging to the authenticated user (for vendors)
         logger.info(f"Fetching products for user: {self.request.user}")
-        return Products.objects.filter(vendor=self.request.user)
+        return Products.objects.filter(vendor=self.request.user).select_related('category')
+
+def public_product_etag(request, pk):
+    # Any catalog write bumps the version, so this needs no database query
+    return f"product-{pk}-v{get_catalog_version()}"
 
 # NEW: Public product detail view
 class PublicProductDetailView(generics.RetrieveAPIView):
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
-    queryset = Products.objects.all()
+    queryset = Products.objects.select_related('category')
+
+    @method_decorator(condition(etag_func=public_product_etag))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Serve product details from the versioned cache"""
+        data = get_or_set_payload(
+            catalog_detail_key(self.kwargs['pk']),
+            lambda: super(PublicProductDetailView, self).retrieve(request, *args, **kwargs).data
+        )
+        return Response(data)
+
+class AsyncPublicProductListView(AsyncAPIView):
+    """
+    PublicProductListView for the ASGI deployment. Cached pages are served
+    without leaving the event loop; on a miss the sync view builds the page
+    (cursor pagination, search, facets) on a worker thread and caches it.
+    """
+    sync_view = PublicProductListView
+
+    async def get(self, request):
+        data = await cache.aget(await acatalog_list_key(request))
+        if data is None:
+            return await sync_to_async(PublicProductListView.as_view())(request._request)
+        return self.render(data)
+
+class AsyncPublicProductDetailView(AsyncAPIView):
+    """PublicProductDetailView for the ASGI deployment"""
+    sync_view = PublicProductDetailView
+
+    async def get(self, request, pk):
+        async def build():
+            key = await acatalog_detail_key(pk)
+            data = await cache.aget(key)
+            if data is None:
+                try:
+                    product = await Products.objects.select_related('category').aget(pk=pk)
+                except Products.DoesNotExist:
+                    raise NotFound('No Products matches the given query.')
+                data = ProductSerializer(product, context={'request': request, 'view': self}).data
+                await cache.aset(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+            return self.render(data)
+
+        # Same validator as public_product_etag
+        etag = f"product-{pk}-v{await aget_catalog_version()}"
+        return await self.conditional(request, build, etag=etag)
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsVendor]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     
     def get_queryset(self):
         # Filter products by the current vendor
-        return Products.objects.filter(vendor=self.request.user)
+        return Products.objects.filter(vendor=self.request.user).select_related('category')
     
     def get_object(self):
         """
@@ -143,7 +468,7 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
     permission_classes = [IsVendor]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
 
     def list(self, request, *args, **kwargs):
         """Handle GET requests for listing categories"""
@@ -171,4 +496,4 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
     permission_classes = [IsVendor]
-    authentication_classes = [JWTAuthentication]
\ No newline at end of file
+    authentication_classes = [ClaimsJWTAuthentication]
\ No newline at end of file
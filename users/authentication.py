@@ -0,0 +1,168 @@
+# users/authentication.py - JWT authentication that doesn't load the user row on every request
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DEFERRED
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# What permission checks need; everything else on the user is loaded on first access
+STATUS_FIELDS = ('email', 'role', 'is_active', 'is_staff', 'is_superuser')
+
+
+def user_status_key(user_id):
+    return f'auth:user:{user_id}:status'
+
+
+def revoked_token_key(jti):
+    return f'auth:revoked:{jti}'
+
+
+def load_user_status(user_id):
+    """STATUS_FIELDS for user_id from the database, or None if there's no such user"""
+    User = get_user_model()
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*STATUS_FIELDS).first()
+
+
+def get_user_status(user_id):
+    """
+    Cached STATUS_FIELDS for user_id, or False if there's no such user.
+    Unknown users are cached too, so bad ids don't hit the database.
+    """
+    key = user_status_key(user_id)
+    status = cache.get(key)
+    if status is None:
+        status = load_user_status(user_id) or False
+        cache.set(key, status, timeout=settings.AUTH_USER_STATUS_CACHE_TIMEOUT)
+    return status
+
+
+async def aget_user_status(user_id):
+    """get_user_status() for async views"""
+    key = user_status_key(user_id)
+    status = await cache.aget(key)
+    if status is None:
+        User = get_user_model()
+        status = await (
+            User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*STATUS_FIELDS).afirst()
+        ) or False
+        await cache.aset(key, status, timeout=settings.AUTH_USER_STATUS_CACHE_TIMEOUT)
+    return status
+
+
+def invalidate_user_status(user_id):
+    cache.delete(user_status_key(user_id))
+
+
+def revoke_access_token(token):
+    """
+    Reject a still-valid access token from now on (e.g. on logout). Only
+    kept in the cache until the token would have expired anyway, so it
+    applies to every worker only with a shared cache (REDIS_URL).
+    """
+    jti = token.get(api_settings.JTI_CLAIM)
+    expires = token.get('exp')
+    if not jti or not expires:
+        return
+    remaining = int(expires - datetime.now(timezone.utc).timestamp())
+    if remaining > 0:
+        cache.set(revoked_token_key(jti), True, timeout=remaining)
+
+
+def build_user(user_id, status):
+    """
+    A user instance with only the id and STATUS_FIELDS loaded. It works as a
+    foreign key value and for role/staff checks; reading any other field
+    (name, password, ...) loads it from the database like a deferred field.
+    """
+    User = get_user_model()
+    loaded = {'id': user_id, **status}
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+    values = [loaded.get(field.attname, DEFERRED) for field in User._meta.concrete_fields]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, values)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that identifies the user from the token's claims and
+    checks them against a short-lived status cache (role, active and staff
+    flags), instead of fetching the whole user row on every request. Saving
+    or deleting a user drops their cache entry, so deactivation and role
+    changes apply on the next request; changes made with QuerySet.update()
+    apply within AUTH_USER_STATUS_CACHE_TIMEOUT. Access tokens revoked with
+    revoke_access_token() are rejected as well.
+
+    Invalidation and revocation go through the cache, so they reach every
+    worker process only when the cache is shared (Redis, REDIS_URL). With
+    the local-memory fallback each process has its own cache: other workers
+    pick up status changes when their entry expires, and don't see
+    revocations at all.
+    """
+
+    @staticmethod
+    def reads_database():
+        # Comparing password hashes / custom id fields needs the real row
+        return api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != 'id'
+
+    @staticmethod
+    def token_keys(validated_token):
+        """(user_id, status cache key, revoked token cache key) for a token"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        return (
+            user_id,
+            user_status_key(user_id),
+            revoked_token_key(validated_token.get(api_settings.JTI_CLAIM)),
+        )
+
+    @staticmethod
+    def check_user(user_id, status, revoked):
+        if revoked:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        if not status:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not status['is_active']:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return build_user(user_id, status)
+
+    def get_user(self, validated_token):
+        if self.reads_database():
+            return super().get_user(validated_token)
+
+        user_id, status_key, revoked_key = self.token_keys(validated_token)
+        cached = cache.get_many([status_key, revoked_key])
+        revoked = cached.get(revoked_key)
+        status = cached.get(status_key)
+        if status is None and not revoked:
+            status = get_user_status(user_id)
+        return self.check_user(user_id, status, revoked)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, given a plain HttpRequest"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if self.reads_database():
+            return await sync_to_async(super().get_user)(validated_token)
+
+        user_id, status_key, revoked_key = self.token_keys(validated_token)
+        cached = await cache.aget_many([status_key, revoked_key])
+        revoked = cached.get(revoked_key)
+        status = cached.get(status_key)
+        if status is None and not revoked:
+            status = await aget_user_status(user_id)
+        return self.check_user(user_id, status, revoked)
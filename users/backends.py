@@ -0,0 +1,37 @@
+# users/backends.py - Authentication backend that hashes through users.login.run_hash
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password, verify_password
+from .login import run_hash
+
+
+class BoundedHashModelBackend(ModelBackend):
+    """
+    ModelBackend whose password hashing goes through run_hash (bounded,
+    optionally on a thread pool) while the database work stays on the
+    request thread. Passwords hashed with an older hasher or older
+    parameters are rehashed with the preferred one on a successful login,
+    as ModelBackend does.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        User = get_user_model()
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway, so response time doesn't reveal which emails exist
+            run_hash(make_password, password)
+            return None
+
+        # must_update: made by an older hasher, or with older parameters
+        is_correct, must_update = run_hash(verify_password, password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = run_hash(make_password, password)
+            user.save(update_fields=['password'])
+        return user
@@ -0,0 +1,46 @@
+# users/hashers.py - Password hashers with cost parameters from settings
+import base64
+import hashlib
+from django.conf import settings
+from django.contrib.auth.hashers import ScryptPasswordHasher
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    ScryptPasswordHasher whose work factor, block size and parallelism come
+    from the PASSWORD_SCRYPT_* settings (pick them with
+    `manage.py benchmark_password_hashing`). Hashes made with other
+    parameters still verify, and must_update() has them rehashed on the
+    next successful login.
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            # scrypt needs 128 * n * r bytes; OpenSSL's default cap (32 MiB)
+            # rejects anything from n=2**15, r=8 up
+            maxmem=256 * n * r,
+            dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
@@ -0,0 +1,101 @@
+# users/login.py - Keep password hashing from starving the workers during login spikes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.throttling import BaseThrottle
+
+_executor = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again shortly.'
+    default_code = 'login_busy'
+
+
+def _hash_pool():
+    global _executor, _slots
+    with _pool_lock:
+        if _executor is None:
+            workers = settings.LOGIN_HASH_WORKERS
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            # Running plus queued hashes; more than that is turned away
+            _slots = threading.BoundedSemaphore(workers + settings.LOGIN_HASH_QUEUE)
+        return _executor, _slots
+
+
+def reset_hash_pool():
+    """Shut the pool down, so the next hash rebuilds it from current settings"""
+    global _executor, _slots
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = _slots = None
+
+
+def run_hash(func, *args):
+    """
+    Run a password hash function (hashlib releases the GIL while hashing).
+    With LOGIN_HASH_WORKERS set, it runs on a per-process pool of that many
+    threads, so at most that many cores hash at once however many requests
+    are logging in. Callers wait up to LOGIN_HASH_WAIT seconds for a place
+    in the queue, then get LoginBusy (503).
+    """
+    if not settings.LOGIN_HASH_WORKERS:
+        return func(*args)
+    executor, slots = _hash_pool()
+    if not slots.acquire(timeout=settings.LOGIN_HASH_WAIT):
+        raise LoginBusy()
+    try:
+        return executor.submit(func, *args).result()
+    finally:
+        slots.release()
+
+
+def _inflight_key(kind, value):
+    return f'login:inflight:{kind}:{value}'
+
+
+@contextmanager
+def login_slot(request, email):
+    """
+    Allow at most LOGIN_MAX_CONCURRENT_PER_IP logins in flight per client
+    IP and LOGIN_MAX_CONCURRENT_PER_EMAIL per account, counted in the
+    shared cache across workers. Extra attempts get 429 before any hashing
+    happens. Counters expire after LOGIN_INFLIGHT_TIMEOUT seconds in case
+    a worker dies mid-login. A limit of 0 disables that check.
+    """
+    limits = []
+    if settings.LOGIN_MAX_CONCURRENT_PER_IP:
+        # get_ident honours REST_FRAMEWORK['NUM_PROXIES'] like DRF's throttles
+        ip = BaseThrottle().get_ident(request)
+        limits.append((_inflight_key('ip', ip), settings.LOGIN_MAX_CONCURRENT_PER_IP))
+    if settings.LOGIN_MAX_CONCURRENT_PER_EMAIL and email:
+        limits.append((_inflight_key('email', str(email).strip().lower()), settings.LOGIN_MAX_CONCURRENT_PER_EMAIL))
+
+    acquired = []
+    try:
+        for key, limit in limits:
+            cache.add(key, 0, timeout=settings.LOGIN_INFLIGHT_TIMEOUT)
+            try:
+                count = cache.incr(key)
+            except ValueError:
+                # Expired between add() and incr()
+                cache.add(key, 1, timeout=settings.LOGIN_INFLIGHT_TIMEOUT)
+                count = 1
+            acquired.append(key)
+            if count > limit:
+                raise Throttled(detail='Too many concurrent login attempts.')
+        yield
+    finally:
+        for key in acquired:
+            try:
+                cache.decr(key)
+            except ValueError:
+                pass
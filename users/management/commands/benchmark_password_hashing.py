@@ -0,0 +1,114 @@
+import json
+import platform
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from Agroshop.benchmarks import benchmark_database, measure, percentiles, timed
+from users.hashers import TunedScryptPasswordHasher
+
+PASSWORD = 'bench-Pass-2931'
+EMAIL = 'bench-login@example.com'
+
+
+def parse_scrypt(value):
+    try:
+        n, r, p = (int(part) for part in value.split(','))
+    except ValueError:
+        raise CommandError(f"--scrypt takes N,r,p (e.g. 16384,8,1), got {value!r}")
+    return n, r, p
+
+
+def profile_hashers(profile):
+    """PASSWORD_HASHERS as settings builds them for profile"""
+    profiles = settings.PASSWORD_HASHER_PROFILES
+    return [profiles[profile]] + [hasher for name, hasher in profiles.items() if name != profile]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time password verification per hasher / parameter set (logins per second per "
+        "core) and the login endpoint with PBKDF2 versus the configured profile, as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Verifications per hasher')
+        parser.add_argument('--scrypt', action='append', default=[], metavar='N,r,p',
+                            help='Extra scrypt parameters to time (repeatable)')
+        parser.add_argument('--logins', type=int, default=20, help='Timed logins per profile (0 to skip)')
+        parser.add_argument('--output', help='Also write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        candidates = [('pbkdf2', PBKDF2PasswordHasher, {})]
+        scrypt_params = [(
+            settings.PASSWORD_SCRYPT_WORK_FACTOR, settings.PASSWORD_SCRYPT_BLOCK_SIZE,
+            settings.PASSWORD_SCRYPT_PARALLELISM,
+        )] + [parse_scrypt(value) for value in options['scrypt']]
+        for n, r, p in dict.fromkeys(scrypt_params):
+            candidates.append((f'scrypt N={n} r={r} p={p}', TunedScryptPasswordHasher, {
+                'PASSWORD_SCRYPT_WORK_FACTOR': n,
+                'PASSWORD_SCRYPT_BLOCK_SIZE': r,
+                'PASSWORD_SCRYPT_PARALLELISM': p,
+            }))
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            self.stderr.write("argon2-cffi isn't installed; skipping argon2")
+        else:
+            from django.contrib.auth.hashers import Argon2PasswordHasher
+            candidates.append(('argon2', Argon2PasswordHasher, {}))
+
+        hashers = {}
+        for name, hasher_class, overrides in candidates:
+            self.stderr.write(f"Timing {name}...")
+            with override_settings(**overrides):
+                hasher = hasher_class()
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+                result = percentiles(timed(lambda: hasher.verify(PASSWORD, encoded), options['runs']))
+            result['logins_per_sec_per_core'] = round(1000 / result['mean_ms'], 2)
+            if overrides:
+                result['memory_mib'] = 128 * overrides['PASSWORD_SCRYPT_WORK_FACTOR'] * \
+                    overrides['PASSWORD_SCRYPT_BLOCK_SIZE'] / 2 ** 20
+            hashers[name] = result
+
+        report = {
+            'config': {'runs': options['runs'], 'logins': options['logins'], 'profile': settings.PASSWORD_HASH_PROFILE},
+            'environment': {'python': platform.python_version(), 'machine': platform.machine()},
+            'hashers': hashers,
+        }
+        if options['logins']:
+            report['login_endpoint'] = self.bench_logins(options['logins'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        self.stdout.write(output)
+
+    def bench_logins(self, runs):
+        """POST /api/token/ with a PBKDF2 hash (before) and after rehashing to the profile"""
+        results = {}
+        with benchmark_database():
+            User = get_user_model()
+            client = APIClient()
+
+            def login(index):
+                return client.post('/api/token/', {'email': EMAIL, 'password': PASSWORD}, format='json')
+
+            with override_settings(PASSWORD_HASHERS=profile_hashers('pbkdf2')):
+                User.objects.create_user(EMAIL, PASSWORD, 'Bench', 'Login')
+                results['before_pbkdf2'] = measure(login, runs)
+
+            with override_settings(PASSWORD_HASHERS=profile_hashers(settings.PASSWORD_HASH_PROFILE)):
+                self.stderr.write(f"Rehashing to {get_hasher('default').algorithm} on first login...")
+                login(0)
+                assert User.objects.get(email=EMAIL).password.startswith(get_hasher('default').algorithm)
+                results[f'after_{settings.PASSWORD_HASH_PROFILE}'] = measure(login, runs)
+
+        for result in results.values():
+            result['logins_per_sec_per_core'] = round(1000 / result['mean_ms'], 2)
+        return results
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from users.tokens import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding refresh tokens and their blacklist entries in "
+        "small batches (a chunked alternative to flushexpiredtokens)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Token ids per delete transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep after each chunk that deleted rows')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        started = time.perf_counter()
+        deleted = prune_expired_tokens(chunk_size=options['chunk_size'], pause=options['pause'])
+        self.stdout.write(f"Deleted {deleted} expired token(s) in {time.perf_counter() - started:.1f}s")
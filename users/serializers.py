@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
+from .tokens import CachedRefreshToken
 
 User = get_user_model()
 
@@ -48,6 +49,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
     
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = CachedRefreshToken
 
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -112,7 +114,7 @@ class PasswordChangeSerializer(serializers.Serializer):
         return attrs
 
     def validate_old_password(self, value):
-        user = self.context['request'].user
+        user = self.context.get('user', self.context['request'].user)
         if not user.check_password(value):
             raise serializers.ValidationError("Old password is incorrect")
         return value        
\ No newline at end of file
@@ -0,0 +1,17 @@
+# users/signals.py - Drop cached auth status when a user changes
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .authentication import invalidate_user_status
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_status_on_change(sender, instance, **kwargs):
+    # Role, is_active and the staff flags are read from this cache on every
+    # request. Drop it again after commit, in case a request re-cached the
+    # old row meanwhile (delete() clears instance.pk, so keep a copy).
+    user_id = instance.pk
+    invalidate_user_status(user_id)
+    transaction.on_commit(lambda: invalidate_user_status(user_id))
@@ -1,3 +1,209 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import backends
+from .authentication import ClaimsJWTAuthentication, invalidate_user_status
+from .login import LoginBusy, login_slot, reset_hash_pool, run_hash
+from .models import CustomUser
+from .tokens import CachedRefreshToken, token_state_key
 
-# Create your tests here.
+
+def bearer_client(token):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+class RefreshTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_rotated_token_is_refused(self):
+        token = CachedRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_rotated_token_is_refused_by_a_worker_with_its_own_cache(self):
+        token = CachedRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        # Another process's local-memory cache never saw the blacklisting,
+        # and may hold what an older version cached for the token
+        cache.clear()
+        self.assertEqual(self.refresh(token).status_code, 401)
+        cache.set(token_state_key(token['jti']), 'active')
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(cache.get(token_state_key(token['jti'])), 'blacklisted')
+
+    def test_only_blacklisted_state_is_cached(self):
+        token = CachedRefreshToken.for_user(self.user)
+        self.assertIsNone(cache.get(token_state_key(token['jti'])))
+        token.check_blacklist()
+        self.assertIsNone(cache.get(token_state_key(token['jti'])))
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = bearer_client(self.refresh.access_token)
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        return ClaimsJWTAuthentication().authenticate(request)
+
+    def test_query_budget(self):
+        # One status lookup, then none while it's cached
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertEqual((user.pk, user.email, user.role), (self.user.pk, self.user.email, 'customer'))
+        # Other fields load on first access, like deferred fields
+        with self.assertNumQueries(1):
+            self.assertEqual(user.first_name, 'Cy')
+
+    def test_deactivated_user_is_refused(self):
+        self.assertEqual(self.client.get('/users/profile/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/users/profile/').status_code, 401)
+
+    def test_role_change_applies_on_next_request(self):
+        self.assertEqual(self.client.get('/products/categories/').status_code, 403)
+        self.user.role = 'vendor'
+        self.user.save()
+        self.assertEqual(self.client.get('/products/categories/').status_code, 200)
+
+    def test_queryset_update_applies_once_invalidated(self):
+        self.assertEqual(self.client.get('/users/profile/').status_code, 200)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        # update() sends no signal; the cached status is used until it's dropped
+        self.assertEqual(self.client.get('/users/profile/').status_code, 200)
+        invalidate_user_status(self.user.pk)
+        self.assertEqual(self.client.get('/users/profile/').status_code, 401)
+
+    def test_deleted_user_is_refused(self):
+        self.assertEqual(self.client.get('/users/profile/').status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.client.get('/users/profile/').status_code, 401)
+
+    def test_logout_revokes_access_token(self):
+        response = self.client.post('/users/logout/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 205)
+        response = self.client.get('/users/profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token has been revoked')
+        # A new login isn't affected
+        fresh = bearer_client(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(fresh.get('/users/profile/').status_code, 200)
+
+    def test_password_change(self):
+        data = {'old_password': 'wrong-pass', 'new_password': 'Fresh-pass-987', 'confirm_new_password': 'Fresh-pass-987'}
+        self.assertEqual(self.client.put('/users/changepassword/', data, format='json').status_code, 400)
+        data['old_password'] = 'pass-12345'
+        self.assertEqual(self.client.put('/users/changepassword/', data, format='json').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Fresh-pass-987'))
+        self.assertEqual(self.user.first_name, 'Cy')
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pass-12345', 'Cy', 'Customer')
+        self.client = APIClient()
+
+    def login(self, email='customer@example.com', password='pass-12345'):
+        return self.client.post('/api/token/', {'email': email, 'password': password}, format='json')
+
+    def test_rehash_when_scrypt_parameters_change(self):
+        self.assertIn('$8$1$', self.user.password)
+        with override_settings(PASSWORD_SCRYPT_PARALLELISM=2):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('scrypt$16384$'))
+            self.assertIn('$8$2$', self.user.password)
+        # Hashes with other parameters still verify
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_rehash_from_another_hasher(self):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            CustomUser.objects.filter(pk=self.user.pk).update(password=make_password('pass-12345'))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertEqual(self.login(password='wrong-pass').status_code, 401)
+
+    def test_unknown_user_costs_a_hash(self):
+        with mock.patch.object(backends, 'run_hash', wraps=run_hash) as hashed:
+            self.assertEqual(self.login(email='nobody@example.com').status_code, 401)
+            self.assertEqual([call.args[0] for call in hashed.call_args_list], [backends.make_password])
+            hashed.reset_mock()
+            self.assertEqual(self.login(password='wrong-pass').status_code, 401)
+            self.assertEqual([call.args[0] for call in hashed.call_args_list], [backends.verify_password])
+
+    @override_settings(LOGIN_HASH_WORKERS=1, LOGIN_HASH_QUEUE=0, LOGIN_HASH_WAIT=0.05)
+    def test_saturated_hash_pool(self):
+        reset_hash_pool()
+        self.addCleanup(reset_hash_pool)
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        holder = threading.Thread(target=run_hash, args=(hold,))
+        holder.start()
+        try:
+            started.wait(5)
+            with self.assertRaises(LoginBusy):
+                run_hash(len, 'password')
+            response = self.login()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()['detail'], LoginBusy.default_detail)
+        finally:
+            release.set()
+            holder.join()
+        self.assertEqual(run_hash(len, 'password'), 8)
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(LOGIN_MAX_CONCURRENT_PER_EMAIL=1)
+    def test_login_slot_limits_and_releases(self):
+        request = APIRequestFactory().post('/api/token/')
+        key = 'login:inflight:email:customer@example.com'
+        with login_slot(request, 'customer@example.com'):
+            with self.assertRaises(Throttled):
+                with login_slot(request, ' Customer@Example.com'):
+                    pass
+            self.assertEqual(cache.get(key), 1)
+            # Another login for the account meanwhile is refused before hashing
+            self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(cache.get(key), 0)
+
+        with self.assertRaises(RuntimeError):
+            with login_slot(request, 'customer@example.com'):
+                raise RuntimeError
+        self.assertEqual(cache.get(key), 0)
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(LOGIN_MAX_CONCURRENT_PER_IP=1, LOGIN_MAX_CONCURRENT_PER_EMAIL=0)
+    def test_login_slot_per_ip(self):
+        request = APIRequestFactory().post('/api/token/', REMOTE_ADDR='10.0.0.1')
+        with login_slot(request, 'customer@example.com'):
+            with self.assertRaises(Throttled):
+                with login_slot(request, 'other@example.com'):
+                    pass
+            with login_slot(APIRequestFactory().post('/api/token/', REMOTE_ADDR='10.0.0.2'), 'other@example.com'):
+                pass
+        self.assertEqual(cache.get('login:inflight:ip:10.0.0.1'), 0)
@@ -0,0 +1,153 @@
+# users/tokens.py - Refresh tokens whose blacklisted state is cached
+import time
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone as django_timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from rest_framework_simplejwt.views import TokenRefreshView
+from .authentication import get_user_status
+
+TOKEN_BLACKLISTED = 'blacklisted'
+
+
+def token_state_key(jti):
+    return f'auth:refresh:{jti}'
+
+
+def remaining_lifetime(exp):
+    """Seconds until the epoch timestamp exp, or 0 when it has passed"""
+    return max(int(exp - datetime.now(timezone.utc).timestamp()), 0)
+
+
+class CachedRefreshToken(RefreshToken):
+    """
+    RefreshToken that remembers blacklisted tokens in the cache until they
+    expire, so replays of rotated tokens are refused without querying the
+    token_blacklist tables (which grow by a row per refresh). Only that
+    terminal state is cached: a token not known to be blacklisted is
+    checked in the database, so a worker whose cache isn't shared with the
+    one that blacklisted it (the local-memory fallback) can't accept it.
+    Memory stays bounded: an entry lives no longer than its token.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        key = token_state_key(jti)
+        if cache.get(key) == TOKEN_BLACKLISTED:
+            raise TokenError("Token is blacklisted")
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            cache.set(key, TOKEN_BLACKLISTED, timeout=remaining_lifetime(self.payload['exp']) or 1)
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        """
+        Add this token to the outstanding list (if needed) and the blacklist.
+        Unlike the stock method this doesn't load the user and always
+        returns None.
+        """
+        jti = self.payload[api_settings.JTI_CLAIM]
+        exp = self.payload['exp']
+        with transaction.atomic():
+            token, _ = OutstandingToken.objects.get_or_create(
+                jti=jti,
+                defaults={
+                    'user_id': self.payload.get(api_settings.USER_ID_CLAIM),
+                    'created_at': self.current_time,
+                    'token': str(self),
+                    'expires_at': datetime_from_epoch(exp),
+                },
+            )
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token)], ignore_conflicts=True)
+
+        # Straight away rather than on commit: if the transaction rolls back,
+        # the worst case is one token rejected early, never one accepted late
+        timeout = remaining_lifetime(exp)
+        if timeout:
+            cache.set(token_state_key(jti), TOKEN_BLACKLISTED, timeout=timeout)
+
+    def outstand(self):
+        """Record a freshly issued token (new jti) as outstanding"""
+        return OutstandingToken.objects.create(
+            jti=self.payload[api_settings.JTI_CLAIM],
+            user_id=self.payload.get(api_settings.USER_ID_CLAIM),
+            created_at=self.current_time,
+            token=str(self),
+            expires_at=datetime_from_epoch(self.payload['exp']),
+        )
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer using CachedRefreshToken, with the account check
+    read from the same status cache as request authentication instead of
+    loading the user row.
+    """
+    token_class = CachedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id:
+            status = get_user_status(user_id)
+            if not status or not status['is_active']:
+                raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data['refresh'] = str(refresh)
+
+        return data
+
+
+class CachedTokenRefreshView(TokenRefreshView):
+    serializer_class = CachedTokenRefreshSerializer
+
+
+def prune_expired_tokens(chunk_size=1000, pause=0.0, before=None):
+    """
+    Delete outstanding tokens (and their blacklist rows) that expired
+    before `before`, walking the table by primary key range so each chunk
+    is a short transaction on an indexed range rather than one long
+    DELETE over millions of rows. Returns how many tokens were deleted.
+    """
+    before = before or django_timezone.now()
+    bounds = OutstandingToken.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+
+    deleted = 0
+    start = bounds['low']
+    while start <= bounds['high']:
+        end = start + chunk_size
+        with transaction.atomic():
+            ids = list(
+                OutstandingToken.objects
+                .filter(pk__gte=start, pk__lt=end, expires_at__lte=before)
+                .values_list('pk', flat=True)
+            )
+            if ids:
+                # Cascades to BlacklistedToken with a single DELETE ... WHERE token_id IN
+                OutstandingToken.objects.filter(pk__in=ids).only('pk').delete()
+        deleted += len(ids)
+        start = end
+        if ids and pause:
+            time.sleep(pause)
+    return deleted
@@ -4,8 +4,10 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
+from .authentication import revoke_access_token
+from .login import login_slot
+from .tokens import CachedRefreshToken
 from .serializers import UserRegistrationSerializer, UserProfileSerializer, CustomTokenObtainPairSerializer,PasswordChangeSerializer
 
 User = get_user_model()
@@ -32,7 +34,9 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        # Caps parallel password checks per IP / account before any hashing
+        with login_slot(request, request.data.get('email')):
+            serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         return Response(data, status=status.HTTP_200_OK)
 
@@ -44,8 +48,11 @@ class LogoutView(APIView):
             refresh_token = request.data.get("refresh")
             if not refresh_token:
                 return Response({"detail": "Refresh token is required"}, status=status.HTTP_400_BAD_REQUEST)
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()
+            if request.auth is not None:
+                # The access token would otherwise stay usable until it expires
+                revoke_access_token(request.auth)
             return Response({"detail": "Successfully logged out"}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -56,7 +63,8 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     parser_classes = [MultiPartParser, FormParser]
 
     def get_object(self):
-        return self.request.user
+        # request.user only has the auth fields loaded; fetch the whole row
+        return User.objects.get(pk=self.request.user.pk)
 
 class PasswordChangeView(generics.UpdateAPIView):
     """
@@ -66,17 +74,19 @@ class PasswordChangeView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user only has the auth fields loaded; fetch the whole row
+        return User.objects.get(pk=self.request.user.pk)
 
     def update(self, request, *args, **kwargs):
+        user = self.get_object()
         serializer = self.get_serializer(
             data=request.data,
-            context={'request': request}
+            context={'request': request, 'user': user}
         )
         serializer.is_valid(raise_exception=True)
         
-        self.request.user.set_password(serializer.validated_data['new_password'])
-        self.request.user.save()
+        user.set_password(serializer.validated_data['new_password'])
+        user.save()
         
         return Response(
             {"message": "Password changed successfully"},